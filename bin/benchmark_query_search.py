@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+"""
+Compares the old ILIKE based query search with the full text search, on a generated corpus of queries.
+
+The corpus is inserted into the configured database inside a transaction that gets rolled back, so nothing is left
+behind (but use a development database anyway).
+
+    python bin/benchmark_query_search.py [number of queries] [number of searches]
+"""
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from redash import models
+from redash.models import db
+from redash.utils.configuration import ConfigurationContainer
+
+WORDS = ['revenue', 'daily', 'weekly', 'users', 'signups', 'events', 'retention', 'country', 'campaign', 'errors',
+         'latency', 'orders', 'refunds', 'sessions', 'funnel', 'cohort', 'churn', 'traffic', 'mobile', 'desktop']
+TERMS = ['rev', 'daily users', 'cohort', 'country signups', 'latency', 'refunds weekly', 'zzz']
+
+
+def old_search(term, groups):
+    # Query.search before full text search.
+    where = (models.Query.name ** u"%{}%".format(term)) | (models.Query.description ** u"%{}%".format(term))
+    where &= models.Query.is_archived == False
+
+    query_ids = models.Query.select(models.peewee.fn.Distinct(models.Query.id)) \
+        .join(models.DataSourceGroup, on=(models.Query.data_source == models.DataSourceGroup.data_source)) \
+        .where(where) \
+        .where(models.DataSourceGroup.group << groups)
+
+    return models.Query.select(models.Query, models.User).join(models.User).where(models.Query.id << query_ids)
+
+
+def create_corpus(count):
+    org = models.Organization.create(name='Benchmark', slug='benchmark-{}'.format(random.randint(0, 10 ** 9)),
+                                     settings={})
+    group = models.Group.create(org=org, name='Benchmark')
+    user = models.User.create(org=org, name='Benchmark', email='benchmark@example.com', groups=[group.id])
+    data_source = models.DataSource.create(org=org, name='Benchmark', type='pg',
+                                           options=ConfigurationContainer({}))
+    models.DataSourceGroup.create(data_source=data_source, group=group)
+
+    # Names and descriptions are random picks from WORDS, generated server side to keep the insert fast.
+    pick = "(ARRAY[{}])[1 + floor(random() * {})::int]".format(', '.join("'{}'".format(w) for w in WORDS), len(WORDS))
+    db.database.execute_sql("""
+        INSERT INTO queries (org_id, data_source_id, user_id, name, description, query, query_hash, api_key,
+                             is_archived, is_draft, options, version, created_at, updated_at)
+        SELECT %s, %s, %s, {pick} || ' ' || {pick} || ' ' || i, {pick} || ' ' || {pick} || ' by ' || {pick},
+               'SELECT * FROM ' || {pick}, md5(i::text), md5(i::text), false, false, '{{}}', 1, now(), now()
+        FROM generate_series(1, %s) AS i
+    """.format(pick=pick), (org.id, data_source.id, user.id, count))
+    db.database.execute_sql("ANALYZE queries")
+
+    return [group.id]
+
+
+def benchmark(search, groups, repeat):
+    results = {}
+
+    def run():
+        for term in TERMS:
+            results[term] = len(list(search(term, groups)))
+
+    seconds = timeit.timeit(run, number=repeat)
+    return seconds / (repeat * len(TERMS)) * 1000, results
+
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+
+    db.connect_db()
+    with db.database.transaction() as transaction:
+        print "Generating {} queries...".format(count)
+        groups = create_corpus(count)
+
+        searches = (('ILIKE', old_search),
+                    ('Full text search', models.Query.search),
+                    ('Full text, no limit', lambda term, groups: models.Query.search(term, groups, limit=None)))
+        for name, search in searches:
+            ms, results = benchmark(search, groups, repeat)
+            print "{:<20} {:>8.1f} ms per search  (results: {})".format(name, ms, results)
+
+        transaction.rollback()
+    db.close_db(None)
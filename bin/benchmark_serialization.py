@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+"""
+Compares serializing query results with the JSONEncoder default hook (how query runners used to) against
+serialize_query_result with each of the available encoders, on results of typical shapes.
+
+    python bin/benchmark_serialization.py [number of rows] [number of repeats]
+"""
+import datetime
+import decimal
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from redash.utils import JSONEncoder
+from redash.utils.serialization import encoders, serialize_query_result
+
+START = datetime.datetime(2016, 1, 1)
+
+
+def numbers(i):
+    return {'id': i, 'user_id': random.randint(1, 10000), 'count': random.randint(0, 100),
+            'ratio': random.random(), 'score': random.random() * 1000}
+
+
+def money(i):
+    return {'id': i, 'amount': decimal.Decimal(random.randint(0, 10 ** 6)) / 100,
+            'tax': decimal.Decimal(random.randint(0, 10 ** 4)) / 100, 'quantity': random.randint(1, 10)}
+
+
+def timestamps(i):
+    created_at = START + datetime.timedelta(seconds=random.randint(0, 10 ** 7))
+    return {'id': i, 'created_at': created_at, 'day': created_at.date(), 'duration': datetime.timedelta(seconds=i % 600)}
+
+
+def text(i):
+    return dict(('column_{}'.format(c), u'value {} of row {} \u2713'.format(c, i)) for c in range(8))
+
+
+def sparse(i):
+    return {'id': i, 'amount': decimal.Decimal(i) if i % 3 else None, 'value': i if i % 2 else decimal.Decimal(i),
+            'day': START.date() if i % 5 else None, 'note': None}
+
+
+SHAPES = (numbers, money, timestamps, text, sparse)
+
+
+def result(shape, count):
+    rows = [shape(i) for i in range(count)]
+    return {'columns': [{'name': name} for name in rows[0].keys()], 'rows': rows}
+
+
+def legacy(data):
+    return json.dumps(data, cls=JSONEncoder)
+
+
+def benchmark(shape, serialize, count, repeat):
+    timings = []
+    for _ in range(repeat):
+        # A fresh result every time, as serialize_query_result converts the rows in place.
+        data = result(shape, count)
+        started_at = time.time()
+        serialize(data)
+        timings.append(time.time() - started_at)
+
+    return min(timings) * 1000
+
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+
+    serializers = [('JSONEncoder', legacy)]
+    for name in sorted(encoders):
+        serializers.append((name, lambda data, name=name: serialize_query_result(data, name)))
+
+    print "{} rows, best of {}.".format(count, repeat)
+    print "{:<12}".format('') + ''.join("{:>14}".format(name) for name, _ in serializers)
+    for shape in SHAPES:
+        random.seed(0)
+        timings = [benchmark(shape, serialize, count, repeat) for _, serialize in serializers]
+        print "{:<12}".format(shape.__name__) + ''.join("{:>11.1f} ms".format(ms) for ms in timings)
@@ -10,6 +10,8 @@ function AdminStatusCtrl($scope, $http, $timeout, currentUser, Events) {
       delete data.workers;
       $scope.manager = data.manager;
       delete data.manager;
+      $scope.updatedAt = data.updated_at;
+      delete data.updated_at;
       $scope.status = data;
     });
 
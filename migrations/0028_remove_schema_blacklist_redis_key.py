@@ -0,0 +1,5 @@
+from redash import redis_connection
+
+if __name__ == '__main__':
+    # Failing data sources are now backed off automatically by the refresh_schema task.
+    redis_connection.delete('data_sources:schema:blacklist')
@@ -0,0 +1,8 @@
+from redash import redis_connection
+from redash.models import DataSource
+
+if __name__ == '__main__':
+    # Schemas are now cached as per-table hash entries (data_source:schema:<id>:tables), so the old JSON blobs
+    # can go. They get rebuilt on the next schema refresh.
+    for data_source in DataSource.select(DataSource.id):
+        redis_connection.delete('data_source:schema:{}'.format(data_source.id))
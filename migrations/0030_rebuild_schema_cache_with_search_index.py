@@ -0,0 +1,9 @@
+from redash import redis_connection
+from redash.models import DataSource
+
+if __name__ == '__main__':
+    # The schema cache now also keeps a sorted table list and a search index, which are maintained incrementally.
+    # Drop the existing cache so the next refresh builds them for all tables.
+    for data_source in DataSource.select(DataSource.id):
+        for suffix in ('tables', 'versions', 'revision'):
+            redis_connection.delete('data_source:schema:{}:{}'.format(data_source.id, suffix))
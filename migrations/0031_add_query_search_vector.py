@@ -0,0 +1,11 @@
+from redash.models import db, Query
+
+if __name__ == '__main__':
+    db.connect_db()
+
+    with db.database.transaction():
+        Query.create_search_vector()
+        # Fire the trigger to index existing queries.
+        db.database.execute_sql("UPDATE queries SET name = name")
+
+    db.close_db(None)
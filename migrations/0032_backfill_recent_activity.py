@@ -0,0 +1,22 @@
+from redash import redis_connection
+from redash.models import db, Event
+
+if __name__ == '__main__':
+    # Recent queries and dashboards are now read from activity rollups in Redis (see Event.count_activity), which
+    # only get updated by new events. Build them from the events of the last days.
+    db.connect_db()
+
+    for object_type, actions in Event.RECENT_ACTIVITY_ACTIONS.iteritems():
+        cursor = db.database.execute_sql("""
+            SELECT org_id, user_id, object_id, created_at::date, count(*)
+            FROM events
+            WHERE created_at > current_date - %s AND object_type = %s AND action IN %s AND object_id IS NOT NULL
+            GROUP BY 1, 2, 3, 4
+        """, (Event.RECENT_ACTIVITY_DAYS + 1, object_type, tuple(actions)))
+
+        pipe = redis_connection.pipeline()
+        for org_id, user_id, object_id, day, count in cursor:
+            Event.count_activity(pipe, org_id, user_id, object_type, object_id, day, count)
+        pipe.execute()
+
+    db.close_db(None)
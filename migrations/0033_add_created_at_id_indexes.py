@@ -0,0 +1,17 @@
+from playhouse.migrate import PostgresqlMigrator, migrate
+
+from redash.models import db
+
+if __name__ == '__main__':
+    db.connect_db()
+    migrator = PostgresqlMigrator(db.database)
+
+    # Keyset pagination walks these newest first.
+    with db.database.transaction():
+        migrate(
+            migrator.add_index('queries', ('created_at', 'id'), False),
+            migrator.add_index('dashboards', ('created_at', 'id'), False),
+            migrator.add_index('users', ('created_at', 'id'), False),
+        )
+
+    db.close_db(None)
@@ -0,0 +1,36 @@
+from redash.models import db, Event, EventDailyCount
+
+if __name__ == '__main__':
+    db.connect_db()
+
+    with db.database.transaction():
+        if db.database.get_conn().server_version >= Event.PARTITIONING_MIN_SERVER_VERSION:
+            # Move the events into a table partitioned by month.
+            db.database.execute_sql('ALTER TABLE events RENAME TO events_unpartitioned')
+            db.database.execute_sql('ALTER SEQUENCE events_id_seq RENAME TO events_unpartitioned_id_seq')
+            for index in ('events_org_id', 'events_user_id'):
+                db.database.execute_sql('ALTER INDEX {0} RENAME TO {0}_unpartitioned'.format(index))
+            Event.create_table()
+
+            first = db.database.execute_sql('SELECT min(created_at)::date FROM events_unpartitioned').fetchone()[0]
+            if first is not None:
+                Event.create_partitions(since=first)
+
+            db.database.execute_sql('INSERT INTO events SELECT * FROM events_unpartitioned')
+            db.database.execute_sql("SELECT setval('events_id_seq', (SELECT coalesce(max(id), 0) + 1 "
+                                    "FROM events), false)")
+            db.database.execute_sql('DROP TABLE events_unpartitioned')
+        else:
+            # No partitioning; retention deletes by created_at.
+            db.database.execute_sql('CREATE INDEX events_created_at ON events (created_at)')
+
+        EventDailyCount.create_table()
+        db.database.execute_sql("""
+            INSERT INTO events_daily (day, org_id, user_id, action, object_type, object_id, count)
+            SELECT created_at::date, org_id, coalesce(user_id, 0), action, object_type, coalesce(object_id, ''),
+                   count(*)
+            FROM events
+            GROUP BY 1, 2, 3, 4, 5, 6
+        """)
+
+    db.close_db(None)
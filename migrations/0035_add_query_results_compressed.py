@@ -0,0 +1,27 @@
+from redash import models
+from redash.models import db
+
+if __name__ == '__main__':
+    db.connect_db()
+
+    if not models.CompressedQueryResult.table_exists():
+        models.CompressedQueryResult.create_table()
+
+    # Compress the latest results of the existing queries (the ones dashboards load). Older results get compressed on
+    # the fly when requested.
+    latest_result_ids = models.Query.select(models.Query.latest_query_data)\
+        .where(models.Query.latest_query_data.is_null(False), models.Query.is_archived == False)
+    missing = models.QueryResult.select(models.QueryResult.id)\
+        .join(models.CompressedQueryResult, join_type=models.peewee.JOIN_LEFT_OUTER)\
+        .where(models.QueryResult.id << latest_result_ids, models.CompressedQueryResult.query_result.is_null())
+
+    ids = [r.id for r in missing]
+    print "Compressing {} query results...".format(len(ids))
+    for i, query_result_id in enumerate(ids, 1):
+        with db.database.transaction():
+            models.CompressedQueryResult.store(models.QueryResult.get_by_id(query_result_id))
+
+        if i % 100 == 0:
+            print "{}/{}".format(i, len(ids))
+
+    db.close_db(None)
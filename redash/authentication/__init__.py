@@ -6,7 +6,7 @@ import logging
 
 from flask import redirect, request, jsonify, url_for
 
-from redash import models, settings
+from redash import models, settings, redis_connection
 from redash.authentication.org_resolving import current_org
 from redash.authentication import google_oauth, saml_auth, remote_user_auth
 from redash.tasks import record_event
@@ -37,7 +37,7 @@ def sign(key, path, expires):
 @login_manager.user_loader
 def load_user(user_id):
     try:
-        return models.User.get_by_id_and_org(user_id, current_org.id)
+        return models.User.get_by_id_and_org_cached(user_id, current_org.id)
     except models.User.DoesNotExist:
         return None
 
@@ -67,28 +67,69 @@ def hmac_load_user_from_request(request):
     return None
 
 
+def _api_key_kind_key(api_key):
+    return 'api_key:{}:kind'.format(hashlib.sha1(api_key).hexdigest())
+
+
+def _remember_api_key_kind(api_key, kind):
+    if settings.AUTH_CACHE_TTL > 0:
+        redis_connection.setex(_api_key_kind_key(api_key), settings.AUTH_CACHE_TTL, kind)
+
+
 def get_user_from_api_key(api_key, query_id):
     if not api_key:
         return None
 
+    # Which of the lookups below matched this key the last time (a user id, "api_key" or "query"), so we don't
+    # have to try the others first.
+    kind = redis_connection.get(_api_key_kind_key(api_key))
+
+    if kind is not None and kind.startswith('user:'):
+        try:
+            user = models.User.get_by_id_and_org_cached(kind[len('user:'):], current_org.id)
+            if user.api_key == api_key:
+                return user
+        except models.User.DoesNotExist:
+            pass
+
+    if kind == 'api_key':
+        try:
+            api_key = models.ApiKey.get_by_api_key(api_key)
+            return models.ApiUser(api_key, api_key.org, [])
+        except models.ApiKey.DoesNotExist:
+            return None
+
+    if kind == 'query':
+        return _get_user_from_query_api_key(api_key, query_id)
+
     user = None
 
     # TODO: once we switch all api key storage into the ApiKey model, this code will be much simplified
     try:
         user = models.User.get_by_api_key_and_org(api_key, current_org.id)
+        _remember_api_key_kind(api_key, 'user:{}'.format(user.id))
     except models.User.DoesNotExist:
         try:
-            api_key = models.ApiKey.get_by_api_key(api_key)
-            user = models.ApiUser(api_key, api_key.org, [])
+            api_key_object = models.ApiKey.get_by_api_key(api_key)
+            user = models.ApiUser(api_key_object, api_key_object.org, [])
+            _remember_api_key_kind(api_key, 'api_key')
         except models.ApiKey.DoesNotExist:
-            if query_id:
-                query = models.Query.get_by_id_and_org(query_id, current_org.id)
-                if query and query.api_key == api_key:
-                    user = models.ApiUser(api_key, query.org, query.groups.keys(), name="ApiKey: Query {}".format(query.id))
+            user = _get_user_from_query_api_key(api_key, query_id)
+            if user is not None:
+                _remember_api_key_kind(api_key, 'query')
 
     return user
 
 
+def _get_user_from_query_api_key(api_key, query_id):
+    if query_id:
+        query = models.Query.get_by_id_and_org(query_id, current_org.id)
+        if query and query.api_key == api_key:
+            return models.ApiUser(api_key, query.org, query.groups.keys(), name="ApiKey: Query {}".format(query.id))
+
+    return None
+
+
 def get_api_key_from_request(request):
     api_key = request.args.get('api_key', None)
 
@@ -121,7 +162,7 @@ def log_user_logged_in(app, user):
         'ip': request.remote_addr
     }
 
-    record_event.delay(event)
+    record_event(event)
 
 
 @login_manager.unauthorized_handler
@@ -15,9 +15,14 @@ from redash.models import Organization
 
 def _get_current_org():
     slug = request.view_args.get('org_slug', g.get('org_slug', 'default'))
-    org = Organization.get_by_slug(slug)
-    logging.debug("Current organization: %s (slug: %s)", org, slug)
-    return org
+
+    # current_org gets resolved many times during a request, so memoize it for the request's lifetime.
+    orgs = g.setdefault('orgs_by_slug', {})
+    if slug not in orgs:
+        orgs[slug] = Organization.get_by_slug_cached(slug)
+        logging.debug("Current organization: %s (slug: %s)", orgs[slug], slug)
+
+    return orgs[slug]
 
 # TODO: move to authentication
 current_org = LocalProxy(_get_current_org)
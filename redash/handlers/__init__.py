@@ -1,8 +1,11 @@
-from flask import jsonify
+from flask import jsonify, request
 from flask_login import login_required
+from flask_restful import abort
 
 from redash.handlers.api import api
-from redash.handlers.base import routes
+from redash import settings
+from redash.handlers.base import compress_response, routes
+from redash.metrics.registry import prometheus
 from redash.monitor import get_status
 from redash.permissions import require_super_admin
 
@@ -20,7 +23,26 @@ def status_api():
     return jsonify(status)
 
 
+@routes.route('/metrics')
+def metrics():
+    if 'prometheus' not in settings.METRICS_BACKENDS:
+        abort(404)
+
+    def render_metrics():
+        return prometheus.render(), 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+
+    if not settings.METRICS_SCRAPE_TOKEN:
+        # Without a scrape token the metrics are served to super admins only, like the status.
+        return login_required(require_super_admin(render_metrics))()
+
+    if request.headers.get('Authorization') != 'Bearer {}'.format(settings.METRICS_SCRAPE_TOKEN):
+        abort(403)
+
+    return render_metrics()
+
+
 def init_app(app):
     from redash.handlers import embed, queries, static, authentication, admin
     app.register_blueprint(routes)
     api.init_app(app)
+    app.after_request(compress_response)
@@ -1,9 +1,14 @@
+import datetime
 import json
 
+from flask import request
 from flask_login import login_required
+from flask_restful import abort
 from redash import models, redis_connection
+from redash.authentication import current_org
 from redash.handlers import routes
-from redash.handlers.base import json_response
+from redash.handlers.base import json_response, org_scoped_rule
+from redash.metrics import profiler
 from redash.permissions import require_super_admin
 from redash.tasks.queries import QueryTaskTracker
 
@@ -40,3 +45,42 @@ def queries_tasks():
     }
 
     return json_response(response)
+
+
+@routes.route(org_scoped_rule('/api/admin/events/counts'), methods=['GET'])
+@require_super_admin
+@login_required
+def event_counts(org_slug=None):
+    days = request.args.get('days', 30, type=int)
+    group_by = request.args.get('group_by', 'object_type,action').split(',')
+    filters = {name: request.args[name] for name in ('user_id', 'action', 'object_type', 'object_id')
+               if name in request.args}
+
+    if not set(group_by) <= set(models.EventDailyCount.GROUP_BY_FIELDS):
+        abort(400, message='Events can be grouped by: {}.'.format(', '.join(models.EventDailyCount.GROUP_BY_FIELDS)))
+
+    since = datetime.date.today() - datetime.timedelta(days=days)
+    counts = models.EventDailyCount.totals(current_org.id, since, group_by, **filters)
+
+    return json_response(dict(since=since, counts=list(counts)))
+
+
+@routes.route('/api/admin/profiler/requests', methods=['GET'])
+@require_super_admin
+@login_required
+def profiled_requests():
+    summaries = [{k: v for k, v in profile.iteritems() if k not in ('statements', 'stacks')}
+                 for profile in profiler.recent_profiles()]
+
+    return json_response(dict(requests=summaries))
+
+
+@routes.route('/api/admin/profiler/requests/<profile_id>', methods=['GET'])
+@require_super_admin
+@login_required
+def profiled_request(profile_id):
+    profile = profiler.get_profile(profile_id)
+    if profile is None:
+        abort(404)
+
+    return json_response(profile)
@@ -1,14 +1,18 @@
+import base64
+import json
 import time
+from functools import wraps
 
-from flask import Blueprint, current_app, request
+from dateutil.parser import parse as parse_date
+from flask import Blueprint, current_app, g, request
 from flask_login import current_user, login_required
 from flask_restful import Resource, abort
-from peewee import DoesNotExist
+from peewee import DoesNotExist, EnclosedClause
 from redash import settings
 from redash.authentication import current_org
-from redash.models import ApiUser
-from redash.tasks import record_event as record_event_task
-from redash.utils import json_dumps
+from redash.models import ApiUser, estimate_count
+from redash.tasks import record_events as buffer_events
+from redash.utils import compression, json_dumps
 
 routes = Blueprint('redash', __name__, template_folder=settings.fix_assets_path('templates'))
 
@@ -38,26 +42,31 @@ class BaseResource(Resource):
 
 
 def record_event(org, user, options):
-    if isinstance(user, ApiUser):
-        options.update({
-            'api_key': user.name,
-            'org_id': org.id
-        })
-    else:
+    record_events(org, user, [options])
+
+
+def record_events(org, user, events):
+    for options in events:
+        if isinstance(user, ApiUser):
+            options.update({
+                'api_key': user.name,
+                'org_id': org.id
+            })
+        else:
+            options.update({
+                'user_id': user.id,
+                'org_id': org.id
+            })
+
         options.update({
-            'user_id': user.id,
-            'org_id': org.id
+            'user_agent': request.user_agent.string,
+            'ip': request.remote_addr
         })
 
-    options.update({
-        'user_agent': request.user_agent.string,
-        'ip': request.remote_addr
-    })
+        if 'timestamp' not in options:
+            options['timestamp'] = int(time.time())
 
-    if 'timestamp' not in options:
-        options['timestamp'] = int(time.time())
-
-    record_event_task.delay(options)
+    buffer_events(events)
 
 
 def require_fields(req, fields):
@@ -95,6 +104,58 @@ def paginate(query_set, page, page_size, serializer):
     }
 
 
+def _encode_cursor(obj):
+    return base64.urlsafe_b64encode(json_dumps([obj.created_at, obj.id]))
+
+
+def _decode_cursor(cursor):
+    try:
+        created_at, object_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        return parse_date(created_at), int(object_id)
+    except (TypeError, ValueError, UnicodeEncodeError):
+        abort(400, message='Invalid cursor.')
+
+
+def keyset_paginate(query_set, model, cursor, page_size, serializer, count=None):
+    """
+    Pages through query_set newest first, continuing after the (created_at, id) encoded in `cursor` instead of
+    skipping rows with an OFFSET, so deep pages are as cheap as the first one. `cursor` is the previous page's
+    `next_cursor` (empty for the first page). `count` can be 'exact' or 'estimate' to include the total count.
+    """
+    if page_size > 250 or page_size < 1:
+        abort(400, message='Page size is out of range (1-250).')
+
+    response = {'page_size': page_size}
+
+    if count == 'exact':
+        response['count'] = query_set.count()
+    elif count == 'estimate':
+        response['count'] = estimate_count(query_set)
+
+    if cursor:
+        query_set = query_set.where(EnclosedClause(model.created_at, model.id) < EnclosedClause(*_decode_cursor(cursor)))
+
+    results = list(query_set.order_by(model.created_at.desc(), model.id.desc()).limit(page_size + 1))
+
+    response['next_cursor'] = _encode_cursor(results[page_size - 1]) if len(results) > page_size else None
+    response['results'] = [serializer(result) for result in results[:page_size]]
+
+    return response
+
+
+def paginate_request(query_set, model, serializer):
+    """
+    Paginates by cursor when the request has a `cursor` argument (see keyset_paginate), otherwise by page.
+    """
+    page_size = request.args.get('page_size', 25, type=int)
+
+    if 'cursor' in request.args:
+        return keyset_paginate(query_set, model, request.args['cursor'], page_size, serializer,
+                               request.args.get('count'))
+
+    return paginate(query_set, request.args.get('page', 1, type=int), page_size, serializer)
+
+
 def org_scoped_rule(rule):
     if settings.MULTI_ORG:
         return "/<org_slug:org_slug>{}".format(rule)
@@ -104,3 +165,47 @@ def org_scoped_rule(rule):
 
 def json_response(response):
     return current_app.response_class(json_dumps(response), mimetype='application/json')
+
+
+def accepted_encoding(encodings=None):
+    """The best of `encodings` (by default, the ones we can compress with) the client accepts, or None."""
+    accepted = [e for e in encodings or compression.supported_encodings() if request.accept_encodings[e] > 0]
+    if not accepted:
+        return None
+
+    return max(accepted, key=lambda e: request.accept_encodings[e])
+
+
+def compressed(fn):
+    """Has the view's responses compressed (by compress_response) for clients that accept it."""
+    @wraps(fn)
+    def decorated_view(*args, **kwargs):
+        g.compress_response = True
+        return fn(*args, **kwargs)
+
+    return decorated_view
+
+
+def compress_response(response):
+    if not g.get('compress_response') or not settings.COMPRESS_RESPONSES:
+        return response
+
+    response.vary.add('Accept-Encoding')
+
+    if response.status_code != 200 or response.direct_passthrough or response.is_streamed or \
+            'Content-Encoding' in response.headers:
+        return response
+
+    # Leaves out the likes of Excel files, which are compressed already.
+    if not (response.mimetype == 'application/json' or response.mimetype.startswith('text/')):
+        return response
+
+    data = response.get_data()
+    encoding = accepted_encoding()
+    if encoding is None or len(data) < settings.COMPRESS_MIN_SIZE:
+        return response
+
+    response.set_data(compression.compress(data, encoding, settings.COMPRESS_LEVEL))
+    response.headers['Content-Encoding'] = encoding
+
+    return response
@@ -1,10 +1,10 @@
 from itertools import chain
 
-from flask import request, url_for
+from flask import current_app, request, url_for
 from flask_restful import abort
 from funcy import distinct, project, take
 from redash import models, serializers
-from redash.handlers.base import BaseResource, get_object_or_404
+from redash.handlers.base import BaseResource, compressed, get_object_or_404, keyset_paginate
 from redash.models import ConflictDetectedError
 from redash.permissions import (can_modify, require_admin_or_owner,
                                 require_object_modify_permission,
@@ -27,6 +27,12 @@ class DashboardListResource(BaseResource):
     @require_permission('list_dashboards')
     def get(self):
         results = models.Dashboard.all(self.current_org, self.current_user.groups, self.current_user)
+
+        if 'cursor' in request.args:
+            return keyset_paginate(results, models.Dashboard, request.args['cursor'],
+                                   request.args.get('page_size', 25, type=int), lambda d: d.to_dict(),
+                                   request.args.get('count'))
+
         return [q.to_dict() for q in results]
 
     @require_permission('create_dashboard')
@@ -42,9 +48,10 @@ class DashboardListResource(BaseResource):
 
 class DashboardResource(BaseResource):
     @require_permission('list_dashboards')
+    @compressed
     def get(self, dashboard_slug=None):
         dashboard = get_object_or_404(models.Dashboard.get_by_slug_and_org, dashboard_slug, self.current_org)
-        response = dashboard.to_dict(with_widgets=True, user=self.current_user)
+        response = dashboard.to_dict_cached(self.current_user)
 
         api_key = models.ApiKey.get_by_object(dashboard)
         if api_key:
@@ -85,6 +92,7 @@ class DashboardResource(BaseResource):
 
 
 class PublicDashboardResource(BaseResource):
+    @compressed
     def get(self, token):
         if not isinstance(self.current_user, models.ApiUser):
             api_key = get_object_or_404(models.ApiKey.get_by_api_key, token)
@@ -92,7 +100,7 @@ class PublicDashboardResource(BaseResource):
         else:
             dashboard = self.current_user.object
 
-        return serializers.public_dashboard(dashboard)
+        return current_app.response_class(serializers.public_dashboard(dashboard), mimetype='application/json')
 
 
 class DashboardShareResource(BaseResource):
@@ -7,7 +7,7 @@ from redash import models
 from redash.utils.configuration import ConfigurationContainer, ValidationError
 from redash.permissions import require_admin, require_permission, require_access, view_only
 from redash.query_runner import query_runners, get_configuration_schema_for_query_runner_type
-from redash.handlers.base import BaseResource, get_object_or_404
+from redash.handlers.base import BaseResource, compressed, get_object_or_404, json_response, paginate
 
 
 class DataSourceTypeListResource(BaseResource):
@@ -102,14 +102,69 @@ class DataSourceListResource(BaseResource):
         return datasource.to_dict(all=True)
 
 
+def schema_response(data_source, response):
+    # The schema revision changes whenever the cached schema does, so it doubles as the ETag.
+    response = json_response(response)
+    response.set_etag('{}-{}'.format(data_source.id, data_source.schema_revision), weak=True)
+    return response.make_conditional(request)
+
+
+def schema_not_modified(data_source):
+    revision = data_source.schema_revision
+    if revision is None:
+        return False
+    return request.if_none_match.contains_weak('{}-{}'.format(data_source.id, revision))
+
+
 class DataSourceSchemaResource(BaseResource):
+    @compressed
     def get(self, data_source_id):
         data_source = get_object_or_404(models.DataSource.get_by_id_and_org, data_source_id, self.current_org)
         require_access(data_source.groups, self.current_user, view_only)
         refresh = request.args.get('refresh') is not None
-        schema = data_source.get_schema(refresh)
 
-        return schema
+        if not refresh and schema_not_modified(data_source):
+            return make_response('', 304)
+
+        # Without search/pagination arguments return the full schema (paginated listings leave out the columns,
+        # unless columns=true, so they can be fetched per table).
+        if not any(arg in request.args for arg in ('q', 'page', 'page_size', 'columns')):
+            return schema_response(data_source, data_source.get_schema(refresh))
+
+        if refresh or data_source.schema_revision is None:
+            data_source.refresh_schema(get_stats=refresh)
+
+        term = request.args.get('q', '').strip()
+        page = request.args.get('page', 1, type=int)
+        page_size = request.args.get('page_size', 25, type=int)
+        with_columns = request.args.get('columns') == 'true'
+
+        if with_columns:
+            serializer = lambda t: t
+        else:
+            serializer = lambda t: project(t, ('name', 'size'))
+
+        tables = models.SchemaTables(data_source, term)
+        return schema_response(data_source, paginate(tables, page, page_size, serializer))
+
+
+class DataSourceSchemaTableResource(BaseResource):
+    @compressed
+    def get(self, data_source_id, table_name):
+        data_source = get_object_or_404(models.DataSource.get_by_id_and_org, data_source_id, self.current_org)
+        require_access(data_source.groups, self.current_user, view_only)
+
+        if schema_not_modified(data_source):
+            return make_response('', 304)
+
+        if data_source.schema_revision is None:
+            data_source.refresh_schema()
+
+        table = data_source.get_schema_table(table_name)
+        if table is None:
+            abort(404, message='Table not found.')
+
+        return schema_response(data_source, table)
 
 
 class DataSourcePauseResource(BaseResource):
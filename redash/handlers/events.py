@@ -1,12 +1,16 @@
 from flask import request
+from flask_restful import abort
 
-from redash.handlers.base import BaseResource
+from redash.handlers.base import BaseResource, record_events
 
 
 class EventResource(BaseResource):
     def post(self):
         events_list = request.get_json(force=True)
-        for event in events_list:
-            self.record_event(event)
+        if not isinstance(events_list, list) or not all(isinstance(event, dict) for event in events_list):
+            abort(400, message="Expected a list of events.")
+
+        # Events missing fields (or with invalid ones) are dropped when buffered.
+        record_events(self.current_org, self.current_user, events_list)
 
 
@@ -7,7 +7,7 @@ from flask_restful import abort
 from funcy import distinct, take
 from redash import models
 from redash.handlers.base import (BaseResource, get_object_or_404,
-                                  org_scoped_rule, paginate, routes)
+                                  org_scoped_rule, paginate_request, routes)
 from redash.handlers.query_results import run_query
 from redash.permissions import (can_modify, not_view_only, require_access,
                                 require_admin_or_owner,
@@ -36,12 +36,12 @@ class QuerySearchResource(BaseResource):
 class QueryRecentResource(BaseResource):
     @require_permission('view_query')
     def get(self):
-        queries = models.Query.recent(self.current_user.groups, self.current_user.id)
+        queries = models.Query.recent(self.current_org, self.current_user.groups, self.current_user.id)
         recent = [d.to_dict(with_last_modified_by=False) for d in queries]
 
         global_recent = []
         if len(recent) < 10:
-            global_recent = [d.to_dict(with_last_modified_by=False) for d in models.Query.recent(self.current_user.groups)]
+            global_recent = [d.to_dict(with_last_modified_by=False) for d in models.Query.recent(self.current_org, self.current_user.groups)]
 
         return take(20, distinct(chain(recent, global_recent), key=lambda d: d['id']))
 
@@ -77,9 +77,8 @@ class QueryListResource(BaseResource):
     @require_permission('view_query')
     def get(self):
         results = models.Query.all_queries(self.current_user.groups)
-        page = request.args.get('page', 1, type=int)
-        page_size = request.args.get('page_size', 25, type=int)
-        return paginate(results, page, page_size, lambda q: q.to_dict(with_stats=True, with_last_modified_by=False))
+        return paginate_request(results, models.Query,
+                                lambda q: q.to_dict(with_stats=True, with_last_modified_by=False))
 
 
 class MyQueriesResource(BaseResource):
@@ -87,9 +86,8 @@ class MyQueriesResource(BaseResource):
     def get(self):
         drafts = request.args.get('drafts') is not None
         results = models.Query.by_user(self.current_user, drafts)
-        page = request.args.get('page', 1, type=int)
-        page_size = request.args.get('page_size', 25, type=int)
-        return paginate(results, page, page_size, lambda q: q.to_dict(with_stats=True, with_last_modified_by=False))
+        return paginate_request(results, models.Query,
+                                lambda q: q.to_dict(with_stats=True, with_last_modified_by=False))
 
 
 class QueryResource(BaseResource):
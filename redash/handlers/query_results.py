@@ -11,7 +11,7 @@ import xlsxwriter
 from redash import models, settings, utils
 from redash.tasks import QueryTask, record_event
 from redash.permissions import require_permission, not_view_only, has_access, require_access, view_only
-from redash.handlers.base import BaseResource, get_object_or_404
+from redash.handlers.base import BaseResource, accepted_encoding, compressed, get_object_or_404
 from redash.utils import collect_query_parameters, collect_parameters_from_request
 from redash.tasks.queries import enqueue_query
 
@@ -20,11 +20,15 @@ def error_response(message):
     return {'job': {'status': 4, 'error': message}}, 400
 
 
-def run_query(data_source, parameter_values, query_text, query_id, max_age=0):
+def _run_query(data_source, parameter_values, query_text, query_id, max_age=0, query=None):
+    """
+    Returns an error message, or either the latest result of the query (when there's one within max_age seconds) or
+    the job running it (an already running one for the same query text and data source, if there is one).
+    """
     query_parameters = set(collect_query_parameters(query_text))
     missing_params = set(query_parameters) - set(parameter_values.keys())
     if missing_params:
-        return error_response('Missing parameter value for: {}'.format(", ".join(missing_params)))
+        return 'Missing parameter value for: {}'.format(", ".join(missing_params)), None, None
 
     if data_source.paused:
         if data_source.pause_reason:
@@ -32,25 +36,58 @@ def run_query(data_source, parameter_values, query_text, query_id, max_age=0):
         else:
             message = '{} is paused. Please try later.'.format(data_source.name)
 
-        return error_response(message)
+        return message, None, None
+
+    # Results of saved queries run with parameters (on the query's own data source: it might have been changed in the
+    # editor) are cached per query (see Query.cache_parameterized_result) rather than looked up by their query text.
+    parameters_hash = None
+    if query_parameters and settings.PARAMETERIZED_RESULTS_CACHE_SIZE > 0:
+        if query is None and unicode(query_id).isdigit():
+            query = models.Query.select().where(models.Query.id == query_id,
+                                                models.Query.org == data_source.org_id).first()
+        if query is not None and query.data_source_id == data_source.id:
+            parameters_hash = models.Query.parameters_hash(data_source.id, query_text, parameter_values)
 
     if query_parameters:
         query_text = pystache.render(query_text, parameter_values)
 
     if max_age == 0:
         query_result = None
+    elif parameters_hash:
+        query_result = query.get_parameterized_result(parameters_hash, max_age)
     else:
         query_result = models.QueryResult.get_latest(data_source, query_text, max_age)
 
+    if query_result:
+        return None, query_result, None
+
+    if isinstance(current_user._get_current_object(), models.ApiUser):
+        user_id, username = None, current_user.name
+    else:
+        user_id, username = current_user.id, current_user.email
+
+    metadata = {"Username": username, "Query ID": query_id}
+    if parameters_hash:
+        metadata['Parameters Hash'] = parameters_hash
+
+    job = enqueue_query(query_text, data_source, user_id, metadata=metadata)
+    return None, None, job
+
+
+def run_query(data_source, parameter_values, query_text, query_id, max_age=0):
+    error, query_result, job = _run_query(data_source, parameter_values, query_text, query_id, max_age)
+    if error:
+        return error_response(error)
+
     if query_result:
         return {'query_result': query_result.to_dict()}
     else:
-        job = enqueue_query(query_text, data_source, current_user.id, metadata={"Username": current_user.email, "Query ID": query_id})
         return {'job': job.to_dict()}
 
 
 class QueryResultListResource(BaseResource):
     @require_permission('execute_query')
+    @compressed
     def post(self):
         params = request.get_json(force=True)
         parameter_values = collect_parameters_from_request(request.args)
@@ -102,6 +139,7 @@ class QueryResultResource(BaseResource):
         return make_response("", 200, headers)
 
     @require_permission('view_query')
+    @compressed
     def get(self, query_id=None, query_result_id=None, filetype='json'):
         # TODO:
         # This method handles two cases: retrieving result by id & retrieving result by query id.
@@ -110,11 +148,20 @@ class QueryResultResource(BaseResource):
         should_cache = query_result_id is not None
         if query_result_id is None and query_id is not None:
             query = get_object_or_404(models.Query.get_by_id_and_org, query_id, self.current_org)
-            if query:
+            parameter_values = collect_parameters_from_request(request.args)
+            if settings.ALLOW_PARAMETERS_IN_EMBEDS and parameter_values:
+                query_result_id, response = self.run_with_parameters(query, parameter_values)
+                if response is not None:
+                    return response
+            elif query:
                 query_result_id = query._data['latest_query_data']
 
+        # JSON responses are served from the stored gzipped copy when the client takes gzip, so the data isn't loaded.
+        precompressed = filetype == 'json' and settings.COMPRESS_RESPONSES and accepted_encoding(['gzip']) is not None
+
         if query_result_id:
-            query_result = get_object_or_404(models.QueryResult.get_by_id_and_org, query_result_id, self.current_org)
+            query_result = get_object_or_404(models.QueryResult.get_by_id_and_org, query_result_id, self.current_org,
+                                             with_data=not precompressed)
         else:
             query_result = None
 
@@ -140,10 +187,10 @@ class QueryResultResource(BaseResource):
                     event['object_type'] = 'query_result'
                     event['object_id'] = query_result_id
 
-                record_event.delay(event)
+                record_event(event)
 
             if filetype == 'json':
-                response = self.make_json_response(query_result)
+                response = self.make_json_response(query_result, precompressed)
             elif filetype == 'xlsx':
                 response = self.make_excel_response(query_result)
             else:
@@ -160,10 +207,54 @@ class QueryResultResource(BaseResource):
         else:
             abort(404, message='No cached result found for this query.')
 
-    def make_json_response(self, query_result):
-        data = json.dumps({'query_result': query_result.to_dict()}, cls=utils.JSONEncoder)
+    def run_with_parameters(self, query, parameter_values):
+        """
+        Runs the query with the parameter values of the request (for embeds) through the query queue, so viewers of the
+        same values share the job, and its result for max_age seconds. Waits up to EMBED_QUERY_WAIT_TIMEOUT seconds
+        for the job, and returns the id of the result, or the response to return instead (the job, if still running).
+
+        Embeds run it with the query's API key; users need to be allowed to run queries on its data source.
+        """
+        if isinstance(self.current_user, models.ApiUser):
+            if self.current_user.id != query.api_key:
+                abort(403)
+            require_access(query.data_source.groups, self.current_user, view_only)
+        else:
+            if not self.current_user.has_permission('execute_query'):
+                abort(403)
+            require_access(query.data_source.groups, self.current_user, not_view_only)
+
+        max_age = request.args.get('max_age', 0, type=int)
+        error, query_result, job = _run_query(query.data_source, parameter_values, query.query, query.id, max_age,
+                                              query)
+        if error:
+            return None, error_response(error)
+
+        if query_result:
+            return query_result.id, None
+
+        if not job.wait(settings.EMBED_QUERY_WAIT_TIMEOUT):
+            return None, ({'job': job.to_dict()}, 202)
+
+        job = job.to_dict()
+        if job['status'] != 3:
+            return None, ({'job': job}, 400)
+
+        return job['query_result_id'], None
+
+    def make_json_response(self, query_result, precompressed=False):
         headers = {'Content-Type': "application/json"}
-        return make_response(data, 200, headers)
+
+        body = models.CompressedQueryResult.get_body(query_result.id) if precompressed else None
+        if body is not None:
+            headers['Content-Encoding'] = 'gzip'
+            return make_response(body, 200, headers)
+
+        if query_result.data is None:
+            # Stored before query results were precompressed.
+            query_result = models.QueryResult.get_by_id(query_result.id)
+
+        return make_response(query_result.to_json(), 200, headers)
 
     @staticmethod
     def make_csv_response(query_result):
@@ -7,7 +7,7 @@ from peewee import IntegrityError
 from redash import models
 from redash.permissions import require_permission, require_admin_or_owner, is_admin_or_owner, \
     require_permission_or_owner, require_admin
-from redash.handlers.base import BaseResource, require_fields, get_object_or_404
+from redash.handlers.base import BaseResource, require_fields, get_object_or_404, keyset_paginate
 
 from redash.authentication.account import invite_link_for_user, send_invite_email, send_password_reset_email
 
@@ -21,7 +21,14 @@ def invite_user(org, inviter, user):
 class UserListResource(BaseResource):
     @require_permission('list_users')
     def get(self):
-        return [u.to_dict() for u in models.User.all(self.current_org)]
+        users = models.User.all(self.current_org)
+
+        if 'cursor' in request.args:
+            return keyset_paginate(users, models.User, request.args['cursor'],
+                                   request.args.get('page_size', 25, type=int), lambda u: u.to_dict(),
+                                   request.args.get('count'))
+
+        return [u.to_dict() for u in users]
 
     @require_admin
     def post(self):
@@ -5,7 +5,7 @@ import time
 import json
 import socket
 from celery.signals import task_prerun, task_postrun
-from redash import statsd_client, settings
+from redash.metrics.registry import metrics
 
 tasks_start_time = {}
 
@@ -18,16 +18,6 @@ def task_prerun_handler(signal, sender, task_id, task, args, kwargs):
         logging.exception("Exception during task_prerun handler:")
 
 
-def metric_name(name, tags):
-    # TODO: use some of the tags in the metric name if tags are not supported
-    # TODO: support additional tag formats (this one is for InfluxDB)
-    if not settings.STATSD_USE_TAGS:
-        return name
-
-    tags_string = ",".join(["{}={}".format(k, v) for k, v in tags.iteritems()])
-    return "{},{}".format(name, tags_string)
-
-
 @task_postrun.connect
 def task_postrun_handler(signal, sender, task_id, task, args, kwargs, retval, state):
     try:
@@ -42,7 +32,7 @@ def task_postrun_handler(signal, sender, task_id, task, args, kwargs, retval, st
 
         metric = "celery.task.runtime"
         logging.debug("metric=%s", json.dumps({'metric': metric, 'tags': tags, 'value': run_time}))
-        statsd_client.timing(metric_name(metric, tags), run_time)
-        statsd_client.incr(metric_name('celery.task.count', tags))
+        metrics.timing(metric, run_time, tags=tags)
+        metrics.incr('celery.task.count', tags=tags)
     except Exception:
         logging.exception("Exception during task_postrun handler.")
@@ -4,35 +4,55 @@ import logging
 from playhouse.gfk import Model
 import peewee
 from playhouse.postgres_ext import PostgresqlExtDatabase
-from redash import statsd_client
+from werkzeug.local import Local
+from redash.metrics.registry import metrics
 
 metrics_logger = logging.getLogger("metrics")
 
+# Caps the statements kept for a profiled request.
+MAX_RECORDED_STATEMENTS = 1000
+
 
 class MeteredPostgresqlExtDatabase(PostgresqlExtDatabase):
     def __init__(self, *args, **kwargs):
-        self.query_count = 0
-        self.query_duration = 0
+        # Metrics are kept per thread (or greenlet), so concurrent requests don't count each other's queries.
+        self._metrics = Local()
         return super(MeteredPostgresqlExtDatabase, self).__init__(*args, **kwargs)
 
-    def execute_sql(self, *args, **kwargs):
+    @property
+    def query_count(self):
+        return getattr(self._metrics, 'query_count', 0)
+
+    @property
+    def query_duration(self):
+        return getattr(self._metrics, 'query_duration', 0)
+
+    @property
+    def statements(self):
+        """The statements executed since reset_metrics(record_statements=True), as (sql, duration) tuples."""
+        return getattr(self._metrics, 'statements', None)
+
+    def execute_sql(self, sql, *args, **kwargs):
         start_time = time.time()
 
         try:
-            result = super(MeteredPostgresqlExtDatabase, self).execute_sql(*args, **kwargs)
+            result = super(MeteredPostgresqlExtDatabase, self).execute_sql(sql, *args, **kwargs)
             return result
         finally:
-            self.query_count += 1
             # TODO: there is a noticeable few ms discrepancy between the duration here and the one calculated in
             # metered_execute. Need to think what to do about it.
             duration = (time.time() - start_time) * 1000
-            self.query_duration += duration
+            self._metrics.query_count = self.query_count + 1
+            self._metrics.query_duration = self.query_duration + duration
+
+            statements = self.statements
+            if statements is not None and len(statements) < MAX_RECORDED_STATEMENTS:
+                statements.append((sql, duration))
 
-    def reset_metrics(self):
-        # TODO: instead of manually managing reset of metrics, we should store them in a LocalProxy based object, that
-        # is guaranteed to be "replaced" when the current request is done.
-        self.query_count = 0
-        self.query_duration = 0
+    def reset_metrics(self, record_statements=False):
+        self._metrics.query_count = 0
+        self._metrics.query_duration = 0
+        self._metrics.statements = [] if record_statements else None
 
 
 def patch_query_execute():
@@ -51,7 +71,7 @@ def patch_query_execute():
             return result
         finally:
             duration = (time.time() - start_time) * 1000
-            statsd_client.timing('db.{}.{}'.format(name, action), duration)
+            metrics.timing('db.{model}.{action}', duration, tags={'model': name, 'action': action})
             metrics_logger.debug("model=%s query=%s duration=%.2f", name, action, duration)
 
     @wraps(real_clone)
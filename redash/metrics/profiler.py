@@ -0,0 +1,115 @@
+import collections
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import uuid
+
+from redash import redis_connection, settings
+from redash.utils import json_dumps
+
+logger = logging.getLogger(__name__)
+
+PROFILES_KEY = 'profiler:requests'
+MAX_STACK_DEPTH = 100
+# Only the most sampled stacks are kept with a profile.
+MAX_STACKS = 200
+
+
+def _collapse_stack(frame):
+    # "module:function:line" entries from the outermost frame in, in the collapsed format flame graph tools read.
+    stack = []
+    while frame is not None and len(stack) < MAX_STACK_DEPTH:
+        code = frame.f_code
+        stack.append('{}:{}:{}'.format(frame.f_globals.get('__name__', code.co_filename), code.co_name, frame.f_lineno))
+        frame = frame.f_back
+
+    return ';'.join(reversed(stack))
+
+
+class StackSampler(object):
+    """
+    Samples the Python stack of the threads being profiled, every `interval` seconds, from a background thread (started
+    on first use, and again after a fork). Only real threads can be sampled, so this gives nothing under gevent workers.
+    """
+
+    def __init__(self, interval):
+        self.interval = interval
+        self._samples = {}
+        self._active = threading.Event()
+        self._sampler_pid = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        self._ensure_sampler()
+        self._samples[threading.current_thread().ident] = collections.Counter()
+        self._active.set()
+
+    def stop(self):
+        """Stops sampling the current thread and returns a Counter of the stacks sampled."""
+        samples = self._samples.pop(threading.current_thread().ident, collections.Counter())
+        if not self._samples:
+            self._active.clear()
+
+        return samples
+
+    def _ensure_sampler(self):
+        if self._sampler_pid == os.getpid():
+            return
+
+        with self._lock:
+            if self._sampler_pid == os.getpid():
+                return
+
+            self._samples.clear()
+            self._sampler_pid = os.getpid()
+
+            sampler = threading.Thread(target=self._sample, name='request-profiler')
+            sampler.daemon = True
+            sampler.start()
+
+    def _sample(self):
+        while True:
+            # Idles while no thread is profiled.
+            self._active.wait()
+            time.sleep(self.interval)
+            try:
+                frames = sys._current_frames()
+                for ident, samples in self._samples.items():
+                    frame = frames.get(ident)
+                    if frame is not None:
+                        samples[_collapse_stack(frame)] += 1
+            except Exception:
+                logger.exception("Failed sampling request stacks.")
+
+
+sampler = StackSampler(settings.REQUEST_PROFILER_INTERVAL / 1000.0)
+
+
+def save_profile(request_info, statements, samples):
+    profile = dict(request_info)
+    profile['id'] = uuid.uuid4().hex
+    profile['statements'] = [{'sql': sql, 'duration': duration} for sql, duration in statements]
+    profile['sample_interval'] = sampler.interval * 1000
+    profile['stacks'] = [{'stack': stack, 'samples': count} for stack, count in samples.most_common(MAX_STACKS)]
+
+    pipe = redis_connection.pipeline()
+    pipe.lpush(PROFILES_KEY, json_dumps(profile))
+    pipe.ltrim(PROFILES_KEY, 0, settings.REQUEST_PROFILER_KEEP - 1)
+    pipe.execute()
+
+    return profile
+
+
+def recent_profiles():
+    return [json.loads(profile) for profile in redis_connection.lrange(PROFILES_KEY, 0, -1)]
+
+
+def get_profile(profile_id):
+    for profile in recent_profiles():
+        if profile['id'] == profile_id:
+            return profile
+
+    return None
@@ -0,0 +1,252 @@
+"""
+In process metrics aggregation.
+
+Counters, gauges and timings are aggregated in memory and flushed every METRICS_FLUSH_INTERVAL seconds (from a
+background thread, started on first use and again after a fork) to the backends in METRICS_BACKENDS:
+
+* statsd: one pipelined batch of packets per flush; counters are summed and timings are sampled down to at most
+  METRICS_STATSD_MAX_SAMPLES per metric (with a sample rate, so statsd still counts them all).
+* prometheus: counters and timing histograms are accumulated in Redis across all processes, and served in the
+  Prometheus text format from /metrics.
+
+Metric names may reference tags, as in `requests.{endpoint}.{method}`: statsd gets the tag values in the name (and the
+rest of the tags when STATSD_USE_TAGS is on), Prometheus gets a `redash_requests` family with the tags as labels.
+"""
+import atexit
+import json
+import logging
+import os
+import random
+import re
+import string
+import threading
+import time
+
+from redash import redis_connection, settings, statsd_client
+
+logger = logging.getLogger(__name__)
+
+# Timing histogram buckets, in milliseconds.
+BUCKETS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000, 300000)
+
+PROMETHEUS_KEY = 'metrics:prometheus'
+PROMETHEUS_GAUGES_KEY = 'metrics:prometheus:gauges'
+
+
+def _name_fields(name):
+    return set(field for _, field, _, _ in string.Formatter().parse(name) if field)
+
+
+class Timing(object):
+    def __init__(self, max_samples):
+        self.count = 0
+        self.sum = 0.0
+        self.buckets = [0] * (len(BUCKETS) + 1)
+        self.samples = []
+        self.max_samples = max_samples
+
+    def add(self, value):
+        self.count += 1
+        self.sum += value
+
+        for i, bound in enumerate(BUCKETS):
+            if value <= bound:
+                self.buckets[i] += 1
+                break
+        else:
+            self.buckets[-1] += 1
+
+        # Reservoir sampling, so the kept samples stay representative however many come in.
+        if len(self.samples) < self.max_samples:
+            self.samples.append(value)
+        else:
+            index = random.randint(0, self.count - 1)
+            if index < self.max_samples:
+                self.samples[index] = value
+
+
+class StatsdBackend(object):
+    def __init__(self, client):
+        self.client = client
+
+    def stat_name(self, name, tags):
+        fields = _name_fields(name)
+        stat = name.format(**tags)
+
+        extra_tags = sorted((k, v) for k, v in tags.iteritems() if k not in fields)
+        if not settings.STATSD_USE_TAGS or not extra_tags:
+            return stat
+
+        # TODO: support additional tag formats (this one is for InfluxDB)
+        return "{},{}".format(stat, ",".join("{}={}".format(k, v) for k, v in extra_tags))
+
+    def flush(self, counters, gauges, timings):
+        with self.client.pipeline() as pipe:
+            for (name, tags), value in counters.iteritems():
+                pipe.incr(self.stat_name(name, dict(tags)), value)
+
+            for (name, tags), value in gauges.iteritems():
+                pipe.gauge(self.stat_name(name, dict(tags)), value)
+
+            for (name, tags), timing in timings.iteritems():
+                stat = self.stat_name(name, dict(tags))
+                rate = float(len(timing.samples)) / timing.count
+                for sample in timing.samples:
+                    if rate < 1:
+                        # Formatted here: the client would drop samples at random when given a rate.
+                        pipe._send_stat(stat, '%d|ms|@%s' % (sample, rate), 1)
+                    else:
+                        pipe.timing(stat, sample)
+
+
+class PrometheusBackend(object):
+    def __init__(self, redis):
+        self.redis = redis
+
+    @staticmethod
+    def family(name):
+        family = re.sub(r'\{[^}]*\}', '', name)
+        family = re.sub(r'[^a-zA-Z0-9_]+', '_', family).strip('_')
+        return 'redash_{}'.format(family)
+
+    @staticmethod
+    def field(kind, family, sample, labels):
+        return json.dumps([kind, family, sample, sorted(labels)])
+
+    def flush(self, counters, gauges, timings):
+        pipe = self.redis.pipeline(transaction=False)
+
+        for (name, tags), value in counters.iteritems():
+            family = self.family(name) + '_total'
+            pipe.hincrbyfloat(PROMETHEUS_KEY, self.field('counter', family, family, tags), value)
+
+        for (name, tags), value in gauges.iteritems():
+            family = self.family(name)
+            pipe.hset(PROMETHEUS_GAUGES_KEY, self.field('gauge', family, family, tags), value)
+
+        for (name, tags), timing in timings.iteritems():
+            family = self.family(name) + '_seconds'
+            cumulative = 0
+            for bound, count in zip(BUCKETS + ('+Inf',), timing.buckets):
+                cumulative += count
+                le = bound if bound == '+Inf' else str(bound / 1000.0)
+                pipe.hincrby(PROMETHEUS_KEY,
+                             self.field('histogram', family, family + '_bucket', tags + (('le', le),)), cumulative)
+            pipe.hincrbyfloat(PROMETHEUS_KEY, self.field('histogram', family, family + '_sum', tags),
+                              timing.sum / 1000.0)
+            pipe.hincrby(PROMETHEUS_KEY, self.field('histogram', family, family + '_count', tags), timing.count)
+
+        pipe.execute()
+
+    @staticmethod
+    def _sort_key(item):
+        (kind, family, sample, labels), _ = item
+        le = dict(labels).get('le')
+        le = float(le) if le is not None else 0
+        return family, [l for l in labels if l[0] != 'le'], sample, le
+
+    def render(self):
+        samples = self.redis.hgetall(PROMETHEUS_KEY)
+        samples.update(self.redis.hgetall(PROMETHEUS_GAUGES_KEY))
+        samples = sorted(((tuple(json.loads(field)), value) for field, value in samples.iteritems()),
+                         key=self._sort_key)
+
+        lines = []
+        last_family = None
+        for (kind, family, sample, labels), value in samples:
+            if family != last_family:
+                lines.append('# TYPE {} {}'.format(family, kind))
+                last_family = family
+
+            if labels:
+                label_values = ','.join(u'{}="{}"'.format(k, unicode(v).replace('\\', '\\\\').replace('"', '\\"')
+                                                          .replace('\n', '\\n'))
+                                        for k, v in labels)
+                sample = u'{}{{{}}}'.format(sample, label_values)
+            lines.append(u'{} {}'.format(sample, value))
+
+        return u'\n'.join(lines) + u'\n'
+
+
+class MetricsRegistry(object):
+    def __init__(self, backends, flush_interval, max_samples):
+        self.backends = backends
+        self.flush_interval = flush_interval
+        self.max_samples = max_samples
+        self._counters = {}
+        self._gauges = {}
+        self._timings = {}
+        self._lock = threading.Lock()
+        self._flusher_pid = None
+
+    def incr(self, name, count=1, tags=None):
+        key = self._key(name, tags)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + count
+
+    def gauge(self, name, value, tags=None):
+        key = self._key(name, tags)
+        with self._lock:
+            self._gauges[key] = value
+
+    def timing(self, name, value, tags=None):
+        """Records a duration, in milliseconds."""
+        key = self._key(name, tags)
+        with self._lock:
+            timing = self._timings.get(key)
+            if timing is None:
+                timing = self._timings[key] = Timing(self.max_samples)
+            timing.add(value)
+
+    def flush(self):
+        with self._lock:
+            counters, gauges, timings = self._counters, self._gauges, self._timings
+            self._counters, self._gauges, self._timings = {}, {}, {}
+
+        if not (counters or gauges or timings):
+            return
+
+        for backend in self.backends:
+            try:
+                backend.flush(counters, gauges, timings)
+            except Exception:
+                logger.exception("Failed flushing metrics to %s.", backend.__class__.__name__)
+
+    def _key(self, name, tags):
+        self._ensure_flusher()
+        return name, tuple(sorted((tags or {}).iteritems()))
+
+    def _ensure_flusher(self):
+        if self._flusher_pid == os.getpid() or not self.flush_interval:
+            return
+
+        with self._lock:
+            if self._flusher_pid == os.getpid():
+                return
+
+            # Metrics inherited from a parent process are the parent's to flush.
+            self._counters, self._gauges, self._timings = {}, {}, {}
+            self._flusher_pid = os.getpid()
+
+            flusher = threading.Thread(target=self._flush_periodically, name='metrics-flusher')
+            flusher.daemon = True
+            flusher.start()
+            atexit.register(self.flush)
+
+    def _flush_periodically(self):
+        while True:
+            time.sleep(self.flush_interval)
+            self.flush()
+
+
+def _create_backends():
+    backends = {
+        'statsd': lambda: StatsdBackend(statsd_client),
+        'prometheus': lambda: PrometheusBackend(redis_connection)
+    }
+
+    return [backends[name]() for name in settings.METRICS_BACKENDS]
+
+
+metrics = MetricsRegistry(_create_backends(), settings.METRICS_FLUSH_INTERVAL, settings.METRICS_STATSD_MAX_SAMPLES)
+prometheus = PrometheusBackend(redis_connection)
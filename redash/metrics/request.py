@@ -3,7 +3,9 @@ import time
 import logging
 
 from flask import request, g
-from redash import statsd_client
+from redash import settings
+from redash.metrics import profiler, tracing
+from redash.metrics.registry import metrics
 from redash.models import db
 
 metrics_logger = logging.getLogger("metrics")
@@ -11,6 +13,34 @@ metrics_logger = logging.getLogger("metrics")
 
 def record_requets_start_time():
     g.start_time = time.time()
+    g.profiled = settings.REQUEST_PROFILER_ENABLED
+    db.database.reset_metrics(record_statements=g.profiled)
+
+    if g.profiled:
+        profiler.sampler.start()
+
+    g.trace = tracing.start_trace('{} {}'.format(request.method, request.endpoint), 'redash-web',
+                                  tracing.parse_traceparent(request.headers.get('traceparent')),
+                                  path=request.path)
+
+
+def save_profile(status_code, request_duration):
+    g.profiled = False
+    samples = profiler.sampler.stop()
+
+    if request_duration < settings.REQUEST_PROFILER_THRESHOLD:
+        return
+
+    profiler.save_profile({
+        'method': request.method,
+        'path': request.full_path if request.query_string else request.path,
+        'endpoint': request.endpoint,
+        'status': status_code,
+        'started_at': g.start_time,
+        'duration': request_duration,
+        'query_count': db.database.query_count,
+        'query_duration': db.database.query_duration
+    }, db.database.statements, samples)
 
 
 def calculate_metrics(response):
@@ -18,6 +48,7 @@ def calculate_metrics(response):
         return response
 
     request_duration = (time.time() - g.start_time) * 1000
+    g.status_code = response.status_code
 
     metrics_logger.info("method=%s path=%s endpoint=%s status=%d content_type=%s content_length=%d duration=%.2f query_count=%d query_duration=%.2f",
                         request.method,
@@ -30,19 +61,43 @@ def calculate_metrics(response):
                         db.database.query_count,
                         db.database.query_duration)
 
-    statsd_client.timing('requests.{}.{}'.format(request.endpoint, request.method.lower()), request_duration)
+    metrics.timing('requests.{endpoint}.{method}', request_duration,
+                   tags={'endpoint': request.endpoint, 'method': request.method.lower()})
+
+    trace = g.get('trace')
+    if trace is not None and hasattr(response, 'headers'):
+        response.headers['X-Trace-ID'] = trace.trace_id
 
     return response
 
 MockResponse = namedtuple('MockResponse', ['status_code', 'content_type', 'content_length'])
 
 
-def calculate_metrics_on_exception(error):
-    if error is not None:
+def finish_request(error):
+    """
+    Stops the profiler and finishes the trace started for the request. Done on teardown, as it runs even when
+    an unhandled exception skipped the after_request handlers.
+    """
+    if 'start_time' not in g:
+        return
+
+    status_code = g.get('status_code', 500)
+
+    trace = g.pop('trace', None)
+    if trace is not None:
+        tracing.finish_trace(trace, status=status_code)
+
+    if g.get('profiled'):
+        try:
+            save_profile(status_code, (time.time() - g.start_time) * 1000)
+        except Exception:
+            metrics_logger.exception("Failed saving the request profile.")
+
+    if error is not None and 'status_code' not in g:
         calculate_metrics(MockResponse(500, '?', -1))
 
 
 def provision_app(app):
     app.before_request(record_requets_start_time)
     app.after_request(calculate_metrics)
-    app.teardown_request(calculate_metrics_on_exception)
+    app.teardown_request(finish_request)
@@ -0,0 +1,216 @@
+"""
+Traces of query executions, from the API request through the Celery queue to the query runner.
+
+A web request starts a trace (or continues the one in its W3C `traceparent` header), and enqueue_query passes the
+trace id and its span id to the worker in the task metadata, where execute_query continues it. Finished spans are
+exported in the Zipkin v2 JSON format to TRACING_EXPORT: either a file (one span per line) or the URL of a collector.
+"""
+import Queue
+import binascii
+import json
+import logging
+import os
+import random
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+import requests
+from werkzeug.local import LocalStack
+
+from redash import settings
+
+logger = logging.getLogger(__name__)
+
+TRACEPARENT_RE = re.compile(r'^[0-9a-f]{2}-([0-9a-f]{32})-([0-9a-f]{16})-[0-9a-f]{2}$')
+EXPORT_BATCH_SIZE = 100
+
+_spans = LocalStack()
+
+
+def _new_id(size):
+    return binascii.hexlify(os.urandom(size))
+
+
+class Span(object):
+    def __init__(self, name, service, trace_id, parent_id=None, start=None, tags=None):
+        self.name = name
+        self.service = service
+        self.trace_id = trace_id
+        self.span_id = _new_id(8)
+        self.parent_id = parent_id
+        self.start = start or time.time()
+        self.end = None
+        self.tags = dict(tags or {})
+
+    def finish(self, end=None):
+        self.end = end or time.time()
+        exporter.export(self)
+
+    def to_dict(self):
+        span = {
+            'traceId': self.trace_id,
+            'id': self.span_id,
+            'name': self.name,
+            'timestamp': int(self.start * 1000000),
+            'duration': max(int((self.end - self.start) * 1000000), 1),
+            'localEndpoint': {'serviceName': self.service},
+            'tags': {k: unicode(v) for k, v in self.tags.iteritems()}
+        }
+        if self.parent_id:
+            span['parentId'] = self.parent_id
+
+        return span
+
+
+def enabled():
+    return bool(settings.TRACING_EXPORT)
+
+
+def current_span():
+    return _spans.top
+
+
+def start_trace(name, service, context=None, **tags):
+    """
+    Starts the root span of this process' part of a trace, continuing the trace in `context` (a dict as returned by
+    trace_context) if it has one, or else starting a new one for TRACING_SAMPLE_RATE of the calls. Returns None when
+    not tracing.
+    """
+    if not enabled():
+        return None
+
+    context = context or {}
+    trace_id = context.get('Trace ID')
+    if trace_id is None:
+        if random.random() >= settings.TRACING_SAMPLE_RATE:
+            return None
+        trace_id = _new_id(16)
+
+    span = Span(name, service, trace_id, context.get('Span ID'), tags=tags)
+    _spans.push(span)
+    return span
+
+
+def finish_trace(span, **tags):
+    if span is None:
+        return
+
+    while _spans.top is not None and _spans.pop() is not span:
+        pass
+
+    span.tags.update(tags)
+    span.finish()
+
+
+@contextmanager
+def span(name, **tags):
+    """Times the enclosed block as a child of the current span (and does nothing when there's none)."""
+    parent = current_span()
+    if parent is None:
+        yield None
+        return
+
+    child = Span(name, parent.service, parent.trace_id, parent.span_id, tags=tags)
+    _spans.push(child)
+    try:
+        yield child
+    except Exception as e:
+        child.tags['error'] = e.__class__.__name__
+        raise
+    finally:
+        _spans.pop()
+        child.finish()
+
+
+def record_span(name, start, end=None, **tags):
+    """Records an already finished span (like the time a task waited in the queue) as a child of the current span."""
+    parent = current_span()
+    if parent is None:
+        return
+
+    Span(name, parent.service, parent.trace_id, parent.span_id, start=start, tags=tags).finish(end)
+
+
+def trace_context():
+    """The current trace and span ids, to pass along with the task metadata (empty when not tracing)."""
+    current = current_span()
+    if current is None:
+        return {}
+
+    return {'Trace ID': current.trace_id, 'Span ID': current.span_id}
+
+
+def parse_traceparent(header):
+    match = TRACEPARENT_RE.match(header or '')
+    if match is None:
+        return None
+
+    return {'Trace ID': match.group(1), 'Span ID': match.group(2)}
+
+
+class SpanExporter(object):
+    """
+    Writes finished spans to TRACING_EXPORT in batches, from a background thread (started on first use, and again after
+    a fork). Spans are dropped rather than queued without bound when the destination can't keep up.
+    """
+
+    def __init__(self, max_queued=10000):
+        self._queue = Queue.Queue(max_queued)
+        self._exporter_pid = None
+        self._lock = threading.Lock()
+
+    def export(self, span):
+        self._ensure_exporter()
+        try:
+            self._queue.put_nowait(span.to_dict())
+        except Queue.Full:
+            logger.warning("Dropped span %s of trace %s: the export queue is full.", span.name, span.trace_id)
+
+    def write(self, spans):
+        destination = settings.TRACING_EXPORT
+        if destination.startswith('http://') or destination.startswith('https://'):
+            response = requests.post(destination, data=json.dumps(spans), headers={'Content-Type': 'application/json'},
+                                     timeout=10)
+            response.raise_for_status()
+        else:
+            if destination.startswith('file://'):
+                destination = destination[len('file://'):]
+
+            with open(destination, 'a') as f:
+                f.write(''.join(json.dumps(span) + '\n' for span in spans))
+
+    def _ensure_exporter(self):
+        if self._exporter_pid == os.getpid():
+            return
+
+        with self._lock:
+            if self._exporter_pid == os.getpid():
+                return
+
+            # Spans queued in a parent process are the parent's to export.
+            self._queue = Queue.Queue(self._queue.maxsize)
+            self._exporter_pid = os.getpid()
+
+            thread = threading.Thread(target=self._export_queued, name='span-exporter')
+            thread.daemon = True
+            thread.start()
+
+    def _export_queued(self):
+        queue = self._queue
+        while True:
+            spans = [queue.get()]
+            try:
+                while len(spans) < EXPORT_BATCH_SIZE:
+                    spans.append(queue.get_nowait())
+            except Queue.Empty:
+                pass
+
+            try:
+                self.write(spans)
+            except Exception:
+                logger.exception("Failed exporting %d spans.", len(spans))
+
+
+exporter = SpanExporter()
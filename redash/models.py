@@ -1,3 +1,4 @@
+import copy
 import json
 from flask_login import UserMixin, AnonymousUserMixin
 import hashlib
@@ -6,20 +7,25 @@ import os
 import threading
 import time
 import datetime
+import collections
 import itertools
+import re
+from dateutil.parser import parse as parse_date
 from funcy import project
 
 import peewee
+import redis
 from passlib.apps import custom_app_context as pwd_context
 from playhouse.gfk import GFKField, BaseModel
 from playhouse.postgres_ext import ArrayField, DateTimeTZField
 from permissions import has_access, view_only
 
-from redash import utils, settings, redis_connection
+from redash import utils, settings, redis_connection, statsd_client
 from redash.query_runner import get_query_runner, get_configuration_schema_for_query_runner_type
 from redash.destinations import get_destination, get_configuration_schema_for_destination_type
 from redash.metrics.database import MeteredPostgresqlExtDatabase, MeteredModel
-from redash.utils import generate_token, json_dumps
+from redash.utils import compression, generate_token, json_dumps
+from redash.utils.cache import InvalidatedCache
 from redash.utils.configuration import ConfigurationContainer
 
 
@@ -38,7 +44,6 @@ class Database(object):
 
     def connect_db(self):
         self._check_pid()
-        self.database.reset_metrics()
         self.database.connect()
 
     def close_db(self, exc):
@@ -277,6 +282,10 @@ class ApiUser(UserMixin, PermissionsCheckMixin):
         return False
 
 
+# slug -> field values, see Organization.get_by_slug_cached.
+organizations_cache = InvalidatedCache(redis_connection, 'organizations:invalidate', settings.ORG_CACHE_TTL)
+
+
 class Organization(ModelTimestampsMixin, BaseModel):
     SETTING_GOOGLE_APPS_DOMAINS = 'google_apps_domains'
     SETTING_IS_PUBLIC = "is_public"
@@ -301,6 +310,25 @@ class Organization(ModelTimestampsMixin, BaseModel):
     def get_by_slug(cls, slug):
         return cls.get(cls.slug == slug)
 
+    @classmethod
+    def get_by_slug_cached(cls, slug):
+        """Same as get_by_slug, but served from a process-level cache for up to ORG_CACHE_TTL seconds."""
+        cached = organizations_cache.get(slug)
+        if cached is not None:
+            org = cls(**copy.deepcopy(cached))
+            org._prepare_instance()
+            return org
+
+        generation = organizations_cache.generation(slug)
+        org = cls.get_by_slug(slug)
+        organizations_cache.set(slug, copy.deepcopy(org._data), generation)
+        return org
+
+    def post_save(self, created):
+        super(Organization, self).post_save(created)
+        # The slug might have changed, so every organization is dropped.
+        organizations_cache.invalidate_all()
+
     @property
     def default_group(self):
         return self.groups.where(Group.name=='default', Group.type==Group.BUILTIN_GROUP).first()
@@ -356,6 +384,23 @@ class Group(BaseModel, BelongsToOrgMixin):
     def members(cls, group_id):
         return User.select().where(peewee.SQL("%s = ANY(groups)", group_id))
 
+    def post_save(self, created):
+        super(Group, self).post_save(created)
+        if not created:
+            User.invalidate_auth_cache([u.id for u in Group.members(self.id).select(User.id)])
+
+    def delete_instance(self, *args, **kwargs):
+        member_ids = [u.id for u in Group.members(self.id).select(User.id)]
+        data_source_ids = [dsg.data_source_id for dsg in
+                           DataSourceGroup.select(DataSourceGroup.data_source).where(DataSourceGroup.group == self)]
+        result = super(Group, self).delete_instance(*args, **kwargs)
+        User.invalidate_auth_cache(member_ids)
+        for data_source_id in data_source_ids:
+            data_source_groups_cache.invalidate(data_source_id)
+        if data_source_ids:
+            Dashboard.invalidate_permissions_cache()
+        return result
+
     @classmethod
     def find_by_name(cls, org, group_names):
         result = cls.select().where(cls.org == org, cls.name << group_names)
@@ -379,10 +424,12 @@ class User(ModelTimestampsMixin, BaseModel, BelongsToOrgMixin, UserMixin, Permis
 
         indexes = (
             (('org', 'email'), True),
+            (('created_at', 'id'), False),
         )
 
     def __init__(self, *args, **kwargs):
         super(User, self).__init__(*args, **kwargs)
+        self._cached_permissions = None
 
     def to_dict(self, with_api_key=False):
         d = {
@@ -411,6 +458,10 @@ class User(ModelTimestampsMixin, BaseModel, BelongsToOrgMixin, UserMixin, Permis
         if not self.api_key:
             self.api_key = generate_token(40)
 
+    def post_save(self, created):
+        super(User, self).post_save(created)
+        self.invalidate_auth_cache([self.id])
+
     @property
     def gravatar_url(self):
         email_md5 = hashlib.md5(self.email.lower()).hexdigest()
@@ -418,9 +469,53 @@ class User(ModelTimestampsMixin, BaseModel, BelongsToOrgMixin, UserMixin, Permis
 
     @property
     def permissions(self):
-        # TODO: this should be cached.
-        return list(itertools.chain(*[g.permissions for g in
-                                      Group.select().where(Group.id << self.groups)]))
+        # Memoized for as long as the user's groups stay the same (has_access checks it for every object).
+        if self._cached_permissions is None or self._cached_permissions[0] != list(self.groups or []):
+            permissions = list(itertools.chain(*[g.permissions for g in
+                                                 Group.select().where(Group.id << self.groups)]))
+            self._cached_permissions = (list(self.groups or []), permissions)
+
+        return self._cached_permissions[1]
+
+    # What's cached for authenticating requests (the password hash is left out, as it isn't needed for it).
+    AUTH_CACHE_FIELDS = ('id', 'org', 'name', 'email', 'groups', 'api_key', 'created_at', 'updated_at')
+
+    @staticmethod
+    def _auth_cache_key(user_id):
+        return 'user:{}:auth'.format(user_id)
+
+    @classmethod
+    def invalidate_auth_cache(cls, user_ids):
+        if user_ids:
+            redis_connection.delete(*[cls._auth_cache_key(user_id) for user_id in user_ids])
+
+    @classmethod
+    def get_by_id_and_org_cached(cls, user_id, org_id):
+        """
+        Same as get_by_id_and_org, for authenticating requests: the user's fields and permissions are cached in Redis
+        for AUTH_CACHE_TTL seconds, and dropped whenever the user or one of its groups changes.
+        """
+        cached = redis_connection.get(cls._auth_cache_key(user_id))
+        if cached is not None:
+            data = json.loads(cached)
+            if data['org'] != org_id:
+                raise cls.DoesNotExist()
+
+            permissions = data.pop('permissions')
+            for field in ('created_at', 'updated_at'):
+                data[field] = parse_date(data[field])
+
+            user = cls(**data)
+            user._prepare_instance()
+            user._cached_permissions = (list(user.groups or []), permissions)
+            return user
+
+        user = cls.get_by_id_and_org(user_id, org_id)
+        if settings.AUTH_CACHE_TTL > 0:
+            data = dict(project(user._data, cls.AUTH_CACHE_FIELDS), permissions=user.permissions)
+            redis_connection.setex(cls._auth_cache_key(user.id), settings.AUTH_CACHE_TTL, json_dumps(data))
+
+        return user
 
     @classmethod
     def get_by_email_and_org(cls, email, org):
@@ -465,6 +560,58 @@ class ConfigurationField(peewee.TextField):
         return ConfigurationContainer.from_json(value)
 
 
+def _to_unicode(value):
+    if isinstance(value, str):
+        return value.decode('utf-8')
+    return unicode(value)
+
+
+def _schema_index_entries(table):
+    """
+    Search index entries for a table: one "token\\x00table name" member per lowercase token, where the tokens are the
+    table name, its dotted parts and its column names. All members have the same score, so prefix lookups are lexical
+    range queries (ZRANGEBYLEX).
+    """
+    name = _to_unicode(table['name'])
+    tokens = set([name.lower()] + re.split(r'[.:]', name.lower()))
+    tokens.update(_to_unicode(column).lower() for column in table.get('columns', []))
+    return set(u'{}\x00{}'.format(token, name).encode('utf-8') for token in tokens if token)
+
+
+class SchemaTables(object):
+    """Page-able listing of a data source's cached tables (works with handlers.base.paginate)."""
+
+    def __init__(self, data_source, term=None):
+        self.data_source = data_source
+        self.names = data_source.search_schema(term) if term else None
+
+    def count(self):
+        if self.names is not None:
+            return len(self.names)
+        return redis_connection.zcard(self.data_source._schema_key('names'))
+
+    def paginate(self, page, page_size):
+        start = (page - 1) * page_size
+        if self.names is not None:
+            names = self.names[start:start + page_size]
+        else:
+            names = redis_connection.zrange(self.data_source._schema_key('names'), start, start + page_size - 1)
+        return self.data_source.get_schema_tables(names)
+
+
+def _to_date(value):
+    return value.date() if isinstance(value, datetime.datetime) else value
+
+
+def _org_id(org):
+    return org.id if isinstance(org, Organization) else org
+
+
+# data source id -> {group id: view only}, see DataSource.groups.
+data_source_groups_cache = InvalidatedCache(redis_connection, 'data_source_groups:invalidate',
+                                            settings.DATA_SOURCE_GROUPS_CACHE_TTL)
+
+
 class DataSource(BelongsToOrgMixin, BaseModel):
     id = peewee.PrimaryKeyField()
     org = peewee.ForeignKeyField(Organization, related_name="data_sources")
@@ -514,25 +661,142 @@ class DataSource(BelongsToOrgMixin, BaseModel):
         DataSourceGroup.create(data_source=data_source, group=data_source.org.default_group)
         return data_source
 
-    def get_schema(self, refresh=False):
-        key = "data_source:schema:{}".format(self.id)
+    def _schema_key(self, suffix):
+        return "data_source:schema:{}:{}".format(self.id, suffix)
 
-        cache = None
-        if not refresh:
-            cache = redis_connection.get(key)
+    def get_schema(self, refresh=False):
+        if refresh or not redis_connection.exists(self._schema_key('revision')):
+            self.refresh_schema(get_stats=refresh)
 
-        if cache is None:
-            query_runner = self.query_runner
-            schema = sorted(query_runner.get_schema(get_stats=refresh), key=lambda t: t['name'])
+        tables = redis_connection.hvals(self._schema_key('tables'))
+        return sorted([json.loads(t) for t in tables], key=lambda t: t['name'])
 
-            redis_connection.set(key, json.dumps(schema))
+    @property
+    def schema_revision(self):
+        """Counter bumped whenever the cached schema changes (None if it wasn't loaded yet)."""
+        revision = redis_connection.get(self._schema_key('revision'))
+        return int(revision) if revision is not None else None
+
+    def get_schema_tables(self, table_names):
+        if not table_names:
+            return []
+        tables = redis_connection.hmget(self._schema_key('tables'), table_names)
+        return [json.loads(t) for t in tables if t is not None]
+
+    def get_schema_table(self, table_name):
+        table = redis_connection.hget(self._schema_key('tables'), table_name)
+        return json.loads(table) if table is not None else None
+
+    def search_schema(self, term):
+        """Names of the tables whose name (or one of its dotted parts) or one of its columns starts with term."""
+        term = _to_unicode(term).lower().encode('utf-8')
+        members = redis_connection.zrangebylex(self._schema_key('index'), '[' + term, '[' + term + '\xff')
+        return sorted(set(m.split('\x00', 1)[1].decode('utf-8') for m in members))
+
+    def refresh_schema(self, get_stats=False):
+        """
+        Syncs the cached schema with the data source. The schema is kept as one hash entry per table (along with the
+        table's version), so only tables that were added, changed or removed are fetched and rewritten. The sorted
+        table list and the search index are updated for the same tables. Versions only track the tables' columns, so
+        with get_stats the sizes of the other tables are refreshed too (and only those that changed are rewritten).
+
+        Returns the number of tables rewritten or removed.
+        """
+        tables_key = self._schema_key('tables')
+        versions_key = self._schema_key('versions')
+        names_key = self._schema_key('names')
+        index_key = self._schema_key('index')
+        revision_key = self._schema_key('revision')
+
+        query_runner = self.query_runner
+        stored_versions = {name.decode('utf-8'): version
+                           for name, version in redis_connection.hgetall(versions_key).iteritems()}
+        versions = query_runner.get_table_versions()
+
+        if versions is None:
+            # The runner can't tell which tables changed, so list everything and diff by content.
+            tables = query_runner.get_schema(get_stats=get_stats)
+            versions = {_to_unicode(t['name']): hashlib.md5(json.dumps(t, sort_keys=True)).hexdigest() for t in tables}
+            changed = [t for t in tables if stored_versions.get(_to_unicode(t['name'])) != versions[_to_unicode(t['name'])]]
         else:
-            schema = json.loads(cache)
+            versions = {_to_unicode(name): str(version) for name, version in versions.iteritems()}
+            changed_names = [name for name, version in versions.iteritems() if stored_versions.get(name) != version]
+            changed = query_runner.get_tables_schema(changed_names, get_stats=get_stats) if changed_names else []
+
+            if get_stats and settings.SCHEMA_RUN_TABLE_SIZE_CALCULATIONS:
+                unchanged_names = [name for name in versions if name in stored_versions and name not in changed_names]
+                changed.extend(self._resized_tables(query_runner, unchanged_names))
+
+        changed_names = [_to_unicode(t['name']) for t in changed]
+        removed = [name for name in stored_versions if name not in versions]
+
+        # Search entries of the previous version of these tables have to go.
+        replaced = [name for name in changed_names if name in stored_versions] + removed
+        stale_entries = set()
+        if replaced:
+            for table in redis_connection.hmget(tables_key, replaced):
+                if table is not None:
+                    stale_entries.update(_schema_index_entries(json.loads(table)))
+
+        new_entries = set()
+        for table in changed:
+            new_entries.update(_schema_index_entries(table))
+
+        pipe = redis_connection.pipeline()
+        if stale_entries - new_entries:
+            pipe.zrem(index_key, *(stale_entries - new_entries))
+        if removed:
+            pipe.hdel(tables_key, *removed)
+            pipe.hdel(versions_key, *removed)
+            pipe.zrem(names_key, *removed)
+        if changed:
+            pipe.hmset(tables_key, {name: json.dumps(t) for name, t in zip(changed_names, changed)})
+            pipe.hmset(versions_key, {name: versions[name] for name in changed_names})
+            pipe.zadd(names_key, **{name.encode('utf-8'): 0 for name in changed_names})
+        if new_entries - stale_entries:
+            pipe.zadd(index_key, **{entry: 0 for entry in new_entries - stale_entries})
+        pipe.setnx(revision_key, 0)
+        if changed or removed:
+            pipe.incr(revision_key)
+        pipe.execute()
+
+        return len(changed) + len(removed)
+
+    def _resized_tables(self, query_runner, table_names):
+        if not table_names:
+            return []
+
+        sizes = query_runner.get_table_sizes(table_names)
+        resized = []
+        for name, table in zip(table_names, redis_connection.hmget(self._schema_key('tables'), table_names)):
+            if table is None or name not in sizes:
+                continue
+            table = json.loads(table)
+            if table.get('size') != sizes[name]:
+                table['size'] = sizes[name]
+                resized.append(table)
+
+        return resized
 
-        return schema
+    @staticmethod
+    def _pause_key_for(data_source_id):
+        return 'ds:{}:pause'.format(data_source_id)
 
     def _pause_key(self):
-        return 'ds:{}:pause'.format(self.id)
+        return self._pause_key_for(self.id)
+
+    @classmethod
+    def pause_reasons(cls, data_source_ids):
+        """
+        Returns a dict of data source id -> pause reason for the paused data sources among data_source_ids, using a
+        single Redis round trip.
+        """
+        data_source_ids = list(data_source_ids)
+        if not data_source_ids:
+            return {}
+
+        reasons = redis_connection.mget([cls._pause_key_for(ds_id) for ds_id in data_source_ids])
+        return {ds_id: reason for ds_id, reason in zip(data_source_ids, reasons) if reason is not None}
 
     @property
     def paused(self):
@@ -554,6 +818,8 @@ class DataSource(BelongsToOrgMixin, BaseModel):
 
     def remove_group(self, group):
         DataSourceGroup.delete().where(DataSourceGroup.group==group, DataSourceGroup.data_source==self).execute()
+        data_source_groups_cache.invalidate(self.id)
+        Dashboard.invalidate_permissions_cache()
 
     def update_group_permission(self, group, view_only):
         dsg = DataSourceGroup.get(DataSourceGroup.group==group, DataSourceGroup.data_source==self)
@@ -576,8 +842,36 @@ class DataSource(BelongsToOrgMixin, BaseModel):
 
     @property
     def groups(self):
-        groups = DataSourceGroup.select().where(DataSourceGroup.data_source==self)
-        return dict(map(lambda g: (g.group_id, g.view_only), groups))
+        groups = data_source_groups_cache.get(self.id)
+        if groups is None:
+            generation = data_source_groups_cache.generation(self.id)
+            groups = DataSourceGroup.select().where(DataSourceGroup.data_source==self)
+            groups = dict(map(lambda g: (g.group_id, g.view_only), groups))
+            data_source_groups_cache.set(self.id, groups, generation)
+
+        return groups
+
+    @classmethod
+    def groups_for(cls, data_source_ids):
+        """Returns {data source id: groups} for several data sources, loading the uncached ones with one query."""
+        result = {}
+        for data_source_id in set(data_source_ids):
+            result[data_source_id] = data_source_groups_cache.get(data_source_id)
+
+        missing = [data_source_id for data_source_id, groups in result.iteritems() if groups is None]
+        if missing:
+            generations = {}
+            for data_source_id in missing:
+                result[data_source_id] = {}
+                generations[data_source_id] = data_source_groups_cache.generation(data_source_id)
+
+            for dsg in DataSourceGroup.select().where(DataSourceGroup.data_source << missing):
+                result[dsg.data_source_id][dsg.group_id] = dsg.view_only
+
+            for data_source_id in missing:
+                data_source_groups_cache.set(data_source_id, result[data_source_id], generations[data_source_id])
+
+        return result
 
 
 class DataSourceGroup(BaseModel):
@@ -588,6 +882,15 @@ class DataSourceGroup(BaseModel):
     class Meta:
         db_table = "data_source_groups"
 
+    def post_save(self, created):
+        super(DataSourceGroup, self).post_save(created)
+        data_source_groups_cache.invalidate(self.data_source_id)
+        Dashboard.invalidate_permissions_cache()
+
+
+# query result id -> when it stops being served from a parameterized results cache, see Query.cache_parameterized_result.
+PARAMETERIZED_RESULTS_RELEASED_KEY = 'query_results:parameterized:released'
+
 
 class QueryResult(BaseModel, BelongsToOrgMixin):
     id = peewee.PrimaryKeyField()
@@ -602,17 +905,33 @@ class QueryResult(BaseModel, BelongsToOrgMixin):
     class Meta:
         db_table = 'query_results'
 
-    def to_dict(self):
-        return {
+    def to_dict(self, with_data=True):
+        result = {
             'id': self.id,
             'query_hash': self.query_hash,
             'query': self.query,
-            'data': json.loads(self.data),
             'data_source_id': self.data_source_id,
             'runtime': self.runtime,
             'retrieved_at': self.retrieved_at
         }
 
+        if with_data:
+            result['data'] = json.loads(self.data)
+
+        return result
+
+    def to_json(self):
+        """The body of the query result's API response, as UTF-8 encoded JSON."""
+        # The data is JSON already, so it's spliced in rather than parsed and serialized again.
+        envelope = json_dumps({'query_result': self.to_dict(with_data=False)})
+        data = self.data.encode('utf-8') if isinstance(self.data, unicode) else self.data
+        return '{}, "data": {}}}}}'.format(envelope[:-2], data)
+
+    @classmethod
+    def get_by_id_and_org(cls, object_id, org, with_data=True):
+        fields = [f for f in cls._meta.get_fields() if with_data or f is not cls.data]
+        return cls.select(*fields).where(cls.id == object_id, cls.org == org).get()
+
     @classmethod
     def unused(cls, days=7):
         age_threshold = datetime.datetime.now() - datetime.timedelta(days=days)
@@ -622,6 +941,24 @@ class QueryResult(BaseModel, BelongsToOrgMixin):
 
         return unused_results
 
+    @classmethod
+    def delete_released_parameterized(cls, limit):
+        """
+        Deletes up to limit results that stopped being served from the parameterized results cache (see
+        Query.cache_parameterized_result) more than PARAMETERIZED_RESULTS_CLEANUP_DELAY seconds ago, unless a query
+        links to them. Returns the number of deleted results.
+        """
+        cutoff = time.time() - settings.PARAMETERIZED_RESULTS_CLEANUP_DELAY
+        ids = [int(i) for i in redis_connection.zrangebyscore(PARAMETERIZED_RESULTS_RELEASED_KEY, '-inf', cutoff,
+                                                              start=0, num=limit)]
+        if not ids:
+            return 0
+
+        latest_results = Query.select(Query.latest_query_data).where(Query.latest_query_data << ids)
+        deleted = cls.delete().where(cls.id << ids, ~(cls.id << latest_results)).execute()
+        redis_connection.zrem(PARAMETERIZED_RESULTS_RELEASED_KEY, *ids)
+        return deleted
+
     @classmethod
     def get_latest(cls, data_source, query, max_age=0):
         query_hash = utils.gen_query_hash(query)
@@ -648,6 +985,9 @@ class QueryResult(BaseModel, BelongsToOrgMixin):
 
         logging.info("Inserted query (%s) data; id=%s", query_hash, query_result.id)
 
+        if settings.QUERY_RESULTS_PRECOMPRESS:
+            CompressedQueryResult.store(query_result)
+
         sql = "UPDATE queries SET latest_query_data_id = %s WHERE query_hash = %s AND data_source_id = %s RETURNING id"
         query_ids = [row[0] for row in db.database.execute_sql(sql, params=(query_result.id, query_hash, data_source_id))]
 
@@ -658,6 +998,8 @@ class QueryResult(BaseModel, BelongsToOrgMixin):
 
         logging.info("Updated %s queries with result (%s).", len(query_ids), query_hash)
 
+        Dashboard.invalidate_cache_for_queries(query_ids)
+
         return query_result, query_ids
 
     def __unicode__(self):
@@ -668,6 +1010,28 @@ class QueryResult(BaseModel, BelongsToOrgMixin):
         return self.data_source.groups
 
 
+class CompressedQueryResult(BaseModel):
+    """A query result's API response, gzipped once when the result is stored, to be served as is."""
+    query_result = peewee.ForeignKeyField(QueryResult, primary_key=True, on_delete='CASCADE')
+    body = peewee.BlobField()
+
+    class Meta:
+        db_table = 'query_results_compressed'
+
+    @classmethod
+    def store(cls, query_result):
+        body = compression.gzip_compress(query_result.to_json(), settings.COMPRESS_LEVEL)
+        return cls.create(query_result=query_result, body=body)
+
+    @classmethod
+    def get_body(cls, query_result_id):
+        compressed = cls.select(cls.body).where(cls.query_result == query_result_id).first()
+        if compressed is None:
+            return None
+
+        return str(compressed.body)
+
+
 def should_schedule_next(previous_iteration, now, schedule):
     if schedule.isdigit():
         ttl = int(schedule)
@@ -708,6 +1072,9 @@ class Query(ChangeTrackingMixin, ModelTimestampsMixin, BaseVersionedModel, Belon
 
     class Meta:
         db_table = 'queries'
+        indexes = (
+            (('created_at', 'id'), False),
+        )
 
     def to_dict(self, with_stats=False, with_visualizations=False, with_user=True, with_last_modified_by=True):
         d = {
@@ -748,6 +1115,26 @@ class Query(ChangeTrackingMixin, ModelTimestampsMixin, BaseVersionedModel, Belon
 
         return d
 
+    @classmethod
+    def prefetch_users(cls, queries):
+        """Loads the user and last_modified_by of all the given queries with a single query (used by to_dict)."""
+        user_ids = set()
+        for query in queries:
+            user_ids.add(query.user_id)
+            if query.last_modified_by_id is not None:
+                user_ids.add(query.last_modified_by_id)
+
+        if not user_ids:
+            return
+
+        users = dict((u.id, u) for u in User.select().where(User.id << list(user_ids)))
+
+        for query in queries:
+            if query.user_id in users:
+                query._obj_cache['user'] = users[query.user_id]
+            if query.last_modified_by_id in users:
+                query._obj_cache['last_modified_by'] = users[query.last_modified_by_id]
+
     def archive(self, user=None):
         self.is_archived = True
         self.schedule = None
@@ -763,14 +1150,17 @@ class Query(ChangeTrackingMixin, ModelTimestampsMixin, BaseVersionedModel, Belon
 
     @classmethod
     def all_queries(cls, groups, drafts=False):
+        # An EXISTS check (rather than joining the data source groups and grouping the duplicates away) lets the
+        # database walk the (created_at, id) index and stop after a page.
+        accessible = DataSourceGroup.select(peewee.SQL('1'))\
+            .where(DataSourceGroup.data_source == Query.data_source, DataSourceGroup.group << groups)
+
         q = Query.select(Query, User, QueryResult.retrieved_at, QueryResult.runtime)\
             .join(QueryResult, join_type=peewee.JOIN_LEFT_OUTER)\
             .switch(Query).join(User)\
-            .join(DataSourceGroup, on=(Query.data_source==DataSourceGroup.data_source))\
             .where(Query.is_archived==False)\
-            .where(DataSourceGroup.group << groups)\
-            .group_by(Query.id, User.id, QueryResult.id, QueryResult.retrieved_at, QueryResult.runtime)\
-            .order_by(cls.created_at.desc())
+            .where(peewee.fn.EXISTS(accessible))\
+            .order_by(cls.created_at.desc(), cls.id.desc())
 
         if drafts:
             q = q.where(Query.is_draft == True)
@@ -783,12 +1173,15 @@ class Query(ChangeTrackingMixin, ModelTimestampsMixin, BaseVersionedModel, Belon
         return cls.all_queries(user.groups, drafts).where(Query.user==user)
 
     @classmethod
-    def outdated_queries(cls):
+    def outdated_queries(cls, shard=0, shards=1):
         queries = cls.select(cls, QueryResult.retrieved_at, DataSource)\
             .join(QueryResult)\
             .switch(Query).join(DataSource)\
             .where(cls.schedule != None)
 
+        if shards > 1:
+            queries = queries.where(peewee.fn.MOD(cls.id, shards) == shard)
+
         now = utils.utcnow()
         outdated_queries = {}
         for query in queries:
@@ -799,49 +1192,74 @@ class Query(ChangeTrackingMixin, ModelTimestampsMixin, BaseVersionedModel, Belon
         return outdated_queries.values()
 
     @classmethod
-    def search(cls, term, groups):
-        # TODO: This is very naive implementation of search, to be replaced with PostgreSQL full-text-search solution.
+    def create_table(cls, *args, **kwargs):
+        super(Query, cls).create_table(*args, **kwargs)
+        cls.create_search_vector()
 
-        where = (cls.name**u"%{}%".format(term)) | (cls.description**u"%{}%".format(term))
+    @classmethod
+    def create_search_vector(cls):
+        """
+        Adds the full text search column with its GIN index. The column is maintained by a trigger and isn't part of
+        the model, so it's neither loaded with queries nor tracked as a change.
+        """
+        db.database.execute_sql("""
+            ALTER TABLE queries ADD COLUMN search_vector tsvector;
+
+            CREATE OR REPLACE FUNCTION queries_search_vector_update() RETURNS trigger AS $$
+            BEGIN
+                NEW.search_vector :=
+                    setweight(to_tsvector('simple', coalesce(NEW.name, '')), 'A') ||
+                    setweight(to_tsvector('simple', coalesce(NEW.description, '')), 'B') ||
+                    setweight(to_tsvector('simple', coalesce(NEW.query, '')), 'C');
+                RETURN NEW;
+            END
+            $$ LANGUAGE plpgsql;
+
+            CREATE TRIGGER queries_search_vector_update BEFORE INSERT OR UPDATE OF name, description, query
+                ON queries FOR EACH ROW EXECUTE PROCEDURE queries_search_vector_update();
+
+            CREATE INDEX queries_search_vector ON queries USING gin(search_vector);
+        """)
 
-        if term.isdigit():
-            where |= cls.id == term
+    @classmethod
+    def search(cls, term, groups, limit=100):
+        # Every word of the term has to prefix a word of the name or the description (or of the query text, with
+        # QUERY_SEARCH_INCLUDE_QUERY_TEXT); names weigh the most in the ranking.
+        weights = 'ABC' if settings.QUERY_SEARCH_INCLUDE_QUERY_TEXT else 'AB'
+        words = re.findall(r'[^\W_]+', term, re.UNICODE)
+        ts_query = u' & '.join(u"'{}':*{}".format(word.lower(), weights) for word in words)
+
+        where = None
+        rank = peewee.SQL('0')
+        if ts_query:
+            where = peewee.SQL("search_vector @@ to_tsquery('simple', %s)", ts_query)
+            rank = peewee.SQL("ts_rank(search_vector, to_tsquery('simple', %s))", ts_query)
 
-        where &= cls.is_archived == False
+        if term.isdigit():
+            where = (cls.id == term) if where is None else (where | (cls.id == term))
 
-        query_ids = cls.select(peewee.fn.Distinct(cls.id))\
-            .join(DataSourceGroup, on=(Query.data_source==DataSourceGroup.data_source)) \
-            .where(where) \
-            .where(DataSourceGroup.group << groups)
+        if where is None:
+            return cls.select(Query, User).join(User).where(peewee.SQL('false'))
 
-        return cls.select(Query, User).join(User).where(cls.id << query_ids)
+        accessible = DataSourceGroup.select(peewee.SQL('1'))\
+            .where(DataSourceGroup.data_source == cls.data_source, DataSourceGroup.group << groups)
 
+        return cls.select(Query, User).join(User)\
+            .where(where, cls.is_archived == False, peewee.fn.EXISTS(accessible))\
+            .order_by(rank.desc(), cls.id.desc())\
+            .limit(limit)
 
     @classmethod
-    def recent(cls, groups, user_id=None, limit=20):
-        query = (
-            cls.select(Query, User)
-            .where(Event.created_at > peewee.SQL("current_date - 7"))
-            .join(Event, on=(Query.id == Event.object_id.cast('integer')))
-            .join(DataSourceGroup, on=(Query.data_source==DataSourceGroup.data_source))
-            .switch(Query).join(User)
-            .where(Event.action << ('edit', 'execute', 'edit_name',
-                                    'edit_description', 'toggle_published',
-                                    'view_source'))
-            .where(~(Event.object_id >> None))
-            .where(Event.object_type == 'query')
-            .where(DataSourceGroup.group << groups)
-            .where(cls.is_archived == False)
-            .where(cls.is_draft == False)
-            .group_by(Event.object_id, Query.id, User.id)
-            .order_by(peewee.SQL("count(0) desc")))
-
-        if user_id:
-            query = query.where(Event.user == user_id)
+    def recent(cls, org, groups, user_id=None, limit=20):
+        def load(query_ids):
+            accessible = DataSourceGroup.select(peewee.SQL('1'))\
+                .where(DataSourceGroup.data_source == cls.data_source, DataSourceGroup.group << groups)
 
-        query = query.limit(limit)
+            return cls.select(Query, User).join(User)\
+                .where(cls.id << query_ids, cls.org == org, cls.is_archived == False, cls.is_draft == False,
+                       peewee.fn.EXISTS(accessible))
 
-        return query
+        return Event.recent_objects(_org_id(org), 'query', user_id, limit, load)
 
     def fork(self, user):
         query = self
@@ -868,6 +1286,134 @@ class Query(ChangeTrackingMixin, ModelTimestampsMixin, BaseVersionedModel, Belon
                 Visualization.insert_many(forked_visualizations).execute()
         return forked_query
 
+    @staticmethod
+    def parameters_hash(data_source_id, query_text, parameter_values):
+        """
+        Identifies a query text run on a data source with a set of values for its parameters, in the parameterized
+        results cache.
+        """
+        if isinstance(query_text, str):
+            query_text = query_text.decode('utf-8')
+
+        parameters = project(parameter_values, utils.collect_query_parameters(query_text))
+        normalized = sorted((unicode(name), unicode(value)) for name, value in parameters.iteritems())
+        return hashlib.md5(json.dumps([data_source_id, utils.gen_query_hash(query_text), normalized])).hexdigest()
+
+    def _parameterized_results_keys(self):
+        key = 'query:{}:parameterized_results'.format(self.id)
+        return key, '{}:lru'.format(key)
+
+    @property
+    def parameterized_results_ttl(self):
+        if not self.schedule:
+            return settings.PARAMETERIZED_RESULTS_CACHE_TTL
+
+        if self.schedule.isdigit():
+            return int(self.schedule)
+
+        # Refreshed daily, at a given time.
+        return 24 * 3600
+
+    def get_parameterized_result(self, parameters_hash, max_age=-1):
+        """
+        The cached result of the query run with the parameter values of parameters_hash, if there's one that's younger
+        than both its TTL and max_age seconds (-1 for any age).
+        """
+        entries_key, lru_key = self._parameterized_results_keys()
+        entry = redis_connection.hget(entries_key, parameters_hash)
+
+        query_result = None
+        if entry is not None:
+            entry = json.loads(entry)
+            age = time.time() - entry['retrieved_at']
+            if age <= self.parameterized_results_ttl and (max_age == -1 or age <= max_age):
+                query_result = QueryResult.select().where(QueryResult.id == entry['query_result_id']).first()
+
+        if query_result is not None and query_result.data_source_id != self.data_source_id:
+            query_result = None
+
+        if query_result is None:
+            statsd_client.incr('query_results.parameterized_cache.miss')
+            return None
+
+        statsd_client.incr('query_results.parameterized_cache.hit')
+        redis_connection.zadd(lru_key, time.time(), parameters_hash)
+        return query_result
+
+    def cache_parameterized_result(self, parameters_hash, query_result):
+        """
+        Caches a result of the query run with parameters (on its own data source). Evicts the expired results and then
+        the least recently used ones over the query's budget.
+
+        Every cached result is recorded with the time it stops being served (when it expires, or earlier when evicted
+        or replaced), for QueryResult.delete_released_parameterized to delete it a little after that, rather than
+        keeping it until the unused results cleanup.
+        """
+        if query_result.data_source_id != self.data_source_id:
+            return
+
+        entries_key, lru_key = self._parameterized_results_keys()
+        ttl = self.parameterized_results_ttl
+        budget = settings.PARAMETERIZED_RESULTS_CACHE_BUDGET * 1024 * 1024
+
+        # Other workers might cache results of the same query meanwhile: the eviction is redone if they did.
+        try_count = 0
+        while try_count < 5:
+            try_count += 1
+            pipe = redis_connection.pipeline()
+            try:
+                pipe.watch(entries_key, lru_key)
+                now = time.time()
+
+                entries = {k: json.loads(v) for k, v in pipe.hgetall(entries_key).iteritems()}
+                replaced = entries.pop(parameters_hash, None)
+                entry = {'query_result_id': query_result.id, 'retrieved_at': now, 'size': len(query_result.data or '')}
+
+                # Least recently used first (entries missing from the LRU list, if any, before all).
+                used = [k for k in pipe.zrange(lru_key, 0, -1) if k in entries]
+                order = [k for k in set(entries) - set(used)] + used
+
+                evicted = [k for k in order if now - entries[k]['retrieved_at'] > ttl]
+                remaining = [k for k in order if now - entries[k]['retrieved_at'] <= ttl]
+                count = len(remaining) + 1
+                size = sum(entries[k]['size'] for k in remaining) + entry['size']
+                for k in remaining:
+                    if count <= settings.PARAMETERIZED_RESULTS_CACHE_SIZE and size <= budget:
+                        break
+
+                    evicted.append(k)
+                    count -= 1
+                    size -= entries[k]['size']
+
+                released = [entries[k]['query_result_id'] for k in evicted]
+                if replaced is not None and replaced['query_result_id'] != query_result.id:
+                    released.append(replaced['query_result_id'])
+
+                pipe.multi()
+                pipe.hset(entries_key, parameters_hash, json.dumps(entry))
+                pipe.zadd(lru_key, now, parameters_hash)
+                if evicted:
+                    pipe.hdel(entries_key, *evicted)
+                    pipe.zrem(lru_key, *evicted)
+                # Once the last added result expires, all of them have.
+                pipe.expire(entries_key, ttl)
+                pipe.expire(lru_key, ttl)
+                pipe.zadd(PARAMETERIZED_RESULTS_RELEASED_KEY, now + ttl, query_result.id)
+                for query_result_id in released:
+                    pipe.zadd(PARAMETERIZED_RESULTS_RELEASED_KEY, now, query_result_id)
+                pipe.execute()
+                break
+            except redis.WatchError:
+                continue
+            finally:
+                pipe.reset()
+        else:
+            logging.warning("Failed caching result %s of query %s.", query_result.id, self.id)
+            return
+
+        if evicted:
+            statsd_client.incr('query_results.parameterized_cache.evicted', len(evicted))
+
     def pre_save(self, created):
         super(Query, self).pre_save(created)
         self.query_hash = utils.gen_query_hash(self.query)
@@ -879,6 +1425,8 @@ class Query(ChangeTrackingMixin, ModelTimestampsMixin, BaseVersionedModel, Belon
     def post_save(self, created):
         if created:
             self._create_default_visualizations()
+        else:
+            Dashboard.invalidate_cache_for_queries([self.id])
 
     def update_instance_tracked(self, changing_user, old_object=None, *args, **kwargs):
         self.version += 1
@@ -1112,23 +1660,31 @@ class Dashboard(ChangeTrackingMixin, ModelTimestampsMixin, BaseVersionedModel, B
 
     class Meta:
         db_table = 'dashboards'
+        indexes = (
+            (('created_at', 'id'), False),
+        )
 
     def to_dict(self, with_widgets=False, user=None):
         layout = json.loads(self.layout)
 
         if with_widgets:
-            widget_list = Widget.select(Widget, Visualization, Query, User)\
+            # Widgets come with their visualizations and queries; the queries' users and data source groups are
+            # then loaded with one query each, so the number of queries doesn't grow with the number of widgets.
+            widget_list = list(Widget.select(Widget, Visualization, Query)\
                 .where(Widget.dashboard == self.id)\
                 .join(Visualization, join_type=peewee.JOIN_LEFT_OUTER)\
-                .join(Query, join_type=peewee.JOIN_LEFT_OUTER)\
-                .join(User, join_type=peewee.JOIN_LEFT_OUTER)
+                .join(Query, join_type=peewee.JOIN_LEFT_OUTER))
+
+            queries = [w.visualization.query for w in widget_list if w.visualization_id is not None]
+            Query.prefetch_users(queries)
+            groups = DataSource.groups_for([q.data_source_id for q in queries if q.data_source_id is not None])
 
             widgets = {}
 
             for w in widget_list:
                 if w.visualization_id is None:
                     widgets[w.id] = w.to_dict()
-                elif user and has_access(w.visualization.query.groups, user, view_only):
+                elif user and has_access(groups.get(w.visualization.query.data_source_id, {}), user, view_only):
                     widgets[w.id] = w.to_dict()
                 else:
                     widgets[w.id] = project(w.to_dict(),
@@ -1189,35 +1745,83 @@ class Dashboard(ChangeTrackingMixin, ModelTimestampsMixin, BaseVersionedModel, B
 
     @classmethod
     def recent(cls, org, groups, user_id, for_user=False, limit=20):
-        query = cls.select().where(Event.created_at > peewee.SQL("current_date - 7")). \
-            join(Event, peewee.JOIN_LEFT_OUTER, on=(Dashboard.id == Event.object_id.cast('integer'))). \
-            join(Widget, peewee.JOIN_LEFT_OUTER, on=(Dashboard.id == Widget.dashboard)). \
-            join(Visualization, peewee.JOIN_LEFT_OUTER, on=(Widget.visualization == Visualization.id)). \
-            join(Query, peewee.JOIN_LEFT_OUTER, on=(Visualization.query == Query.id)). \
-            join(DataSourceGroup, peewee.JOIN_LEFT_OUTER, on=(Query.data_source == DataSourceGroup.data_source)). \
-            where(Event.action << ('edit', 'view')). \
-            where(~(Event.object_id >> None)). \
-            where(Event.object_type == 'dashboard'). \
-            where(Dashboard.is_archived == False). \
-            where(Dashboard.is_draft == False). \
-            where(Dashboard.org == org). \
-            where((DataSourceGroup.group << groups) |
-                  (Dashboard.user == user_id) |
-                  (~(Widget.dashboard >> None) & (Widget.visualization >> None))). \
-            group_by(Event.object_id, Dashboard.id). \
-            order_by(peewee.SQL("count(0) desc"))
-
-        if for_user:
-            query = query.where(Event.user == user_id)
-
-        query = query.limit(limit)
-
-        return query
+        def load(dashboard_ids):
+            return cls.select() \
+                .join(Widget, peewee.JOIN_LEFT_OUTER, on=(Dashboard.id == Widget.dashboard)) \
+                .join(Visualization, peewee.JOIN_LEFT_OUTER, on=(Widget.visualization == Visualization.id)) \
+                .join(Query, peewee.JOIN_LEFT_OUTER, on=(Visualization.query == Query.id)) \
+                .join(DataSourceGroup, peewee.JOIN_LEFT_OUTER, on=(Query.data_source == DataSourceGroup.data_source)) \
+                .where(Dashboard.id << dashboard_ids) \
+                .where(Dashboard.is_archived == False) \
+                .where(Dashboard.is_draft == False) \
+                .where(Dashboard.org == org) \
+                .where((DataSourceGroup.group << groups) |
+                       (Dashboard.user == user_id) |
+                       (~(Widget.dashboard >> None) & (Widget.visualization >> None))) \
+                .group_by(Dashboard.id)
+
+        return Event.recent_objects(_org_id(org), 'dashboard', user_id if for_user else None, limit, load)
 
     @classmethod
     def get_by_slug_and_org(cls, slug, org):
         return cls.get(cls.slug == slug, cls.org==org)
 
+    @staticmethod
+    def _generation_key(dashboard_id):
+        return 'dashboard:{}:generation'.format(dashboard_id)
+
+    def to_dict_cached(self, user):
+        """
+        Same as to_dict(with_widgets=True, user=user), cached in Redis. The cache key holds the dashboard's version,
+        a generation counter bumped whenever anything the dashboard shows changes (see invalidate_cache), and a
+        fingerprint of what decides which widgets the user has access to.
+        """
+        if settings.DASHBOARD_CACHE_TTL <= 0:
+            return self.to_dict(with_widgets=True, user=user)
+
+        generation, permissions_generation = redis_connection.mget(self._generation_key(self.id),
+                                                                   'dashboards:permissions_generation')
+        fingerprint = hashlib.md5(json.dumps(['admin' in user.permissions, sorted(user.groups)])).hexdigest()
+        key = 'dashboard:{}:{}:{}:{}:{}'.format(self.id, self.version, generation or 0, permissions_generation or 0,
+                                                fingerprint)
+
+        cached = redis_connection.get(key)
+        if cached is not None:
+            statsd_client.incr('dashboards.cache.hit')
+            return json.loads(cached)
+
+        statsd_client.incr('dashboards.cache.miss')
+        result = self.to_dict(with_widgets=True, user=user)
+        redis_connection.setex(key, settings.DASHBOARD_CACHE_TTL, json_dumps(result))
+
+        return result
+
+    @classmethod
+    def invalidate_cache(cls, dashboard_ids):
+        pipe = redis_connection.pipeline()
+        for dashboard_id in set(dashboard_ids):
+            pipe.incr(cls._generation_key(dashboard_id))
+        pipe.execute()
+
+    @classmethod
+    def invalidate_cache_for_queries(cls, query_ids):
+        if not query_ids:
+            return
+
+        widgets = Widget.select(Widget.dashboard).join(Visualization)\
+            .where(Visualization.query << query_ids).distinct()
+        cls.invalidate_cache([w.dashboard_id for w in widgets])
+
+    @classmethod
+    def invalidate_permissions_cache(cls):
+        # Data source groups decide which widgets are restricted, for every dashboard using the data source.
+        redis_connection.incr('dashboards:permissions_generation')
+
+    def post_save(self, created):
+        super(Dashboard, self).post_save(created)
+        if not created:
+            Dashboard.invalidate_cache([self.id])
+
     def tracked_save(self, changing_user, old_object=None, *args, **kwargs):
         self.version += 1
         self.save(*args, **kwargs)
@@ -1272,6 +1876,19 @@ class Visualization(ModelTimestampsMixin, BaseModel):
         return cls.select(Visualization, Query).join(Query).where(cls.id == visualization_id,
                                                                   Query.org == org).get()
 
+    def _invalidate_dashboards(self):
+        Dashboard.invalidate_cache([w.dashboard_id for w in Widget.select(Widget.dashboard)
+                                   .where(Widget.visualization == self.id)])
+
+    def post_save(self, created):
+        super(Visualization, self).post_save(created)
+        if not created:
+            self._invalidate_dashboards()
+
+    def delete_instance(self, *args, **kwargs):
+        self._invalidate_dashboards()
+        return super(Visualization, self).delete_instance(*args, **kwargs)
+
     def __unicode__(self):
         return u"%s %s" % (self.id, self.type)
 
@@ -1314,6 +1931,10 @@ class Widget(ModelTimestampsMixin, BaseModel):
     def get_by_id_and_org(cls, widget_id, org):
         return cls.select(cls, Dashboard).join(Dashboard).where(cls.id == widget_id, Dashboard.org == org).get()
 
+    def post_save(self, created):
+        super(Widget, self).post_save(created)
+        Dashboard.invalidate_cache([self.dashboard_id])
+
     def delete_instance(self, *args, **kwargs):
         layout = json.loads(self.dashboard.layout)
         layout = map(lambda row: filter(lambda w: w != self.id, row), layout)
@@ -1335,11 +1956,220 @@ class Event(BaseModel):
     class Meta:
         db_table = 'events'
 
+    # Declarative partitioning (with a default partition and foreign keys) needs PostgreSQL 11.
+    PARTITIONING_MIN_SERVER_VERSION = 110000
+
+    # Actions that count as activity on an object for the recent queries/dashboards lists.
+    RECENT_ACTIVITY_ACTIONS = {
+        'query': ('edit', 'execute', 'edit_name', 'edit_description', 'toggle_published', 'view_source'),
+        'dashboard': ('edit', 'view'),
+    }
+    RECENT_ACTIVITY_DAYS = 7
+
     def __unicode__(self):
         return u"%s,%s,%s,%s" % (self.user_id, self.action, self.object_type, self.object_id)
 
+    @staticmethod
+    def _activity_key(org_id, object_type, day, user_id=None):
+        if user_id is None:
+            return 'activity:{}:{}:{}'.format(org_id, object_type, day.strftime('%Y%m%d'))
+        return 'activity:{}:{}:user:{}:{}'.format(org_id, object_type, user_id, day.strftime('%Y%m%d'))
+
     @classmethod
-    def record(cls, event):
+    def count_activity(cls, pipe, org_id, user_id, object_type, object_id, day, count=1):
+        """Adds to the daily activity rollups (of the organization and of the user) read by recent_object_ids."""
+        # Buckets are kept a day longer than needed, so the oldest one read is never expired.
+        expires_in = (cls.RECENT_ACTIVITY_DAYS + 2) * 24 * 3600
+
+        keys = [cls._activity_key(org_id, object_type, day)]
+        if user_id is not None:
+            keys.append(cls._activity_key(org_id, object_type, day, user_id))
+
+        for key in keys:
+            pipe.zincrby(key, object_id, count)
+            pipe.expire(key, expires_in)
+
+    def _count_activity(self, pipe):
+        if self.object_id and self.action in self.RECENT_ACTIVITY_ACTIONS.get(self.object_type, ()):
+            Event.count_activity(pipe, self.org_id, self._data.get('user'), self.object_type, self.object_id,
+                                 self.created_at.date())
+
+    def post_save(self, created):
+        super(Event, self).post_save(created)
+        if created:
+            EventDailyCount.add([self])
+            pipe = redis_connection.pipeline()
+            self._count_activity(pipe)
+            pipe.execute()
+
+    @classmethod
+    def rebuild_activity(cls):
+        """
+        Rebuilds the recent activity rollups in Redis (see count_activity) from the daily event counts, in case Redis
+        lost them.
+        """
+        since = datetime.date.today() - datetime.timedelta(days=cls.RECENT_ACTIVITY_DAYS)
+        counts = EventDailyCount.select().where(EventDailyCount.day >= since, EventDailyCount.object_id != '')
+
+        scores = {}
+        for c in counts:
+            if c.action not in cls.RECENT_ACTIVITY_ACTIONS.get(c.object_type, ()):
+                continue
+            keys = [cls._activity_key(c.org_id, c.object_type, c.day)]
+            if c.user_id:
+                keys.append(cls._activity_key(c.org_id, c.object_type, c.day, c.user_id))
+            for key in keys:
+                members = scores.setdefault(key, {})
+                members[c.object_id] = members.get(c.object_id, 0) + c.count
+
+        expires_in = (cls.RECENT_ACTIVITY_DAYS + 2) * 24 * 3600
+        pipe = redis_connection.pipeline()
+        for key, members in scores.iteritems():
+            pipe.delete(key)
+            pipe.zadd(key, **members)
+            pipe.expire(key, expires_in)
+        pipe.set('activity:built', 1)
+        pipe.execute()
+
+    @classmethod
+    def create_table(cls, fail_silently=False):
+        if fail_silently and cls.table_exists():
+            return
+
+        if db.database.get_conn().server_version < cls.PARTITIONING_MIN_SERVER_VERSION:
+            return super(Event, cls).create_table(fail_silently)
+
+        # Partitioned by month on created_at, which then has to be part of the primary key.
+        sql, params = db.database.compiler().create_table(cls)
+        sql = sql.replace('"id" SERIAL NOT NULL PRIMARY KEY', '"id" SERIAL NOT NULL')
+        sql = sql[:-1] + ', PRIMARY KEY ("id", "created_at")) PARTITION BY RANGE ("created_at")'
+        db.database.execute_sql(sql, params)
+        cls._create_indexes()
+
+        # Catches events outside of the monthly partitions (like ones with a wrong clock).
+        db.database.execute_sql('CREATE TABLE events_default PARTITION OF events DEFAULT')
+        cls.create_partitions()
+
+    @classmethod
+    def is_partitioned(cls):
+        cursor = db.database.execute_sql("SELECT relkind FROM pg_class WHERE oid = 'events'::regclass")
+        return cursor.fetchone()[0] == 'p'
+
+    @staticmethod
+    def _month(date, months_later=0):
+        month = date.month - 1 + months_later
+        return datetime.date(date.year + month // 12, month % 12 + 1, 1)
+
+    @classmethod
+    def partitions(cls):
+        """Monthly partitions of the events table, as a dict of partition name -> first day of the month."""
+        cursor = db.database.execute_sql("SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+                                         "WHERE i.inhparent = 'events'::regclass")
+        names = [row[0] for row in cursor if re.match(r'^events_\d{4}_\d{2}$', row[0])]
+        return {name: datetime.date(int(name[7:11]), int(name[12:14]), 1) for name in names}
+
+    @classmethod
+    def create_partitions(cls, since=None):
+        """Creates the missing monthly partitions, from since's month (default: this month) to the next month."""
+        today = datetime.date.today()
+        month = cls._month(since or today)
+        existing = set(cls.partitions().values())
+
+        while month <= cls._month(today, 1):
+            if month not in existing:
+                cls._create_partition(month)
+            month = cls._month(month, 1)
+
+    @classmethod
+    def _create_partition(cls, month):
+        name = 'events_{:%Y_%m}'.format(month)
+        bounds = (month, cls._month(month, 1))
+
+        with db.database.atomic():
+            cursor = db.database.execute_sql('SELECT 1 FROM events_default WHERE created_at >= %s AND created_at < %s '
+                                             'LIMIT 1', bounds)
+            if cursor.fetchone() is None:
+                db.database.execute_sql('CREATE TABLE {} PARTITION OF events FOR VALUES FROM (%s) TO (%s)'
+                                        .format(name), bounds)
+                return
+
+            # Postgres refuses to create a partition for a range the default partition has events in, so those are
+            # moved to the new table before attaching it.
+            db.database.execute_sql('CREATE TABLE {} (LIKE events INCLUDING DEFAULTS INCLUDING CONSTRAINTS)'
+                                    .format(name))
+            db.database.execute_sql('WITH moved AS (DELETE FROM events_default WHERE created_at >= %s AND '
+                                    'created_at < %s RETURNING *) INSERT INTO {} SELECT * FROM moved'.format(name),
+                                    bounds)
+            db.database.execute_sql('ALTER TABLE events ATTACH PARTITION {} FOR VALUES FROM (%s) TO (%s)'
+                                    .format(name), bounds)
+
+    @classmethod
+    def delete_older_than(cls, cutoff):
+        """
+        Deletes the events created before cutoff (a date). Whole monthly partitions are dropped; other events are
+        deleted in batches.
+        """
+        deleted = 0
+
+        if cls.is_partitioned():
+            for name, month in cls.partitions().iteritems():
+                if cls._month(month, 1) <= cutoff:
+                    deleted += db.database.execute_sql('SELECT count(*) FROM {}'.format(name)).fetchone()[0]
+                    db.database.execute_sql('DROP TABLE {}'.format(name))
+
+        while True:
+            cursor = db.database.execute_sql('DELETE FROM events WHERE id IN '
+                                             '(SELECT id FROM events WHERE created_at < %s LIMIT 10000)', (cutoff,))
+            deleted += cursor.rowcount
+            if cursor.rowcount < 10000:
+                return deleted
+
+    @classmethod
+    def recent_object_ids(cls, org_id, object_type, user_id=None, offset=0, limit=20):
+        """
+        Ids of the objects with the most activity in the last RECENT_ACTIVITY_DAYS days (of the given user, or of the
+        whole organization), most active first.
+        """
+        today = datetime.date.today()
+        keys = [cls._activity_key(org_id, object_type, today - datetime.timedelta(days=i), user_id)
+                for i in range(cls.RECENT_ACTIVITY_DAYS + 1)]
+        union_key = 'activity:{}:{}:union:{}'.format(org_id, object_type, generate_token(10))
+
+        pipe = redis_connection.pipeline()
+        pipe.zunionstore(union_key, keys)
+        pipe.zrevrange(union_key, offset, offset + limit - 1)
+        pipe.delete(union_key)
+        object_ids = pipe.execute()[1]
+
+        return [int(object_id) for object_id in object_ids if object_id.isdigit()]
+
+    @classmethod
+    def recent_objects(cls, org_id, object_type, user_id, limit, load):
+        """
+        The most active objects for which `load` (given candidate ids, returns the ones that should be listed)
+        returns something, in order. Candidates are fetched in batches, as some might be filtered out.
+        """
+        batch_size = limit * 5
+        objects = []
+        offset = 0
+
+        while len(objects) < limit:
+            object_ids = cls.recent_object_ids(org_id, object_type, user_id, offset, batch_size)
+            if not object_ids:
+                break
+
+            loaded = {o.id: o for o in load(object_ids)}
+            objects.extend(loaded[object_id] for object_id in object_ids if object_id in loaded)
+
+            if len(object_ids) < batch_size:
+                break
+            offset += batch_size
+
+        return objects[:limit]
+
+    @classmethod
+    def _fields(cls, event):
+        event = dict(event)
         org = event.pop('org_id')
         user = event.pop('user_id', None)
         action = event.pop('action')
@@ -1349,10 +2179,103 @@ class Event(BaseModel):
         created_at = datetime.datetime.utcfromtimestamp(event.pop('timestamp'))
         additional_properties = json.dumps(event)
 
-        event = cls.create(org=org, user=user, action=action, object_type=object_type, object_id=object_id,
-                           additional_properties=additional_properties, created_at=created_at)
+        return dict(org=org, user=user, action=action, object_type=object_type, object_id=object_id,
+                    additional_properties=additional_properties, created_at=created_at)
 
-        return event
+    @classmethod
+    def record(cls, event):
+        return cls.create(**cls._fields(event))
+
+    @classmethod
+    def record_many(cls, events):
+        """Like record, for a batch of events: they're inserted with a single statement."""
+        rows = [cls._fields(event) for event in events]
+        if not rows:
+            return
+
+        events = [cls(**row) for row in rows]
+        with db.database.atomic():
+            cls.insert_many(rows).execute()
+            EventDailyCount.add(events)
+
+        pipe = redis_connection.pipeline()
+        for event in events:
+            event._count_activity(pipe)
+        pipe.execute()
+
+
+class EventDailyCount(BaseModel):
+    """Number of events per day, organization, user, action and object, kept up to date as events are recorded."""
+    day = peewee.DateField()
+    org = peewee.ForeignKeyField(Organization)
+    # 0 for events without a user (API keys).
+    user_id = peewee.IntegerField(default=0)
+    action = peewee.CharField()
+    object_type = peewee.CharField()
+    # Empty for events without an object.
+    object_id = peewee.CharField(default='')
+    count = peewee.IntegerField(default=0)
+
+    class Meta:
+        db_table = 'events_daily'
+        indexes = (
+            (('day', 'org', 'user_id', 'action', 'object_type', 'object_id'), True),
+        )
+
+    GROUP_BY_FIELDS = ('day', 'user_id', 'action', 'object_type', 'object_id')
+
+    # INSERT ... ON CONFLICT needs PostgreSQL 9.5.
+    UPSERT_MIN_SERVER_VERSION = 90500
+
+    @classmethod
+    def add(cls, events):
+        counts = collections.Counter((_to_date(e.created_at), e.org_id, e._data.get('user') or 0, e.action,
+                                      e.object_type, e.object_id or '') for e in events)
+        if not counts:
+            return
+
+        # Sorted, so concurrent upserts lock rows in the same order.
+        rows = sorted(counts.iteritems())
+        if db.database.get_conn().server_version < cls.UPSERT_MIN_SERVER_VERSION:
+            for key, count in rows:
+                cls._add_count(key, count)
+            return
+
+        db.database.execute_sql(
+            'INSERT INTO events_daily (day, org_id, user_id, action, object_type, object_id, count) VALUES {} '
+            'ON CONFLICT (day, org_id, user_id, action, object_type, object_id) '
+            'DO UPDATE SET count = events_daily.count + EXCLUDED.count'.format(
+                ', '.join(['(%s, %s, %s, %s, %s, %s, %s)'] * len(rows))),
+            [value for key, count in rows for value in key + (count,)])
+
+    @classmethod
+    def _add_count(cls, key, count):
+        """Upsert of a single count, for servers without ON CONFLICT."""
+        while True:
+            try:
+                with db.database.atomic():
+                    cursor = db.database.execute_sql(
+                        'UPDATE events_daily SET count = count + %s WHERE day = %s AND org_id = %s AND user_id = %s '
+                        'AND action = %s AND object_type = %s AND object_id = %s', (count,) + key)
+                    if cursor.rowcount == 0:
+                        db.database.execute_sql(
+                            'INSERT INTO events_daily (day, org_id, user_id, action, object_type, object_id, count) '
+                            'VALUES (%s, %s, %s, %s, %s, %s, %s)', key + (count,))
+                return
+            except peewee.IntegrityError:
+                # Inserted concurrently, update it instead.
+                continue
+
+    @classmethod
+    def totals(cls, org, since, group_by=('object_type', 'action'), **filters):
+        """Event counts of the organization since the given day, summed by the group_by fields."""
+        fields = [getattr(cls, name) for name in group_by]
+        query = cls.select(*(fields + [peewee.fn.SUM(cls.count).alias('count')]))\
+            .where(cls.org == org, cls.day >= since)
+        for name, value in filters.iteritems():
+            query = query.where(getattr(cls, name) == value)
+
+        return query.group_by(*fields).order_by(peewee.SQL('count').desc()).dicts()
 
 
 class ApiKey(ModelTimestampsMixin, BaseModel):
@@ -1505,7 +2428,7 @@ class QuerySnippet(ModelTimestampsMixin, BaseModel, BelongsToOrgMixin):
         return d
 
 
-all_models = (Organization, Group, DataSource, DataSourceGroup, User, QueryResult, Query, Alert, Dashboard, Visualization, Widget, Event, NotificationDestination, AlertSubscription, ApiKey, AccessPermission, Change)
+all_models = (Organization, Group, DataSource, DataSourceGroup, User, QueryResult, CompressedQueryResult, Query, Alert, Dashboard, Visualization, Widget, Event, EventDailyCount, NotificationDestination, AlertSubscription, ApiKey, AccessPermission, Change)
 
 
 def init_db():
@@ -1516,6 +2439,16 @@ def init_db():
     return default_org, admin_group, default_group
 
 
+def estimate_count(query_set):
+    """The number of rows the query planner expects query_set to return: cheap, but only an estimate."""
+    sql, params = query_set.sql()
+    plan = db.database.execute_sql('EXPLAIN (FORMAT JSON) ' + sql, params).fetchone()[0]
+    if isinstance(plan, basestring):
+        plan = json.loads(plan)
+
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
 def create_db(create_tables, drop_tables):
     db.connect_db()
 
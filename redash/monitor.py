@@ -1,35 +1,177 @@
+"""
+The data behind the status endpoint.
+
+Counting the objects (and the unused query results in particular) is too expensive to do on every call of an endpoint
+health checks poll, so the refresh_status task counts them every STATUS_REFRESH_INTERVAL seconds, along with the size of
+each queue, and get_status serves that snapshot. Workers record their own heartbeats while running.
+"""
+import json
+import logging
+import os
+import threading
+import time
+
+from celery.signals import worker_ready, worker_shutdown
+
 from redash import redis_connection, models, __version__, settings
 
+logger = logging.getLogger(__name__)
 
-def get_status():
-    status = {}
-    info = redis_connection.info()
-    status['redis_used_memory'] = info['used_memory_human']
-    status['version'] = __version__
-    status['queries_count'] = models.Query.select().count()
+STATUS_SNAPSHOT_KEY = 'redash:status:snapshot'
+WORKERS_KEY = 'redash:workers'
+# Workers that haven't recorded a heartbeat for this many seconds (because they were killed) are forgotten.
+WORKER_EXPIRY = 24 * 3600
+
+
+def get_object_counts():
+    counts = {
+        'queries_count': models.Query.select().count(),
+        'dashboards_count': models.Dashboard.select().count(),
+        'widgets_count': models.Widget.select().count()
+    }
     if settings.FEATURE_SHOW_QUERY_RESULTS_COUNT:
-        status['query_results_count'] = models.QueryResult.select().count()
-        status['unused_query_results_count'] = models.QueryResult.unused().count()
-    status['dashboards_count'] = models.Dashboard.select().count()
-    status['widgets_count'] = models.Widget.select().count()
+        counts['query_results_count'] = models.QueryResult.select().count()
+        counts['unused_query_results_count'] = models.QueryResult.unused().count()
 
-    status['workers'] = []
+    return counts
 
-    manager_status = redis_connection.hgetall('redash:status')
-    status['manager'] = manager_status
-    status['manager']['outdated_queries_count'] = len(models.Query.outdated_queries())
 
+def get_queues_status():
     queues = {}
-    for ds in models.DataSource.select():
+    for ds in models.DataSource.select(models.DataSource.name, models.DataSource.queue_name,
+                                       models.DataSource.scheduled_queue_name):
         for queue in (ds.queue_name, ds.scheduled_queue_name):
             queues.setdefault(queue, set())
             queues[queue].add(ds.name)
 
-    status['manager']['queues'] = {}
-    for queue, sources in queues.iteritems():
-        status['manager']['queues'][queue] = {
-            'data_sources': ', '.join(sources),
-            'size': redis_connection.llen(queue)
-        }
+    names = sorted(queues.keys())
+    pipe = redis_connection.pipeline()
+    for queue in names:
+        pipe.llen(queue)
+
+    return {queue: {'data_sources': ', '.join(sorted(queues[queue])), 'size': size}
+            for queue, size in zip(names, pipe.execute())}
+
+
+def refresh_status_snapshot():
+    snapshot = get_object_counts()
+    snapshot['queues'] = get_queues_status()
+    snapshot['updated_at'] = time.time()
+    redis_connection.set(STATUS_SNAPSHOT_KEY, json.dumps(snapshot))
+
+    expired = [hostname for hostname, worker in _load_workers().iteritems()
+               if time.time() - worker['heartbeat_at'] > WORKER_EXPIRY]
+    if expired:
+        redis_connection.hdel(WORKERS_KEY, *expired)
+
+    return snapshot
+
+
+def get_status_snapshot():
+    snapshot = redis_connection.get(STATUS_SNAPSHOT_KEY)
+    if snapshot is None:
+        # Not refreshed yet (like right after an upgrade).
+        return refresh_status_snapshot()
+
+    return json.loads(snapshot)
+
+
+def _load_workers():
+    return {hostname: json.loads(worker) for hostname, worker in redis_connection.hgetall(WORKERS_KEY).iteritems()}
+
+
+def get_workers_status():
+    now = time.time()
+    workers = []
+    for worker in _load_workers().itervalues():
+        since_heartbeat = now - worker['heartbeat_at']
+        if since_heartbeat > WORKER_EXPIRY:
+            continue
+
+        worker['seconds_since_heartbeat'] = since_heartbeat
+        worker['alive'] = since_heartbeat < 3 * settings.WORKER_HEARTBEAT_INTERVAL
+        workers.append(worker)
+
+    return sorted(workers, key=lambda worker: worker['hostname'])
+
+
+def get_status():
+    status = get_status_snapshot()
+    queues = status.pop('queues')
+
+    info = redis_connection.info()
+    status['redis_used_memory'] = info['used_memory_human']
+    status['version'] = __version__
+    status['workers'] = get_workers_status()
+
+    manager_status = redis_connection.hgetall('redash:status')
+    status['manager'] = manager_status
+    # Counted by refresh_queries, on every run.
+    status['manager']['outdated_queries_count'] = int(manager_status.get('outdated_queries_count', 0))
+    status['manager']['queues'] = queues
 
     return status
+
+
+def record_worker_heartbeat(worker):
+    redis_connection.hset(WORKERS_KEY, worker['hostname'], json.dumps(dict(worker, heartbeat_at=time.time())))
+
+
+class WorkerHeartbeat(object):
+    """Records the worker's heartbeat every WORKER_HEARTBEAT_INTERVAL seconds, from a thread of its main process."""
+
+    def __init__(self):
+        self._stopped = threading.Event()
+        self._thread = None
+        self.worker = None
+
+    def start(self, worker):
+        self.worker = worker
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._beat, name='worker-heartbeat')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is None:
+            return
+
+        self._stopped.set()
+        self._thread.join(5)
+        self._thread = None
+        redis_connection.hdel(WORKERS_KEY, self.worker['hostname'])
+
+    def _beat(self):
+        while not self._stopped.is_set():
+            try:
+                record_worker_heartbeat(self.worker)
+            except Exception:
+                logger.exception("Failed recording the worker heartbeat.")
+
+            self._stopped.wait(settings.WORKER_HEARTBEAT_INTERVAL)
+
+
+heartbeat = WorkerHeartbeat()
+
+
+@worker_ready.connect
+def start_worker_heartbeat(sender, **kwargs):
+    try:
+        heartbeat.start({
+            'hostname': sender.hostname,
+            'pid': os.getpid(),
+            'queues': sorted(sender.app.amqp.queues.consume_from.keys()),
+            'concurrency': getattr(sender.controller, 'concurrency', None),
+            'version': __version__,
+            'started_at': time.time()
+        })
+    except Exception:
+        logger.exception("Failed starting the worker heartbeat.")
+
+
+@worker_shutdown.connect
+def stop_worker_heartbeat(sender, **kwargs):
+    try:
+        heartbeat.stop()
+    except Exception:
+        logger.exception("Failed stopping the worker heartbeat.")
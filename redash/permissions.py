@@ -17,14 +17,15 @@ def has_access(object_groups, user, need_view_only):
     if 'admin' in user.permissions:
         return True
 
-    matching_groups = set(object_groups.keys()).intersection(user.groups)
+    # object_groups is a dict (usually the cached DataSource.groups), so look the user's groups up in it directly.
+    matching_groups = [object_groups[group] for group in user.groups if group in object_groups]
 
     if not matching_groups:
         return False
 
     required_level = 1 if need_view_only else 2
 
-    group_level = 1 if all(flatten([object_groups[group] for group in matching_groups])) else 2
+    group_level = 1 if all(flatten(matching_groups)) else 2
 
     return required_level <= group_level
 
@@ -1,5 +1,6 @@
 import logging
 import json
+from multiprocessing.pool import ThreadPool
 
 from redash import settings
 
@@ -102,6 +103,35 @@ class BaseQueryRunner(object):
     def get_schema(self, get_stats=False):
         return []
 
+    def get_table_versions(self):
+        """
+        Returns a dict of table name -> version token, where the token changes whenever the table's schema changes,
+        or None if the data source can't report this (in which case the full schema is loaded on every refresh).
+        """
+        return None
+
+    def get_tables_schema(self, table_names, get_stats=False):
+        """
+        Returns the schema for the given tables only. Runners implementing get_table_versions should override this
+        with something cheaper than loading the full schema.
+        """
+        table_names = set(table_names)
+        return [t for t in self.get_schema(get_stats=get_stats) if t['name'] in table_names]
+
+    def get_table_stats(self, table_names):
+        """
+        Returns a dict of table name -> approximate row count, read from the data source's catalog, or None if there's
+        no catalog to read it from.
+        """
+        return None
+
+    def get_table_sizes(self, table_names):
+        """
+        Returns a dict of table name -> row count of the given tables (some might be missing), to refresh the sizes of
+        tables whose schema didn't change.
+        """
+        return self.get_table_stats(table_names) or {}
+
     def _run_query_internal(self, query):
         results, error = self.run_query(query, None)
 
@@ -132,11 +162,34 @@ class BaseSQLQueryRunner(BaseQueryRunner):
     def _get_tables(self, schema_dict):
         return []
 
+    def get_table_sizes(self, table_names):
+        stats = self.get_table_stats(table_names)
+        if stats is None:
+            stats = self._count_tables(table_names)
+        return stats
+
     def _get_tables_stats(self, tables_dict):
-        for t in tables_dict.keys():
-            if type(tables_dict[t]) == dict:
-                res = self._run_query_internal('select count(*) as cnt from %s' % t)
-                tables_dict[t]['size'] = res[0]['cnt']
+        table_names = [t for t in tables_dict.keys() if type(tables_dict[t]) == dict]
+        stats = self.get_table_sizes(table_names)
+
+        for t, size in stats.iteritems():
+            if t in tables_dict:
+                tables_dict[t]['size'] = size
+
+    def _count_table(self, table_name):
+        res = self._run_query_internal('select count(*) as cnt from %s' % table_name)
+        return res[0]['cnt']
+
+    def _count_tables(self, table_names):
+        if not table_names:
+            return {}
+
+        pool = ThreadPool(min(settings.SCHEMA_TABLE_SIZE_CONCURRENCY, len(table_names)))
+        try:
+            return dict(zip(table_names, pool.map(self._count_table, table_names)))
+        finally:
+            pool.close()
+            pool.join()
 
 query_runners = {}
 
@@ -10,7 +10,7 @@ import requests
 
 from redash import settings
 from redash.query_runner import *
-from redash.utils import JSONEncoder
+from redash.utils.serialization import serialize_query_result
 
 logger = logging.getLogger(__name__)
 
@@ -125,6 +125,7 @@ class BigQuery(BaseQueryRunner):
 
     def __init__(self, configuration):
         super(BigQuery, self).__init__(configuration)
+        self._tables_metadata = None
 
     def _get_bigquery_service(self):
         scope = [
@@ -202,25 +203,89 @@ class BigQuery(BaseQueryRunner):
 
         return data
 
+    def _get_dataset_ids(self, service, project_id):
+        datasets = service.datasets().list(projectId=project_id).execute()
+        return [dataset['datasetReference']['datasetId'] for dataset in datasets.get('datasets', [])]
+
+    def _get_table_schema(self, service, project_id, dataset_id, table_id):
+        table_data = service.tables().get(projectId=project_id, datasetId=dataset_id, tableId=table_id).execute()
+        return {'name': table_data['id'], 'columns': map(lambda r: r['name'], table_data['schema']['fields'])}
+
     def get_schema(self, get_stats=False):
         if not self.configuration.get('loadSchema', False):
             return []
 
         service = self._get_bigquery_service()
         project_id = self._get_project_id()
-        datasets = service.datasets().list(projectId=project_id).execute()
         schema = []
-        for dataset in datasets.get('datasets', []):
-            dataset_id = dataset['datasetReference']['datasetId']
+        for dataset_id in self._get_dataset_ids(service, project_id):
             tables = service.tables().list(projectId=project_id, datasetId=dataset_id).execute()
             for table in tables.get('tables', []):
-                table_data = service.tables().get(projectId=project_id, datasetId=dataset_id, tableId=table['tableReference']['tableId']).execute()
-                print table_data
+                schema.append(self._get_table_schema(service, project_id, dataset_id, table['tableReference']['tableId']))
+
+        return self._add_table_stats(schema, get_stats)
+
+    def _get_tables_metadata(self):
+        """
+        Rows of every dataset's __TABLES__ meta table, keyed by the full table name. Loaded once per runner (a schema
+        refresh uses a single one), as the table versions, schema and stats all read them.
+        """
+        if self._tables_metadata is not None:
+            return self._tables_metadata
+
+        service = self._get_bigquery_service()
+        jobs = service.jobs()
+        project_id = self._get_project_id()
+
+        if self.configuration.get('useStandardSql', False):
+            tables_query = "SELECT table_id, last_modified_time, row_count FROM `{}.{}.__TABLES__`"
+        else:
+            tables_query = "SELECT table_id, last_modified_time, row_count FROM [{}:{}.__TABLES__]"
+
+        # One metadata query per dataset instead of a tables.get call per table.
+        metadata = {}
+        for dataset_id in self._get_dataset_ids(service, project_id):
+            data = self._get_query_result(jobs, tables_query.format(project_id, dataset_id))
+            for row in data['rows']:
+                metadata['{}:{}.{}'.format(project_id, dataset_id, row['table_id'])] = row
+
+        self._tables_metadata = metadata
+        return metadata
+
+    def get_table_versions(self):
+        if not self.configuration.get('loadSchema', False):
+            return {}
 
-                schema.append({'name': table_data['id'], 'columns': map(lambda r: r['name'], table_data['schema']['fields'])})
+        return {name: row['last_modified_time'] for name, row in self._get_tables_metadata().iteritems()}
+
+    def get_table_stats(self, table_names):
+        metadata = self._get_tables_metadata()
+        return {name: metadata[name]['row_count'] for name in table_names if name in metadata}
+
+    def _add_table_stats(self, schema, get_stats):
+        if settings.SCHEMA_RUN_TABLE_SIZE_CALCULATIONS and get_stats:
+            stats = self.get_table_stats([t['name'] for t in schema])
+            for table in schema:
+                if table['name'] in stats:
+                    table['size'] = stats[table['name']]
 
         return schema
 
+    def get_tables_schema(self, table_names, get_stats=False):
+        service = self._get_bigquery_service()
+        schema = []
+        for name in table_names:
+            project_id, _, table_ref = name.partition(':')
+            dataset_id, _, table_id = table_ref.partition('.')
+            try:
+                schema.append(self._get_table_schema(service, project_id, dataset_id, table_id))
+            except HttpError as e:
+                # The table was dropped since its version was listed.
+                if e.resp.status != 404:
+                    raise
+
+        return self._add_table_stats(schema, get_stats)
+
     def run_query(self, query, user):
         logger.debug("BigQuery got query: %s", query)
 
@@ -237,7 +302,7 @@ class BigQuery(BaseQueryRunner):
             data = self._get_query_result(jobs, query)
             error = None
 
-            json_data = json.dumps(data, cls=JSONEncoder)
+            json_data = serialize_query_result(data)
         except apiclient.errors.HttpError, e:
             json_data = None
             if e.resp.status == 400:
@@ -1,8 +1,7 @@
-import json
 import logging
 
 from redash.query_runner import BaseQueryRunner, register
-from redash.utils import JSONEncoder
+from redash.utils.serialization import serialize_query_result
 
 logger = logging.getLogger(__name__)
 
@@ -82,7 +81,7 @@ class Cassandra(BaseQueryRunner):
             rows = [dict(zip(column_names, row)) for row in result]
 
             data = {'columns': columns, 'rows': rows}
-            json_data = json.dumps(data, cls=JSONEncoder)
+            json_data = serialize_query_result(data)
 
             error = None
         except KeyboardInterrupt:
@@ -1,7 +1,7 @@
 import json
 import logging
 from redash.query_runner import *
-from redash.utils import JSONEncoder
+from redash.utils.serialization import serialize_query_result
 import requests
 logger = logging.getLogger(__name__)
 
@@ -99,7 +99,7 @@ class ClickHouse(BaseSQLQueryRunner):
             return json_data, error
         try:
             q = self._clickhouse_query(query)
-            data = json.dumps(q, cls=JSONEncoder)
+            data = serialize_query_result(q)
             error = None
         except Exception as e:
             data = None
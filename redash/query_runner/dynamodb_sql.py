@@ -1,10 +1,9 @@
-import json
 import logging
 import sys
 
 
 from redash.query_runner import *
-from redash.utils import JSONEncoder
+from redash.utils.serialization import serialize_query_result
 
 logger = logging.getLogger(__name__)
 
@@ -128,7 +127,7 @@ class DynamoDBSQL(BaseSQLQueryRunner):
                 rows.append(item)
 
             data = {'columns': columns, 'rows': rows}
-            json_data = json.dumps(data, cls=JSONEncoder)
+            json_data = serialize_query_result(data)
             error = None
         except ParseException as e:
             error = u"Error parsing query at line {} (column {}):\n{}".format(e.lineno, e.column, e.line)
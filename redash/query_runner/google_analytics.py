@@ -4,7 +4,7 @@ from base64 import b64decode
 import json
 import logging
 from redash.query_runner import *
-from redash.utils import JSONEncoder
+from redash.utils.serialization import serialize_query_result
 from urlparse import urlparse, parse_qs
 from datetime import datetime
 logger = logging.getLogger(__name__)
@@ -126,7 +126,7 @@ class GoogleAnalytics(BaseSQLQueryRunner):
                 rows.append(d)
             data = {'columns': columns, 'rows': rows}
             error = None
-            json_data = json.dumps(data, cls=JSONEncoder)
+            json_data = serialize_query_result(data)
         else:
             error = 'Wrong query format'
             json_data = None
@@ -3,7 +3,7 @@ import json
 import logging
 from dateutil import parser
 from redash.query_runner import *
-from redash.utils import JSONEncoder
+from redash.utils.serialization import serialize_query_result
 
 logger = logging.getLogger(__name__)
 
@@ -182,7 +182,7 @@ class GoogleSpreadsheet(BaseQueryRunner):
 
             data = parse_spreadsheet(spreadsheet, worksheet_num)
 
-            json_data = json.dumps(data, cls=JSONEncoder)
+            json_data = serialize_query_result(data)
             error = None
         except gspread.SpreadsheetNotFound:
             error = "Spreadsheet ({}) not found. Make sure you used correct id.".format(key)
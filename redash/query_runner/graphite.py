@@ -1,9 +1,8 @@
-import json
 import datetime
 import requests
 import logging
 from redash.query_runner import *
-from redash.utils import JSONEncoder
+from redash.utils.serialization import serialize_query_result
 
 logger = logging.getLogger(__name__)
 
@@ -21,7 +20,7 @@ def _transform_result(response):
             rows.append({'Time::x': timestamp, 'name::series': series['target'], 'value::y': values[0]})
 
     data = {'columns': columns, 'rows': rows}
-    return json.dumps(data, cls=JSONEncoder)
+    return serialize_query_result(data)
 
 
 class Graphite(BaseQueryRunner):
@@ -1,9 +1,10 @@
-import json
+import hashlib
 import logging
 import sys
 
+from redash import settings
 from redash.query_runner import *
-from redash.utils import JSONEncoder
+from redash.utils.serialization import serialize_query_result
 
 logger = logging.getLogger(__name__)
 
@@ -73,26 +74,61 @@ class Hive(BaseSQLQueryRunner):
     def __init__(self, configuration):
         super(Hive, self).__init__(configuration)
 
+    def _get_schema_names(self):
+        return filter(lambda a: len(a) > 0, map(lambda a: str(a['database_name']), self._run_query_internal("show schemas")))
+
+    def _get_table_columns(self, schema_name, table_name):
+        columns_query = "show columns in %s.%s"
+        return filter(lambda a: len(a) > 0, map(lambda a: str(a['field']), self._run_query_internal(columns_query % (schema_name, table_name))))
+
+    def _full_table_name(self, schema_name, table_name):
+        if schema_name != 'default':
+            return '{}.{}'.format(schema_name, table_name)
+        return table_name
+
     def _get_tables(self, schema):
         try:
-            schemas_query = "show schemas"
-
             tables_query = "show tables in %s"
 
-            columns_query = "show columns in %s.%s"
-
-            for schema_name in filter(lambda a: len(a) > 0, map(lambda a: str(a['database_name']), self._run_query_internal(schemas_query))):
+            for schema_name in self._get_schema_names():
                 for table_name in filter(lambda a: len(a) > 0, map(lambda a: str(a['tab_name']), self._run_query_internal(tables_query % schema_name))):
-                    columns = filter(lambda a: len(a) > 0, map(lambda a: str(a['field']), self._run_query_internal(columns_query % (schema_name, table_name))))
-
-                    if schema_name != 'default':
-                        table_name = '{}.{}'.format(schema_name, table_name)
-
+                    columns = self._get_table_columns(schema_name, table_name)
+                    table_name = self._full_table_name(schema_name, table_name)
                     schema[table_name] = {'name': table_name, 'columns': columns}
         except Exception, e:
             raise sys.exc_info()[1], None, sys.exc_info()[2]
         return schema.values()
 
+    def get_table_versions(self):
+        # "show table extended" describes every table of a database in one call, as "key:value" lines starting with
+        # tableName. The table's version is a digest of those lines, minus lastAccessTime which changes on reads.
+        versions = {}
+        for schema_name in self._get_schema_names():
+            rows = self._run_query_internal("show table extended in %s like '*'" % schema_name)
+            table_name = None
+            digest = None
+            for line in map(lambda a: str(a['tab_name']), rows):
+                key, _, value = line.partition(':')
+                if key == 'tableName':
+                    table_name = self._full_table_name(schema_name, value)
+                    digest = hashlib.md5()
+                if table_name is None or key == 'lastAccessTime':
+                    continue
+                digest.update(line)
+                versions[table_name] = digest.hexdigest()
+
+        return versions
+
+    def get_tables_schema(self, table_names, get_stats=False):
+        schema_dict = {}
+        for name in table_names:
+            schema_name, _, table_name = name.rpartition('.')
+            schema_dict[name] = {'name': name, 'columns': self._get_table_columns(schema_name or 'default', table_name)}
+
+        if settings.SCHEMA_RUN_TABLE_SIZE_CALCULATIONS and get_stats:
+            self._get_tables_stats(schema_dict)
+        return schema_dict.values()
+
     def run_query(self, query, user):
 
         connection = None
@@ -119,7 +155,7 @@ class Hive(BaseSQLQueryRunner):
             rows = [dict(zip(column_names, row)) for row in cursor]
 
             data = {'columns': columns, 'rows': rows}
-            json_data = json.dumps(data, cls=JSONEncoder)
+            json_data = serialize_query_result(data)
             error = None
         except KeyboardInterrupt:
             connection.cancel()
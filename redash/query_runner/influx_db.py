@@ -1,7 +1,6 @@
-import json
 import logging
 
-from redash.utils import JSONEncoder
+from redash.utils.serialization import serialize_query_result
 from redash.query_runner import *
 
 logger = logging.getLogger(__name__)
@@ -42,10 +41,10 @@ def _transform_result(results):
                         result_row[column] = value
                 result_rows.append(result_row)
 
-    return json.dumps({
+    return serialize_query_result({
         "columns": [{'name': c} for c in result_columns],
         "rows": result_rows
-    }, cls=JSONEncoder)
+    })
 
 
 class InfluxDB(BaseQueryRunner):
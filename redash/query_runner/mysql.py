@@ -2,7 +2,7 @@ import sys
 import json
 import logging
 
-from redash.utils import JSONEncoder
+from redash.utils.serialization import serialize_query_result
 from redash.query_runner import *
 
 logger = logging.getLogger(__name__)
@@ -121,6 +121,41 @@ class Mysql(BaseSQLQueryRunner):
 
         return schema.values()
 
+    def get_table_stats(self, table_names):
+        # TABLE_ROWS is exact for MyISAM and an estimate for InnoDB. Views have no statistics, so they're counted.
+        query = """
+        SELECT table_schema, table_name, table_type, table_rows
+        FROM information_schema.tables
+        WHERE table_type IN ('BASE TABLE', 'VIEW') AND table_schema NOT IN ('performance_schema', 'mysql');
+        """
+
+        results, error = self.run_query(query, None)
+
+        if error is not None:
+            raise Exception("Failed getting table stats.")
+
+        results = json.loads(results)
+
+        table_names = set(table_names)
+        stats = {}
+        views = []
+        for row in results['rows']:
+            if row['table_schema'] != self.configuration['db']:
+                table_name = '{}.{}'.format(row['table_schema'], row['table_name'])
+            else:
+                table_name = row['table_name']
+
+            if table_name not in table_names:
+                continue
+
+            if row['table_type'] == 'VIEW':
+                views.append(table_name)
+            elif row['table_rows'] is not None:
+                stats[table_name] = row['table_rows']
+
+        stats.update(self._count_tables(views))
+        return stats
+
     def run_query(self, query, user):
         import MySQLdb
 
@@ -145,7 +180,7 @@ class Mysql(BaseSQLQueryRunner):
                 rows = [dict(zip((c['name'] for c in columns), row)) for row in data]
 
                 data = {'columns': columns, 'rows': rows}
-                json_data = json.dumps(data, cls=JSONEncoder)
+                json_data = serialize_query_result(data)
                 error = None
             else:
                 json_data = None
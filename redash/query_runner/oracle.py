@@ -3,7 +3,7 @@ import logging
 import sys
 
 from redash.query_runner import *
-from redash.utils import JSONEncoder
+from redash.utils.serialization import serialize_query_result
 
 try:
     import cx_Oracle
@@ -153,7 +153,7 @@ class Oracle(BaseSQLQueryRunner):
 
                 data = {'columns': columns, 'rows': rows}
                 error = None
-                json_data = json.dumps(data, cls=JSONEncoder)
+                json_data = serialize_query_result(data)
             else:
                 error = 'Query completed but it returned no data.'
                 json_data = None
@@ -4,8 +4,9 @@ import psycopg2
 import select
 import sys
 
+from redash import settings
 from redash.query_runner import *
-from redash.utils import JSONEncoder
+from redash.utils.serialization import serialize_query_result
 
 logger = logging.getLogger(__name__)
 
@@ -28,6 +29,10 @@ types_map = {
 }
 
 
+def _quote(value):
+    return "'{}'".format(value.replace("'", "''"))
+
+
 def _wait(conn, timeout=None):
     while 1:
         try:
@@ -88,25 +93,42 @@ class PostgreSQL(BaseSQLQueryRunner):
 
         self.connection_string = " ".join(values)
 
-    def _get_tables(self, schema):
+    def _table_name(self, table_schema, table_name):
+        if table_schema != 'public':
+            return '{}.{}'.format(table_schema, table_name)
+        return table_name
+
+    def _get_tables(self, schema, table_names=None):
         query = """
         SELECT table_schema, table_name, column_name
         FROM information_schema.columns
-        WHERE table_schema NOT IN ('pg_catalog', 'information_schema');
+        WHERE table_schema NOT IN ('pg_catalog', 'information_schema'){}
+        ORDER BY table_schema, table_name, ordinal_position;
         """
 
-        results, error = self.run_query(query, None)
+        condition = ""
+        if table_names is not None and len(table_names) <= 1000:
+            pairs = []
+            for name in table_names:
+                table_schema, _, table_name = name.rpartition('.')
+                pairs.append("({}, {})".format(_quote(table_schema or 'public'), _quote(table_name)))
+            condition = "\n        AND (table_schema, table_name) IN ({})".format(", ".join(pairs))
+
+        results, error = self.run_query(query.format(condition), None)
 
         if error is not None:
             raise Exception("Failed getting schema.")
 
         results = json.loads(results)
 
+        if table_names is not None:
+            table_names = set(table_names)
+
         for row in results['rows']:
-            if row['table_schema'] != 'public':
-                table_name = '{}.{}'.format(row['table_schema'], row['table_name'])
-            else:
-                table_name = row['table_name']
+            table_name = self._table_name(row['table_schema'], row['table_name'])
+
+            if table_names is not None and table_name not in table_names:
+                continue
 
             if table_name not in schema:
                 schema[table_name] = {'name': table_name, 'columns': []}
@@ -115,6 +137,59 @@ class PostgreSQL(BaseSQLQueryRunner):
 
         return schema.values()
 
+    def get_table_versions(self):
+        # Postgres doesn't track DDL times, so a table's version is a digest of its column list.
+        query = """
+        SELECT table_schema, table_name,
+               md5(string_agg(column_name || ':' || data_type, ',' ORDER BY ordinal_position)) AS version
+        FROM information_schema.columns
+        WHERE table_schema NOT IN ('pg_catalog', 'information_schema')
+        GROUP BY table_schema, table_name;
+        """
+
+        results, error = self.run_query(query, None)
+
+        if error is not None:
+            raise Exception("Failed getting table versions.")
+
+        results = json.loads(results)
+
+        return {self._table_name(row['table_schema'], row['table_name']): row['version'] for row in results['rows']}
+
+    def get_table_stats(self, table_names):
+        # reltuples is the planner's row estimate, kept up to date by VACUUM/ANALYZE (negative if never analyzed).
+        query = """
+        SELECT n.nspname AS table_schema, c.relname AS table_name, c.reltuples::bigint AS row_count
+        FROM pg_class c
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE c.relkind IN ('r', 'm')
+          AND n.nspname NOT IN ('pg_catalog', 'information_schema')
+          AND c.reltuples >= 0;
+        """
+
+        results, error = self.run_query(query, None)
+
+        if error is not None:
+            raise Exception("Failed getting table stats.")
+
+        results = json.loads(results)
+
+        table_names = set(table_names)
+        stats = {}
+        for row in results['rows']:
+            table_name = self._table_name(row['table_schema'], row['table_name'])
+            if table_name in table_names:
+                stats[table_name] = row['row_count']
+
+        return stats
+
+    def get_tables_schema(self, table_names, get_stats=False):
+        schema_dict = {}
+        self._get_tables(schema_dict, table_names=table_names)
+        if settings.SCHEMA_RUN_TABLE_SIZE_CALCULATIONS and get_stats:
+            self._get_tables_stats(schema_dict)
+        return schema_dict.values()
+
     def run_query(self, query, user):
         connection = psycopg2.connect(self.connection_string, async=True)
         _wait(connection, timeout=10)
@@ -131,7 +206,7 @@ class PostgreSQL(BaseSQLQueryRunner):
 
                 data = {'columns': columns, 'rows': rows}
                 error = None
-                json_data = json.dumps(data, cls=JSONEncoder)
+                json_data = serialize_query_result(data)
             else:
                 error = 'Query completed but it returned no data.'
                 json_data = None
@@ -160,6 +235,11 @@ class Redshift(PostgreSQL):
     def type(cls):
         return "redshift"
 
+    def get_table_versions(self):
+        # string_agg isn't available in Redshift and LISTAGG can't run against the leader-node catalog tables, so
+        # Redshift falls back to a full listing (still only changed tables get rewritten in the cache).
+        return None
+
     @classmethod
     def configuration_schema(cls):
         return {
@@ -4,7 +4,7 @@ import logging
 import sys
 
 from redash.query_runner import *
-from redash.utils import json_dumps
+from redash.utils.serialization import serialize_query_result
 from redash import models
 
 import importlib
@@ -236,7 +236,7 @@ class Python(BaseQueryRunner):
 
             result = self._script_locals['result']
             result['log'] = self._custom_print.lines
-            json_data = json_dumps(result)
+            json_data = serialize_query_result(result)
         except KeyboardInterrupt:
             error = "Query cancelled by user."
             json_data = None
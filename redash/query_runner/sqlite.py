@@ -6,7 +6,7 @@ import sys
 from redash.query_runner import BaseSQLQueryRunner
 from redash.query_runner import register
 
-from redash.utils import JSONEncoder
+from redash.utils.serialization import serialize_query_result
 
 logger = logging.getLogger(__name__)
 
@@ -74,7 +74,7 @@ class Sqlite(BaseSQLQueryRunner):
 
                 data = {'columns': columns, 'rows': rows}
                 error = None
-                json_data = json.dumps(data, cls=JSONEncoder)
+                json_data = serialize_query_result(data)
             else:
                 error = 'Query completed but it returned no data.'
                 json_data = None
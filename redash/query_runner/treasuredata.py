@@ -1,6 +1,5 @@
-import json
 
-from redash.utils import JSONEncoder
+from redash.utils.serialization import serialize_query_result
 from redash.query_runner import *
 
 import logging
@@ -113,7 +112,7 @@ class TreasureData(BaseQueryRunner):
 
             rows = [dict(zip(([c[0] for c in columns_data]), r)) for i, r in enumerate(cursor.fetchall())]
             data = {'columns': columns, 'rows': rows}
-            json_data = json.dumps(data, cls=JSONEncoder)
+            json_data = serialize_query_result(data)
             error = None
         except Exception, ex:
             json_data = None
@@ -2,7 +2,7 @@ import sys
 import json
 import logging
 
-from redash.utils import JSONEncoder
+from redash.utils.serialization import serialize_query_result
 from redash.query_runner import *
 
 logger = logging.getLogger(__name__)
@@ -126,7 +126,7 @@ class Vertica(BaseSQLQueryRunner):
                             'type': types_map.get(col[1], None)} for col in columns_data]
 
                 data = {'columns': columns, 'rows': rows}
-                json_data = json.dumps(data, cls=JSONEncoder)
+                json_data = serialize_query_result(data)
                 error = None
             else:
                 json_data = None
@@ -3,12 +3,16 @@ This will eventually replace all the `to_dict` methods of the different model cl
 code and better separation of concerns.
 """
 
+import hashlib
 import json
+import uuid
+
 from funcy import project
-from redash import models
+from redash import models, redis_connection, settings
+from redash.utils import json_dumps
 
 
-def public_widget(widget):
+def public_widget(widget, query_data=None):
     res = {
         'id': widget.id,
         'width': widget.width,
@@ -19,7 +23,8 @@ def public_widget(widget):
     }
 
     if widget.visualization and widget.visualization.id:
-        query_data = models.QueryResult.get_by_id(widget.visualization.query.latest_query_data_id).to_dict()
+        if query_data is None and widget.visualization.query.latest_query_data_id is not None:
+            query_data = models.QueryResult.get_by_id(widget.visualization.query.latest_query_data_id).to_dict()
         res['visualization'] = {
             'type': widget.visualization.type,
             'name': widget.visualization.name,
@@ -39,14 +44,62 @@ def public_widget(widget):
     return res
 
 
-def public_dashboard(dashboard):
-    dashboard_dict = project(dashboard.to_dict(), ('name', 'layout', 'dashboard_filters_enabled', 'updated_at', 'created_at'))
+def _public_dashboard_cache_key(dashboard, widget_list):
+    # Everything the payload depends on: the dashboard, its widgets, their visualizations and queries, and the
+    # queries' latest results (a new result gets a new id, so results are covered by latest_query_data_id).
+    parts = [dashboard.id, dashboard.version, dashboard.updated_at, dashboard.layout]
+    for w in widget_list:
+        parts.append((w.id, w.updated_at))
+        if w.visualization_id is not None:
+            query = w.visualization.query
+            parts.append((w.visualization.updated_at, query.id, query.updated_at, query.latest_query_data_id))
+
+    return 'public_dashboard:{}:{}'.format(dashboard.id, hashlib.md5(json_dumps(parts)).hexdigest())
 
-    widget_list = models.Widget.select(models.Widget, models.Visualization, models.Query) \
+
+def public_dashboard(dashboard):
+    """
+    Returns the public dashboard payload as JSON text. Query results are loaded with one query and their stored data is
+    spliced into the payload without parsing it; the assembled payload is cached until anything in it changes.
+    """
+    widget_list = list(models.Widget.select(models.Widget, models.Visualization, models.Query) \
         .where(models.Widget.dashboard == dashboard.id) \
         .join(models.Visualization, join_type=models.peewee.JOIN_LEFT_OUTER) \
-        .join(models.Query, join_type=models.peewee.JOIN_LEFT_OUTER)
-    widgets = {w.id: public_widget(w) for w in widget_list}
+        .join(models.Query, join_type=models.peewee.JOIN_LEFT_OUTER))
+
+    cache_key = _public_dashboard_cache_key(dashboard, widget_list)
+    payload = redis_connection.get(cache_key)
+    if payload is not None:
+        return payload
+
+    result_ids = set(w.visualization.query.latest_query_data_id for w in widget_list
+                     if w.visualization_id is not None and w.visualization.query.latest_query_data_id is not None)
+    results = {}
+    if result_ids:
+        results = dict((r.id, r) for r in models.QueryResult.select().where(models.QueryResult.id << list(result_ids)))
+
+    # Each result's data is serialized as a placeholder string first, and then replaced with the stored JSON.
+    placeholder = '__query_result_data_{}_%s__'.format(uuid.uuid4().hex)
+    query_data = {}
+    for result_id, result in results.iteritems():
+        query_data[result_id] = {
+            'id': result.id,
+            'query_hash': result.query_hash,
+            'query': result.query,
+            'data': placeholder % result.id,
+            'data_source_id': result.data_source_id,
+            'runtime': result.runtime,
+            'retrieved_at': result.retrieved_at
+        }
+
+    dashboard_dict = project(dashboard.to_dict(), ('name', 'layout', 'dashboard_filters_enabled', 'updated_at', 'created_at'))
+
+    widgets = {}
+    for w in widget_list:
+        data = None
+        if w.visualization_id is not None:
+            data = query_data.get(w.visualization.query.latest_query_data_id)
+        widgets[w.id] = public_widget(w, data)
 
     widgets_layout = []
     for row in dashboard_dict['layout']:
@@ -58,4 +111,10 @@ def public_dashboard(dashboard):
         widgets_layout.append(new_row)
 
     dashboard_dict['widgets'] = widgets_layout
-    return dashboard_dict
+
+    payload = json_dumps(dashboard_dict)
+    for result_id, result in results.iteritems():
+        payload = payload.replace('"{}"'.format(placeholder % result_id), result.data)
+
+    redis_connection.setex(cache_key, settings.PUBLIC_DASHBOARD_CACHE_TTL, payload)
+    return payload
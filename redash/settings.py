@@ -64,6 +64,43 @@ STATSD_PORT = int(os.environ.get('REDASH_STATSD_PORT', "8125"))
 STATSD_PREFIX = os.environ.get('REDASH_STATSD_PREFIX', "redash")
 STATSD_USE_TAGS = parse_boolean(os.environ.get('REDASH_STATSD_USE_TAGS', "false"))
 
+# Opt-in profiler for slow requests: when enabled, the SQL statements and a sampled Python stack profile of every
+# request slower than REQUEST_PROFILER_THRESHOLD milliseconds are kept (the latest REQUEST_PROFILER_KEEP of them) and
+# can be viewed from /api/admin/profiler/requests. Stacks are sampled every REQUEST_PROFILER_INTERVAL milliseconds.
+REQUEST_PROFILER_ENABLED = parse_boolean(os.environ.get("REDASH_REQUEST_PROFILER_ENABLED", "false"))
+REQUEST_PROFILER_THRESHOLD = int(os.environ.get("REDASH_REQUEST_PROFILER_THRESHOLD", "1000"))
+REQUEST_PROFILER_INTERVAL = int(os.environ.get("REDASH_REQUEST_PROFILER_INTERVAL", "5"))
+REQUEST_PROFILER_KEEP = int(os.environ.get("REDASH_REQUEST_PROFILER_KEEP", "100"))
+
+# Request, database and Celery task metrics are aggregated in process and flushed every METRICS_FLUSH_INTERVAL seconds
+# to the METRICS_BACKENDS: statsd (sending at most METRICS_STATSD_MAX_SAMPLES timings per metric and flush) and/or
+# prometheus (served from /metrics, which requires METRICS_SCRAPE_TOKEN as a bearer token when it's set, and a super
+# admin login otherwise).
+METRICS_BACKENDS = array_from_string(os.environ.get("REDASH_METRICS_BACKENDS", "statsd"))
+METRICS_FLUSH_INTERVAL = int(os.environ.get("REDASH_METRICS_FLUSH_INTERVAL", "10"))
+METRICS_STATSD_MAX_SAMPLES = int(os.environ.get("REDASH_METRICS_STATSD_MAX_SAMPLES", "100"))
+METRICS_SCRAPE_TOKEN = os.environ.get("REDASH_METRICS_SCRAPE_TOKEN", None)
+
+# Query result, dashboard and schema responses of at least COMPRESS_MIN_SIZE bytes are compressed (with gzip, or brotli
+# when the brotli package is installed) for clients that accept it. Query results are also stored gzipped when they're
+# saved (unless QUERY_RESULTS_PRECOMPRESS is off), and served as is.
+COMPRESS_RESPONSES = parse_boolean(os.environ.get("REDASH_COMPRESS_RESPONSES", "true"))
+COMPRESS_MIN_SIZE = int(os.environ.get("REDASH_COMPRESS_MIN_SIZE", "1024"))
+COMPRESS_LEVEL = int(os.environ.get("REDASH_COMPRESS_LEVEL", "6"))
+QUERY_RESULTS_PRECOMPRESS = parse_boolean(os.environ.get("REDASH_QUERY_RESULTS_PRECOMPRESS", "true"))
+
+# The encoder query results are serialized with: json (the standard library), or simplejson or ujson when installed
+# (see bin/benchmark_serialization.py). ujson rounds floats to 15 significant digits, and as it has no hook for the
+# other types, every value is checked before encoding with it.
+JSON_ENCODER = os.environ.get("REDASH_JSON_ENCODER", "json")
+
+# Query execution traces (API request, queue wait, data source load, query runner and storing the result) are exported
+# in the Zipkin v2 JSON format to TRACING_EXPORT: a file path (one span per line) or the URL of a collector (like
+# http://localhost:9411/api/v2/spans). Disabled when empty. Requests with a W3C traceparent header continue its trace,
+# and TRACING_SAMPLE_RATE of the others start a new one.
+TRACING_EXPORT = os.environ.get("REDASH_TRACING_EXPORT", "")
+TRACING_SAMPLE_RATE = float(os.environ.get("REDASH_TRACING_SAMPLE_RATE", "1"))
+
 # Connection settings for re:dash's own database (where we store the queries, results, etc)
 DATABASE_CONFIG = parse_db_url(os.environ.get("REDASH_DATABASE_URL", os.environ.get('DATABASE_URL', "postgresql://postgres")))
 
@@ -77,13 +114,62 @@ QUERY_RESULTS_CLEANUP_ENABLED = parse_boolean(os.environ.get("REDASH_QUERY_RESUL
 QUERY_RESULTS_CLEANUP_COUNT = int(os.environ.get("REDASH_QUERY_RESULTS_CLEANUP_COUNT", "100"))
 QUERY_RESULTS_CLEANUP_MAX_AGE = int(os.environ.get("REDASH_QUERY_RESULTS_CLEANUP_MAX_AGE", "7"))
 
+# Results of saved queries run with parameters are cached per query and parameter values. They're kept for as long as
+# the query's refresh schedule (or PARAMETERIZED_RESULTS_CACHE_TTL seconds for unscheduled queries), for at most
+# PARAMETERIZED_RESULTS_CACHE_SIZE sets of parameter values and PARAMETERIZED_RESULTS_CACHE_BUDGET megabytes of results
+# per query: past those, the least recently used results are dropped from the cache. Results that are no longer cached
+# are deleted PARAMETERIZED_RESULTS_CLEANUP_DELAY seconds later (so clients still loading them can finish) by the query
+# results cleanup, unless a query links to them. A size of 0 disables the cache.
+PARAMETERIZED_RESULTS_CACHE_SIZE = int(os.environ.get("REDASH_PARAMETERIZED_RESULTS_CACHE_SIZE", "50"))
+PARAMETERIZED_RESULTS_CACHE_BUDGET = int(os.environ.get("REDASH_PARAMETERIZED_RESULTS_CACHE_BUDGET", "50"))
+PARAMETERIZED_RESULTS_CACHE_TTL = int(os.environ.get("REDASH_PARAMETERIZED_RESULTS_CACHE_TTL", "3600"))
+PARAMETERIZED_RESULTS_CLEANUP_DELAY = int(os.environ.get("REDASH_PARAMETERIZED_RESULTS_CLEANUP_DELAY", "600"))
+
+# Assembled public dashboard payloads are cached in Redis (keyed by everything they contain, so they never go stale)
+# for this many seconds.
+PUBLIC_DASHBOARD_CACHE_TTL = int(os.environ.get("REDASH_PUBLIC_DASHBOARD_CACHE_TTL", "3600"))
+# Serialized dashboards (per set of groups) are cached in Redis for this many seconds. Changes to the dashboard, its
+# widgets, visualizations, queries or their results invalidate them right away; the TTL only bounds how long other
+# details (like the name of a query's author) can be stale. 0 disables the cache.
+DASHBOARD_CACHE_TTL = int(os.environ.get("REDASH_DASHBOARD_CACHE_TTL", "600"))
+
+# Query search matches names and descriptions; set this to also match the query text itself.
+QUERY_SEARCH_INCLUDE_QUERY_TEXT = parse_boolean(os.environ.get("REDASH_QUERY_SEARCH_INCLUDE_QUERY_TEXT", "false"))
+
 SCHEMAS_REFRESH_SCHEDULE = int(os.environ.get("REDASH_SCHEMAS_REFRESH_SCHEDULE", 30))
+# Each data source schema is refreshed in its own task, limited to this many seconds. Data sources that fail (or time
+# out) are skipped for an exponentially growing period, up to SCHEMA_REFRESH_MAX_BACKOFF seconds.
+SCHEMA_REFRESH_TIME_LIMIT = int(os.environ.get("REDASH_SCHEMA_REFRESH_TIME_LIMIT", 300))
+SCHEMA_REFRESH_MAX_BACKOFF = int(os.environ.get("REDASH_SCHEMA_REFRESH_MAX_BACKOFF", 3600 * 24))
+
+# The status endpoint (/status.json) serves a snapshot of the object counts and queue sizes, refreshed by a periodic task
+# every STATUS_REFRESH_INTERVAL seconds. Workers record a heartbeat every WORKER_HEARTBEAT_INTERVAL seconds, and are
+# reported as not alive once they miss three of them.
+STATUS_REFRESH_INTERVAL = int(os.environ.get("REDASH_STATUS_REFRESH_INTERVAL", "60"))
+WORKER_HEARTBEAT_INTERVAL = int(os.environ.get("REDASH_WORKER_HEARTBEAT_INTERVAL", "10"))
+
+# Scheduler settings. Several Celery beats can run at the same time: for each shard of the schedule space only the
+# beat holding the Redis lease gets its refresh_queries ticks evaluated. If it dies, the lease expires after
+# SCHEDULER_LEASE_TTL seconds and another beat takes over.
+SCHEDULER_SHARDS = int(os.environ.get("REDASH_SCHEDULER_SHARDS", "1"))
+SCHEDULER_LEASE_TTL = int(os.environ.get("REDASH_SCHEDULER_LEASE_TTL", "90"))
+# Outdated queries are enqueued in pipelined batches of this size.
+SCHEDULER_ENQUEUE_BATCH_SIZE = int(os.environ.get("REDASH_SCHEDULER_ENQUEUE_BATCH_SIZE", "500"))
 
 AUTH_TYPE = os.environ.get("REDASH_AUTH_TYPE", "api_key")
 PASSWORD_LOGIN_ENABLED = parse_boolean(os.environ.get("REDASH_PASSWORD_LOGIN_ENABLED", "true"))
 ENFORCE_HTTPS = parse_boolean(os.environ.get("REDASH_ENFORCE_HTTPS", "false"))
 
 MULTI_ORG = parse_boolean(os.environ.get("REDASH_MULTI_ORG", "false"))
+# Organizations are cached in process memory for this many seconds when resolving the current organization. Saving
+# an organization clears the cache of every process.
+ORG_CACHE_TTL = int(os.environ.get("REDASH_ORG_CACHE_TTL", "60"))
+# Users (with their permissions) and the kind of each API key are cached in Redis for this many seconds when
+# authenticating requests. Changes to a user or to its groups invalidate the cache right away. 0 disables it.
+AUTH_CACHE_TTL = int(os.environ.get("REDASH_AUTH_CACHE_TTL", "60"))
+# Each process keeps data source groups in memory for this many seconds. Changing a data source's groups invalidates
+# them in all processes right away (through Redis pub/sub); the TTL only bounds staleness if a message gets lost.
+DATA_SOURCE_GROUPS_CACHE_TTL = int(os.environ.get("REDASH_DATA_SOURCE_GROUPS_CACHE_TTL", "300"))
 
 GOOGLE_CLIENT_ID = os.environ.get("REDASH_GOOGLE_CLIENT_ID", "")
 GOOGLE_CLIENT_SECRET = os.environ.get("REDASH_GOOGLE_CLIENT_SECRET", "")
@@ -204,7 +290,17 @@ additional_destinations = array_from_string(os.environ.get("REDASH_ADDITIONAL_DE
 
 DESTINATIONS = distinct(enabled_destinations + additional_destinations)
 
+# Events are buffered in Redis and written (and forwarded to EVENT_REPORTING_WEBHOOKS) every EVENTS_FLUSH_INTERVAL
+# seconds, in batches of up to EVENTS_FLUSH_BATCH_SIZE.
+EVENTS_FLUSH_INTERVAL = int(os.environ.get("REDASH_EVENTS_FLUSH_INTERVAL", "10"))
+EVENTS_FLUSH_BATCH_SIZE = int(os.environ.get("REDASH_EVENTS_FLUSH_BATCH_SIZE", "1000"))
+# Events older than this many days are deleted (daily counts are kept). 0 keeps them forever.
+EVENTS_RETENTION_DAYS = int(os.environ.get("REDASH_EVENTS_RETENTION_DAYS", "0"))
+
 EVENT_REPORTING_WEBHOOKS = array_from_string(os.environ.get("REDASH_EVENT_REPORTING_WEBHOOKS", ""))
+# Webhooks get one form encoded POST per event by default. When enabled, they get one JSON POST per batch instead
+# (a list of events).
+EVENT_REPORTING_WEBHOOKS_BATCH = parse_boolean(os.environ.get("REDASH_EVENT_REPORTING_WEBHOOKS_BATCH", "false"))
 
 # Support for Sentry (http://getsentry.com/). Just set your Sentry DSN to enable it:
 SENTRY_DSN = os.environ.get("REDASH_SENTRY_DSN", "")
@@ -227,10 +323,15 @@ BIGQUERY_HTTP_TIMEOUT = int(os.environ.get("REDASH_BIGQUERY_HTTP_TIMEOUT", "600"
 
 # Enhance schema fetching
 SCHEMA_RUN_TABLE_SIZE_CALCULATIONS = parse_boolean(os.environ.get("REDASH_SCHEMA_RUN_TABLE_SIZE_CALCULATIONS", "false"))
+# How many tables to count at once, for data sources that can't read table sizes from their catalog.
+SCHEMA_TABLE_SIZE_CONCURRENCY = int(os.environ.get("REDASH_SCHEMA_TABLE_SIZE_CONCURRENCY", "4"))
 
 # Allow Parameters in Embeds
 # WARNING: With this option enabled, Redash reads query parameters from the request URL (risk of SQL injection!)
 ALLOW_PARAMETERS_IN_EMBEDS = parse_boolean(os.environ.get("REDASH_ALLOW_PARAMETERS_IN_EMBEDS", "false"))
+# Embedded queries with parameters run through the query queue (viewers of the same parameter values share the job and
+# its result). The request waits this many seconds for the result, then returns the job for the client to poll.
+EMBED_QUERY_WAIT_TIMEOUT = int(os.environ.get("REDASH_EMBED_QUERY_WAIT_TIMEOUT", "10"))
 
 # Common Client config
 COMMON_CLIENT_CONFIG = {
@@ -1,3 +1,3 @@
-from .general import record_event, version_check, send_mail
-from .queries import QueryTask, refresh_queries, refresh_schemas, cleanup_tasks, cleanup_query_results, execute_query
+from .general import record_event, record_events, flush_events, cleanup_events, refresh_status, version_check, send_mail
+from .queries import QueryTask, refresh_queries, refresh_schemas, refresh_schema, cleanup_tasks, cleanup_query_results, execute_query
 from .alerts import check_alerts_for_query
\ No newline at end of file
@@ -1,26 +1,205 @@
+import datetime
+import json
+import uuid
+
 import requests
 from celery.utils.log import get_task_logger
 from flask.ext.mail import Message
 from redash.worker import celery
 from redash.version_check import run_version_check
-from redash import models, mail, settings
+from redash.monitor import refresh_status_snapshot
+from redash import models, mail, settings, redis_connection
+from redash.utils import json_dumps
 from .base import BaseTask
 
 logger = get_task_logger(__name__)
 
 
-@celery.task(name="redash.tasks.record_event", base=BaseTask)
+EVENTS_BUFFER_KEY = 'events:buffer'
+EVENTS_DEAD_LETTER_KEY = 'events:dead_letter'
+EVENTS_DEAD_LETTER_MAX = 10000
+EVENTS_FLUSH_LOCK_KEY = 'events:flush_lock'
+
+# Compare-and-delete and compare-and-expire, so a flush only releases or extends the lock while it still holds it.
+release_lock = redis_connection.register_script("""
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+""")
+extend_lock = redis_connection.register_script("""
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('expire', KEYS[1], ARGV[2])
+end
+return 0
+""")
+
+# Per process, so connections to the webhooks are kept alive between flushes.
+webhooks_session = requests.Session()
+
+
+def invalid_event(event):
+    """Why the event can't be recorded, or None if it can."""
+    if not isinstance(event, dict):
+        return "not an object"
+
+    if not isinstance(event.get('org_id'), (int, long)) or isinstance(event['org_id'], bool):
+        return "invalid org_id"
+
+    if event.get('user_id') is not None and not isinstance(event['user_id'], (int, long)):
+        return "invalid user_id"
+
+    for field in ('action', 'object_type'):
+        if not isinstance(event.get(field), basestring) or not event[field]:
+            return "invalid {}".format(field)
+
+    try:
+        created_at = datetime.datetime.utcfromtimestamp(event.get('timestamp'))
+    except (TypeError, ValueError, OverflowError):
+        return "invalid timestamp"
+
+    # Events past next month would land in the default partition of the events table (see Event.create_partitions),
+    # and ones past the retention would be deleted right away.
+    now = datetime.datetime.utcnow()
+    if created_at > now + datetime.timedelta(days=1):
+        return "timestamp in the future"
+    if settings.EVENTS_RETENTION_DAYS > 0 and created_at < now - datetime.timedelta(days=settings.EVENTS_RETENTION_DAYS):
+        return "timestamp past the retention"
+
+    return None
+
+
+def record_events(events):
+    """Buffers events in Redis, to be written to the database (and reported to webhooks) by flush_events."""
+    valid = []
+    for event in events:
+        error = invalid_event(event)
+        if error:
+            logger.warning("Dropping event (%s): %r", error, event)
+        else:
+            valid.append(event)
+
+    if valid:
+        redis_connection.rpush(EVENTS_BUFFER_KEY, *[json_dumps(event) for event in valid])
+
+
 def record_event(event):
-    original_event = event.copy()
-    models.Event.record(event)
+    record_events([event])
+
+
+@celery.task(name="redash.tasks.record_event", base=BaseTask)
+def record_event_task(event):
+    # Kept for tasks sent before events were buffered.
+    record_event(event)
+
+
+def report_events(events):
     for hook in settings.EVENT_REPORTING_WEBHOOKS:
-        logger.debug("Forwarding event to: %s", hook)
+        logger.debug("Forwarding %d events to: %s", len(events), hook)
+        if settings.EVENT_REPORTING_WEBHOOKS_BATCH:
+            requests_data = [dict(data=json_dumps(events), headers={'Content-Type': 'application/json'})]
+        else:
+            requests_data = [dict(data=event) for event in events]
+
+        for data in requests_data:
+            try:
+                response = webhooks_session.post(hook, timeout=10, **data)
+                if response.status_code != 200:
+                    logger.error("Failed posting to %s: %s", hook, response.content)
+            except Exception:
+                logger.exception("Failed posting to %s", hook)
+
+
+def write_events(batch):
+    """
+    Writes a batch of buffered events, falling back to one at a time if the batch fails. Events that can't be written
+    are moved to the dead letter list. Returns the written events.
+    """
+    events = [json.loads(event) for event in batch]
+    try:
+        models.Event.record_many(events)
+        return events
+    except Exception:
+        logger.exception("Failed writing a batch of %d events, writing them one at a time.", len(events))
+
+    written = []
+    failed = []
+    for raw, event in zip(batch, events):
         try:
-            response = requests.post(hook, original_event)
-            if response.status_code != 200:
-                logger.error("Failed posting to %s: %s", hook, response.content)
+            models.Event.record_many([event])
+            written.append(event)
         except Exception:
-            logger.exception("Failed posting to %s", hook)
+            logger.exception("Failed writing event: %s", raw)
+            failed.append(raw)
+
+    if failed:
+        pipe = redis_connection.pipeline()
+        pipe.rpush(EVENTS_DEAD_LETTER_KEY, *failed)
+        pipe.ltrim(EVENTS_DEAD_LETTER_KEY, -EVENTS_DEAD_LETTER_MAX, -1)
+        pipe.execute()
+
+    return written
+
+
+@celery.task(name="redash.tasks.flush_events", base=BaseTask)
+def flush_events():
+    """
+    Writes the buffered events to the database and reports them to the webhooks, in batches. Only one flush runs at
+    a time: a batch is removed from the buffer once written (or moved to the dead letter list, for events that can't
+    be written).
+    """
+    lock_ttl = max(settings.EVENTS_FLUSH_INTERVAL * 10, 60)
+    token = uuid.uuid4().hex
+    if not redis_connection.set(EVENTS_FLUSH_LOCK_KEY, token, nx=True, ex=lock_ttl):
+        logger.info("Events are being flushed by another worker, skipping.")
+        return 0
+
+    flushed = 0
+    try:
+        while True:
+            batch = redis_connection.lrange(EVENTS_BUFFER_KEY, 0, settings.EVENTS_FLUSH_BATCH_SIZE - 1)
+            if not batch:
+                break
+
+            events = write_events(batch)
+            redis_connection.ltrim(EVENTS_BUFFER_KEY, len(batch), -1)
+            report_events(events)
+
+            flushed += len(events)
+            if len(batch) < settings.EVENTS_FLUSH_BATCH_SIZE:
+                break
+
+            if not extend_lock(keys=[EVENTS_FLUSH_LOCK_KEY], args=[token, lock_ttl]):
+                logger.warning("Lost the events flush lock, stopping.")
+                break
+    finally:
+        release_lock(keys=[EVENTS_FLUSH_LOCK_KEY], args=[token])
+
+    logger.info("Flushed %d events.", flushed)
+    return flushed
+
+
+@celery.task(name="redash.tasks.cleanup_events", base=BaseTask)
+def cleanup_events():
+    """
+    Creates the upcoming monthly partitions of the events table, deletes events past EVENTS_RETENTION_DAYS and
+    restores the recent activity rollups if Redis lost them.
+    """
+    if models.Event.is_partitioned():
+        models.Event.create_partitions()
+
+    if settings.EVENTS_RETENTION_DAYS > 0:
+        cutoff = datetime.date.today() - datetime.timedelta(days=settings.EVENTS_RETENTION_DAYS)
+        deleted = models.Event.delete_older_than(cutoff)
+        logger.info("Deleted %d events older than %s.", deleted, cutoff)
+
+    if not redis_connection.exists('activity:built'):
+        models.Event.rebuild_activity()
+
+
+@celery.task(name="redash.tasks.refresh_status", base=BaseTask)
+def refresh_status():
+    refresh_status_snapshot()
 
 
 @celery.task(name="redash.tasks.version_check", base=BaseTask)
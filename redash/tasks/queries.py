@@ -3,9 +3,13 @@ import time
 import logging
 import signal
 import redis
+from funcy import chunks
+from celery.exceptions import SoftTimeLimitExceeded
 from celery.result import AsyncResult
+from celery.utils import uuid
 from celery.utils.log import get_task_logger
 from redash import redis_connection, models, statsd_client, settings, utils
+from redash.metrics import tracing
 from redash.utils import gen_query_hash
 from redash.worker import celery
 from redash.query_runner import InterruptException
@@ -194,11 +198,27 @@ class QueryTask(object):
     def ready(self):
         return self._async_result.ready()
 
+    def wait(self, timeout, interval=0.1):
+        """Waits up to timeout seconds for the job to finish, and returns whether it did."""
+        deadline = time.time() + timeout
+        while not self.ready():
+            if time.time() >= deadline:
+                return False
+            time.sleep(interval)
+
+        return True
+
     def cancel(self):
         return self._async_result.revoke(terminate=True, signal='SIGINT')
 
 
 def enqueue_query(query, data_source, user_id, scheduled=False, metadata={}):
+    with tracing.span('enqueue_query', data_source_id=data_source.id):
+        # The worker continues the trace from the enqueue span.
+        return _enqueue_query(query, data_source, user_id, scheduled, dict(metadata, **tracing.trace_context()))
+
+
+def _enqueue_query(query, data_source, user_id, scheduled, metadata):
     query_hash = gen_query_hash(query)
     logging.info("Inserting job for %s with metadata=%s", query_hash, metadata)
     try_count = 0
@@ -248,27 +268,177 @@ def enqueue_query(query, data_source, user_id, scheduled=False, metadata={}):
     return job
 
 
+def enqueue_queries(queries, scheduled=False):
+    """
+    Batched version of enqueue_query: takes a list of (query, data_source, user_id, metadata) tuples and enqueues the
+    ones that don't have a running job already, using pipelined Redis round trips instead of a WATCH/GET/MULTI cycle
+    per query.
+
+    Returns a tuple of the jobs (in the same order as the given queries) and the number of Redis round trips made.
+    """
+    lock_ids = [_job_lock_id(gen_query_hash(query), data_source.id) for query, data_source, _, _ in queries]
+    jobs = [None] * len(queries)
+    round_trips = 0
+
+    with redis_connection.pipeline() as pipe:
+        try:
+            pipe.watch(*lock_ids)
+            job_ids = pipe.mget(lock_ids)
+            round_trips += 2
+
+            to_enqueue = {}
+            for i, (lock_id, job_id) in enumerate(zip(lock_ids, job_ids)):
+                if lock_id in to_enqueue:
+                    continue
+
+                if job_id:
+                    job = QueryTask(job_id=job_id)
+                    round_trips += 1
+                    if not job.ready():
+                        jobs[i] = job
+                        continue
+
+                    logging.info("[%s] job found is ready (%s), replacing lock", lock_id, job.celery_status)
+
+                to_enqueue[lock_id] = i
+
+            pipe.multi()
+            task_ids = {}
+            for lock_id, i in to_enqueue.iteritems():
+                query, data_source, user_id, metadata = queries[i]
+                task_ids[lock_id] = uuid()
+                tracker = QueryTaskTracker.create(task_ids[lock_id], 'created', gen_query_hash(query), data_source.id,
+                                                  scheduled, metadata)
+                tracker.save(connection=pipe)
+                pipe.set(lock_id, task_ids[lock_id], settings.JOB_EXPIRY_TIME)
+            pipe.execute()
+            round_trips += 1
+        except redis.WatchError:
+            # Some other process enqueued one of these queries in the meantime; fall back to enqueuing them one by
+            # one, which handles the contention.
+            logging.info("Lock contention while enqueuing a batch of %d queries, retrying one by one.", len(queries))
+            jobs = [enqueue_query(query, data_source, user_id, scheduled=scheduled, metadata=metadata)
+                    for query, data_source, user_id, metadata in queries]
+            return jobs, round_trips
+
+    for lock_id, i in to_enqueue.iteritems():
+        query, data_source, user_id, metadata = queries[i]
+        queue_name = data_source.scheduled_queue_name if scheduled else data_source.queue_name
+
+        try:
+            result = execute_query.apply_async(args=(query, data_source.id, metadata, user_id), queue=queue_name,
+                                               task_id=task_ids[lock_id])
+        except Exception:
+            logging.exception("[%s] Failed adding job for query.", lock_id)
+            redis_connection.delete(lock_id)
+            continue
+
+        jobs[i] = QueryTask(async_result=result)
+        logging.info("[%s] Created new job: %s", lock_id, result.id)
+
+    round_trips += len(to_enqueue)
+
+    # Duplicates of the same query (and data source) in the batch share the job:
+    jobs_by_lock_id = {lock_id: jobs[i] for lock_id, i in to_enqueue.iteritems()}
+    for i, lock_id in enumerate(lock_ids):
+        if jobs[i] is None:
+            jobs[i] = jobs_by_lock_id.get(lock_id)
+
+    return jobs, round_trips
+
+
+def _scheduler_lease_key(shard):
+    return "scheduler:lease:{}".format(shard)
+
+
+def acquire_scheduler_lease(shard, node_id):
+    """
+    Acquires (or renews) the lease of the given shard of the schedule space for node_id. Returns False if another
+    node holds the lease.
+    """
+    lease_key = _scheduler_lease_key(shard)
+
+    with redis_connection.pipeline() as pipe:
+        try:
+            pipe.watch(lease_key)
+            holder = pipe.get(lease_key)
+            if holder is not None and holder != node_id:
+                return False
+
+            pipe.multi()
+            pipe.set(lease_key, node_id, ex=settings.SCHEDULER_LEASE_TTL)
+            pipe.execute()
+        except redis.WatchError:
+            return False
+
+    return True
+
+
+def _update_manager_status(shard, outdated_queries_count, query_ids, now):
+    if settings.SCHEDULER_SHARDS <= 1:
+        redis_connection.hmset('redash:status', {
+            'outdated_queries_count': outdated_queries_count,
+            'last_refresh_at': now,
+            'query_ids': json.dumps(query_ids)
+        })
+        return
+
+    redis_connection.hmset('redash:status', {
+        'outdated_queries_count:{}'.format(shard): outdated_queries_count,
+        'query_ids:{}'.format(shard): json.dumps(query_ids)
+    })
+
+    status = redis_connection.hgetall('redash:status')
+    total_count = 0
+    all_query_ids = []
+    for s in range(settings.SCHEDULER_SHARDS):
+        total_count += int(status.get('outdated_queries_count:{}'.format(s), 0))
+        all_query_ids.extend(json.loads(status.get('query_ids:{}'.format(s), '[]')))
+
+    redis_connection.hmset('redash:status', {
+        'outdated_queries_count': total_count,
+        'last_refresh_at': now,
+        'query_ids': json.dumps(all_query_ids)
+    })
+
+
+# node_id is None when the task was sent by a beat that predates the scheduler lease; such ticks are always evaluated.
 @celery.task(name="redash.tasks.refresh_queries", base=BaseTask)
-def refresh_queries():
-    logger.info("Refreshing queries...")
+def refresh_queries(shard=0, node_id=None):
+    if node_id is not None and not acquire_scheduler_lease(shard, node_id):
+        logger.info("Skipping refresh of shard %d: scheduler lease is held by another node.", shard)
+        statsd_client.incr('manager.lease_skipped')
+        return
+
+    logger.info("Refreshing queries (shard %d of %d)...", shard, settings.SCHEDULER_SHARDS)
 
     outdated_queries_count = 0
     query_ids = []
+    redis_round_trips = 0
 
     with statsd_client.timer('manager.outdated_queries_lookup'):
-        for query in models.Query.outdated_queries():
+        outdated_queries = models.Query.outdated_queries(shard=shard, shards=settings.SCHEDULER_SHARDS)
+        pause_reasons = models.DataSource.pause_reasons(set(query.data_source_id for query in outdated_queries))
+        redis_round_trips += 1
+
+        queries_to_enqueue = []
+        for query in outdated_queries:
             if settings.FEATURE_DISABLE_REFRESH_QUERIES: 
                 logging.info("Disabled refresh queries.")
-            elif query.data_source.paused:
-                logging.info("Skipping refresh of %s because datasource - %s is paused (%s).", query.id, query.data_source.name, query.data_source.pause_reason)
+            elif query.data_source_id in pause_reasons:
+                logging.info("Skipping refresh of %s because datasource - %s is paused (%s).", query.id, query.data_source.name, pause_reasons[query.data_source_id])
             else:
-                enqueue_query(query.query, query.data_source, query.user_id,
-                              scheduled=True,
-                              metadata={'Query ID': query.id, 'Username': 'Scheduled'})
+                queries_to_enqueue.append((query.query, query.data_source, query.user_id,
+                                           {'Query ID': query.id, 'Username': 'Scheduled'}))
 
             query_ids.append(query.id)
             outdated_queries_count += 1
 
+        for batch in chunks(settings.SCHEDULER_ENQUEUE_BATCH_SIZE, queries_to_enqueue):
+            _, round_trips = enqueue_queries(batch, scheduled=True)
+            redis_round_trips += round_trips
+
+    statsd_client.gauge('manager.redis_round_trips', redis_round_trips)
     statsd_client.gauge('manager.outdated_queries', outdated_queries_count)
 
     logger.info("Done refreshing queries. Found %d outdated queries: %s" % (outdated_queries_count, query_ids))
@@ -276,11 +446,7 @@ def refresh_queries():
     status = redis_connection.hgetall('redash:status')
     now = time.time()
 
-    redis_connection.hmset('redash:status', {
-        'outdated_queries_count': outdated_queries_count,
-        'last_refresh_at': now,
-        'query_ids': json.dumps(query_ids)
-    })
+    _update_manager_status(shard, outdated_queries_count, query_ids, now)
 
     statsd_client.gauge('manager.seconds_since_refresh', now - float(status.get('last_refresh_at', now)))
 
@@ -325,7 +491,13 @@ def cleanup_query_results():
 
     Each time the job deletes only settings.QUERY_RESULTS_CLEANUP_COUNT (100 by default) query results so it won't choke
     the database in case of many such results.
+
+    Results that are no longer in a parameterized results cache are deleted sooner, see
+    QueryResult.delete_released_parameterized.
     """
+    released_count = models.QueryResult.delete_released_parameterized(settings.QUERY_RESULTS_CLEANUP_COUNT)
+    if released_count:
+        logger.info("Deleted %d query results released from parameterized results caches.", released_count)
 
     logging.info("Running query results clean up (removing maximum of %d unused results, that are %d days old or more)",
                  settings.QUERY_RESULTS_CLEANUP_COUNT, settings.QUERY_RESULTS_CLEANUP_MAX_AGE)
@@ -337,32 +509,85 @@ def cleanup_query_results():
     logger.info("Deleted %d unused query results out of total of %d." % (deleted_count, total_unused_query_results))
 
 
-@celery.task(name="redash.tasks.refresh_schemas", base=BaseTask)
-def refresh_schemas():
+def _schema_failures_key(data_source_id):
+    return "data_source:schema:failures:{}".format(data_source_id)
+
+
+def _schema_backoff_key(data_source_id):
+    return "data_source:schema:backoff:{}".format(data_source_id)
+
+
+def _schema_refresh_failed(data_source_id):
+    """
+    Backs off refreshing the schema of a failing data source: the backoff starts at half the refresh schedule and
+    doubles with every consecutive failure, up to settings.SCHEMA_REFRESH_MAX_BACKOFF.
+    """
+    failures = redis_connection.incr(_schema_failures_key(data_source_id))
+    backoff = min(settings.SCHEMAS_REFRESH_SCHEDULE * 30 * 2 ** (failures - 1), settings.SCHEMA_REFRESH_MAX_BACKOFF)
+
+    pipe = redis_connection.pipeline()
+    pipe.expire(_schema_failures_key(data_source_id), settings.SCHEMA_REFRESH_MAX_BACKOFF * 2)
+    pipe.set(_schema_backoff_key(data_source_id), failures, backoff)
+    pipe.execute()
+
+    return failures, backoff
+
+
+def _schema_refresh_succeeded(data_source_id):
+    redis_connection.delete(_schema_failures_key(data_source_id), _schema_backoff_key(data_source_id))
+
+
+@celery.task(name="redash.tasks.refresh_schema", base=BaseTask)
+def refresh_schema(data_source_id):
     """
-    Refreshes the data sources schemas.
+    Refreshes the schema of a single data source. Executed with a soft time limit of settings.SCHEMA_REFRESH_TIME_LIMIT.
     """
+    ds = models.DataSource.get_by_id(data_source_id)
+    logger.info(u"task=refresh_schema state=start ds_id=%s", ds.id)
+    start_time = time.time()
+    try:
+        ds.get_schema(refresh=True)
+        _schema_refresh_succeeded(ds.id)
+        state = 'finished'
+    except SoftTimeLimitExceeded:
+        failures, backoff = _schema_refresh_failed(ds.id)
+        logger.info(u"task=refresh_schema state=timeout ds_id=%s failures=%d backoff=%d", ds.id, failures, backoff)
+        state = 'timeout'
+    except Exception:
+        logger.exception(u"Failed refreshing schema for the data source: %s", ds.name)
+        failures, backoff = _schema_refresh_failed(ds.id)
+        logger.info(u"task=refresh_schema state=failed ds_id=%s failures=%d backoff=%d", ds.id, failures, backoff)
+        state = 'failed'
+
+    run_time = time.time() - start_time
+    logger.info(u"task=refresh_schema state=%s ds_id=%s runtime=%.2f", state, ds.id, run_time)
+    statsd_client.timing('refresh_schema.{}.runtime'.format(ds.id), run_time * 1000)
+    statsd_client.incr('refresh_schema.{}'.format(state))
 
-    blacklist = [int(ds_id) for ds_id in redis_connection.smembers('data_sources:schema:blacklist') if ds_id]
 
+@celery.task(name="redash.tasks.refresh_schemas", base=BaseTask)
+def refresh_schemas():
+    """
+    Refreshes the data sources schemas, by dispatching a refresh_schema task for each data source that isn't paused or
+    backing off after failures.
+    """
     global_start_time = time.time()
 
     logger.info(u"task=refresh_schemas state=start")
 
-    for ds in models.DataSource.select():
-        if ds.paused:
-            logger.info(u"task=refresh_schema state=skip ds_id=%s reason=paused(%s)", ds.id, ds.pause_reason)
-        elif ds.id in blacklist:
-            logger.info(u"task=refresh_schema state=skip ds_id=%s reason=blacklist", ds.id)
+    data_sources = list(models.DataSource.select())
+    pause_reasons = models.DataSource.pause_reasons([ds.id for ds in data_sources])
+    backoffs = redis_connection.mget([_schema_backoff_key(ds.id) for ds in data_sources]) if data_sources else []
+
+    for ds, backoff in zip(data_sources, backoffs):
+        if ds.id in pause_reasons:
+            logger.info(u"task=refresh_schema state=skip ds_id=%s reason=paused(%s)", ds.id, pause_reasons[ds.id])
+        elif backoff is not None:
+            logger.info(u"task=refresh_schema state=skip ds_id=%s reason=backoff(failures=%s)", ds.id, backoff)
         else:
-            logger.info(u"task=refresh_schema state=start ds_id=%s", ds.id)
-            start_time = time.time()
-            try:
-                ds.get_schema(refresh=True)
-                logger.info(u"task=refresh_schema state=finished ds_id=%s runtime=%.2f", ds.id, time.time() - start_time)
-            except Exception:
-                logger.exception(u"Failed refreshing schema for the data source: %s", ds.name)
-                logger.info(u"task=refresh_schema state=failed ds_id=%s runtime=%.2f", ds.id, time.time() - start_time)
+            refresh_schema.apply_async(args=(ds.id,),
+                                       soft_time_limit=settings.SCHEMA_REFRESH_TIME_LIMIT,
+                                       time_limit=settings.SCHEMA_REFRESH_TIME_LIMIT + 30)
 
     logger.info(u"task=refresh_schemas state=finish total_runtime=%.2f", time.time() - global_start_time)
 
@@ -383,11 +608,6 @@ class QueryExecutor(object):
         self.query = query
         self.data_source_id = data_source_id
         self.metadata = metadata
-        self.data_source = self._load_data_source()
-        if user_id is not None:
-            self.user = models.User.get_by_id(user_id)
-        else:
-            self.user = None
         self.query_hash = gen_query_hash(self.query)
         # Load existing tracker or create a new one if the job was created before code update:
         self.tracker = QueryTaskTracker.get_by_task_id(task.request.id) or QueryTaskTracker.create(task.request.id,
@@ -395,6 +615,15 @@ class QueryExecutor(object):
                                                                                                    self.query_hash,
                                                                                                    self.data_source_id,
                                                                                                    False, metadata)
+        tracing.record_span('queue_wait', self.tracker.data['created_at'],
+                            queue=task.request.delivery_info['routing_key'])
+
+        with tracing.span('load_data_source', data_source_id=data_source_id):
+            self.data_source = self._load_data_source()
+            if user_id is not None:
+                self.user = models.User.get_by_id(user_id)
+            else:
+                self.user = None
 
     def run(self):
         signal.signal(signal.SIGINT, signal_handler)
@@ -406,12 +635,19 @@ class QueryExecutor(object):
         query_runner = self.data_source.query_runner
         annotated_query = self._annotate_query(query_runner)
 
-        try:
-            data, error = query_runner.run_query(annotated_query, self.user)
-        except Exception as e:
-            error = unicode(e)
-            data = None
-            logging.warning('Unexpected error while running query:', exc_info=1)
+        with tracing.span('run_query', data_source_type=self.data_source.type) as span:
+            try:
+                data, error = query_runner.run_query(annotated_query, self.user)
+            except Exception as e:
+                error = unicode(e)
+                data = None
+                logging.warning('Unexpected error while running query:', exc_info=1)
+
+            if span is not None:
+                # Query runners return their results serialized, so this includes serializing them.
+                span.tags['data_length'] = len(data or '')
+                if error:
+                    span.tags['error'] = error
 
         run_time = time.time() - self.tracker.started_at
         self.tracker.update(error=error, run_time=run_time, state='saving_results')
@@ -424,9 +660,13 @@ class QueryExecutor(object):
             self.tracker.update(state='failed')
             result = QueryExecutionError(error)
         else:
-            query_result, updated_query_ids = models.QueryResult.store_result(self.data_source.org_id, self.data_source.id,
-                                                                              self.query_hash, self.query, data,
-                                                                              run_time, utils.utcnow())
+            with tracing.span('store_result'):
+                query_result, updated_query_ids = models.QueryResult.store_result(self.data_source.org_id,
+                                                                                  self.data_source.id, self.query_hash,
+                                                                                  self.query, data, run_time,
+                                                                                  utils.utcnow())
+                if 'Parameters Hash' in self.metadata:
+                    self._cache_parameterized_result(query_result)
             self._log_progress('checking_alerts')
             for query_id in updated_query_ids:
                 check_alerts_for_query.delay(query_id)
@@ -436,6 +676,14 @@ class QueryExecutor(object):
 
         return result
 
+    def _cache_parameterized_result(self, query_result):
+        try:
+            query = models.Query.select().where(models.Query.id == self.metadata['Query ID']).first()
+            if query is not None:
+                query.cache_parameterized_result(self.metadata['Parameters Hash'], query_result)
+        except Exception:
+            logger.exception("Failed caching the result of query %s.", self.metadata.get('Query ID'))
+
     def _annotate_query(self, query_runner):
         if query_runner.annotate_query():
             self.metadata['Task ID'] = self.task.request.id
@@ -464,4 +712,9 @@ class QueryExecutor(object):
 # jobs before the upgrade to this version.
 @celery.task(name="redash.tasks.execute_query", bind=True, base=BaseTask, track_started=True)
 def execute_query(self, query, data_source_id, metadata, user_id=None):
-    return QueryExecutor(self, query, data_source_id, user_id, metadata).run()
+    trace = tracing.start_trace('execute_query', 'redash-worker', metadata, data_source_id=data_source_id,
+                                query_id=metadata.get('Query ID'))
+    try:
+        return QueryExecutor(self, query, data_source_id, user_id, metadata).run()
+    finally:
+        tracing.finish_trace(trace)
@@ -1,7 +1,6 @@
 import cStringIO
 import csv
 import codecs
-import decimal
 import datetime
 import json
 import random
@@ -13,6 +12,7 @@ import pystache
 from funcy import distinct
 
 from .human_time import parse_human_time
+from . import serialization
 from redash import settings
 
 COMMENTS_REGEX = re.compile("/\*.*?\*/")
@@ -57,20 +57,11 @@ class JSONEncoder(json.JSONEncoder):
     """Custom JSON encoding class, to handle Decimal and datetime.date instances."""
 
     def default(self, o):
-        if isinstance(o, decimal.Decimal):
-            return float(o)
-
-        if isinstance(o, (datetime.date, datetime.time)):
-            return o.isoformat()
-
-        if isinstance(o, datetime.timedelta):
-            return str(o)
-
-        super(JSONEncoder, self).default(o)
+        return serialization.default(o)
 
 
 def json_dumps(data):
-    return json.dumps(data, cls=JSONEncoder)
+    return json.dumps(data, default=serialization.default)
 
 
 def build_url(request, host, path):
@@ -0,0 +1,113 @@
+import json
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class InvalidatedCache(object):
+    """
+    Process memory cache, for data that's read far more often than it changes.
+
+    Entries expire after `ttl` seconds. `invalidate` drops an entry right away in every process: it publishes the key on
+    a Redis channel, which each process listens to from a background thread (started on first use, and again after a
+    fork). `invalidate_all` does the same for every entry. Keys must be JSON serializable (but not JSON objects).
+
+    A value loaded before an invalidation could otherwise be set right after it, and served until it expires: readers
+    should get the key's `generation` before loading the value and pass it to `set`, which skips the value if the key
+    was invalidated (or the cache cleared) since.
+    """
+
+    def __init__(self, redis_connection, channel, ttl):
+        self.redis_connection = redis_connection
+        self.channel = channel
+        self.ttl = ttl
+        self._entries = {}
+        self._generations = {}
+        self._epoch = 0
+        self._listener_pid = None
+        self._subscribed = threading.Event()
+        self._lock = threading.Lock()
+        self._entries_lock = threading.Lock()
+
+    def get(self, key):
+        self._ensure_listener()
+
+        entry = self._entries.get(key)
+        if entry is None or entry[0] < time.time():
+            return None
+
+        return entry[1]
+
+    def generation(self, key):
+        self._ensure_listener()
+        return self._epoch, self._generations.get(key, 0)
+
+    def set(self, key, value, generation=None):
+        self._ensure_listener()
+        with self._entries_lock:
+            if generation is not None and generation != (self._epoch, self._generations.get(key, 0)):
+                return
+            self._entries[key] = (time.time() + self.ttl, value)
+
+    def invalidate(self, key):
+        self._drop(key)
+        self.redis_connection.publish(self.channel, json.dumps(key))
+
+    def invalidate_all(self):
+        self.clear()
+        self.redis_connection.publish(self.channel, json.dumps({'all': True}))
+
+    def clear(self):
+        with self._entries_lock:
+            self._entries.clear()
+            self._epoch += 1
+
+    def _drop(self, key):
+        with self._entries_lock:
+            self._entries.pop(key, None)
+            self._generations[key] = self._generations.get(key, 0) + 1
+
+    def _ensure_listener(self):
+        if self._listener_pid == os.getpid():
+            return
+
+        with self._lock:
+            if self._listener_pid == os.getpid():
+                return
+
+            # Entries inherited from a parent process might have missed invalidations.
+            self.clear()
+            self._subscribed.clear()
+            self._listener_pid = os.getpid()
+
+            listener = threading.Thread(target=self._listen, name='{}-listener'.format(self.channel))
+            listener.daemon = True
+            listener.start()
+
+    def _listen(self):
+        while True:
+            try:
+                pubsub = self.redis_connection.pubsub()
+                pubsub.subscribe(self.channel)
+                for message in pubsub.listen():
+                    if message['type'] == 'subscribe':
+                        # Invalidations published until now (while starting, or disconnected) were missed.
+                        self.clear()
+                        self._subscribed.set()
+                        continue
+
+                    if message['type'] != 'message':
+                        continue
+
+                    key = json.loads(message['data'])
+                    if isinstance(key, dict):
+                        self.clear()
+                    else:
+                        self._drop(key)
+            except Exception:
+                self._subscribed.clear()
+                logger.exception("Lost subscription to %s, resubscribing.", self.channel)
+                time.sleep(1)
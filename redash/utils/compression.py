@@ -0,0 +1,34 @@
+import zlib
+
+try:
+    import brotli
+    enabled_brotli = True
+except ImportError:
+    enabled_brotli = False
+
+
+def gzip_compress(data, level):
+    # wbits of 16 + MAX_WBITS makes zlib write a gzip header and trailer.
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return compressor.compress(data) + compressor.flush()
+
+
+def brotli_compress(data, level):
+    # Brotli qualities go up to 11; map the gzip style 1-9 levels onto them.
+    return brotli.compress(data, quality=min(11, level + 1))
+
+
+def supported_encodings():
+    """The content encodings that can be produced, best first."""
+    if enabled_brotli:
+        return ('br', 'gzip')
+    return ('gzip',)
+
+
+def compress(data, encoding, level):
+    if encoding == 'br':
+        return brotli_compress(data, level)
+    if encoding == 'gzip':
+        return gzip_compress(data, level)
+
+    raise ValueError("Unsupported content encoding: {}".format(encoding))
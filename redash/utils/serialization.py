@@ -0,0 +1,145 @@
+"""
+JSON serialization of query results.
+
+Query runners hand over results with values JSON has no type for (decimals, dates, times, ...). Rather than have the
+encoder call back into Python for each of those, serialize_query_result converts them up front, a column at a time
+(picking the conversion once per column), and then encodes the result with JSON_ENCODER: the standard library's `json`
+by default, or `simplejson` or `ujson` when installed. Run bin/benchmark_serialization.py to compare them on typical
+results.
+"""
+import datetime
+import decimal
+import json
+import logging
+
+from redash import settings
+
+logger = logging.getLogger(__name__)
+
+# Exact types only: subclasses (and anything else) are left to the encoder's default hook.
+CONVERTERS = {
+    decimal.Decimal: float,
+    datetime.datetime: datetime.datetime.isoformat,
+    datetime.date: datetime.date.isoformat,
+    datetime.time: datetime.time.isoformat,
+    datetime.timedelta: str,
+}
+
+
+def default(o):
+    """Encodes the types JSON has no representation for, for the encoders' `default` hook."""
+    if isinstance(o, decimal.Decimal):
+        return float(o)
+
+    if isinstance(o, (datetime.date, datetime.time)):
+        return o.isoformat()
+
+    if isinstance(o, datetime.timedelta):
+        return str(o)
+
+    raise TypeError(repr(o) + " is not JSON serializable")
+
+
+def _json_dumps(obj):
+    return json.dumps(obj, default=default)
+
+
+encoders = {'json': _json_dumps}
+# Encoders without a `default` hook, that encode the values convert_rows leaves (like dates in a column starting with
+# strings) wrongly instead of failing: ujson writes dates as timestamps and decimals as doubles. Every value is
+# converted before using them.
+encoders_without_default = set()
+
+try:
+    import simplejson
+    encoders['simplejson'] = lambda obj: simplejson.dumps(obj, default=default, use_decimal=False)
+except ImportError:
+    pass
+
+try:
+    import ujson
+    # ujson rounds floats to double_precision significant digits (15 at most).
+    encoders['ujson'] = lambda obj: ujson.dumps(obj, double_precision=15)
+    encoders_without_default.add('ujson')
+except ImportError:
+    pass
+
+
+def _encoder_name(name=None):
+    name = name or settings.JSON_ENCODER
+    if name not in encoders:
+        logger.warning("JSON encoder %s isn't available, using json instead.", name)
+        name = 'json'
+
+    return name
+
+
+def get_encoder(name=None):
+    return encoders[_encoder_name(name)]
+
+
+def convert_rows(columns, rows):
+    """
+    Replaces the values JSON has no type for in `rows` (a list of dicts), in place, one column at a time. The conversion
+    is picked by the type of the column's first value that isn't null; values of other types are left to the encoder's
+    default hook.
+    """
+    if not rows or not isinstance(rows[0], dict):
+        return rows
+
+    for column in columns:
+        name = column['name']
+        value_type = next((type(row[name]) for row in rows if row.get(name) is not None), None)
+        convert = CONVERTERS.get(value_type)
+        if convert is None:
+            continue
+
+        for row in rows:
+            value = row.get(name)
+            if type(value) is value_type:
+                row[name] = convert(value)
+
+    return rows
+
+
+# Types every encoder writes the same way.
+JSON_TYPES = frozenset([type(None), bool, int, long, float, str, unicode])
+
+
+def convert_value(value):
+    """Converts a value (and the values of lists and dicts) to JSON types, with `default`."""
+    value_type = type(value)
+    if value_type in JSON_TYPES:
+        return value
+
+    if value_type in (list, tuple):
+        return [convert_value(v) for v in value]
+
+    if value_type is dict:
+        return {k: convert_value(v) for k, v in value.iteritems()}
+
+    return default(value)
+
+
+def serialize_query_result(data, encoder=None):
+    """
+    Serializes a query runner's result (a dict with `columns` and `rows`) to JSON. Converts the rows in place.
+    """
+    convert_rows(data.get('columns') or [], data.get('rows'))
+
+    name = _encoder_name(encoder)
+    dumps = encoders[name]
+    if name in encoders_without_default:
+        try:
+            data = convert_value(data)
+        except TypeError:
+            # Left for the standard library encoder, which fails the same way.
+            dumps = _json_dumps
+    try:
+        return dumps(data)
+    except (TypeError, OverflowError, ValueError):
+        if dumps is _json_dumps:
+            raise
+
+        # Types that weren't converted, which only the standard library encoder's default hook handles.
+        return _json_dumps(data)
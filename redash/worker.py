@@ -1,5 +1,7 @@
 from __future__ import absolute_import
 
+import os
+import socket
 from random import randint
 from celery import Celery
 from datetime import timedelta
@@ -13,10 +15,6 @@ celery = Celery('redash',
                 include='redash.tasks')
 
 celery_schedule = {
-    'refresh_queries': {
-        'task': 'redash.tasks.refresh_queries',
-        'schedule': timedelta(seconds=30)
-    },
     'cleanup_tasks': {
         'task': 'redash.tasks.cleanup_tasks',
         'schedule': timedelta(minutes=5)
@@ -24,9 +22,31 @@ celery_schedule = {
     'refresh_schemas': {
         'task': 'redash.tasks.refresh_schemas',
         'schedule': timedelta(minutes=settings.SCHEMAS_REFRESH_SCHEDULE)
+    },
+    'flush_events': {
+        'task': 'redash.tasks.flush_events',
+        'schedule': timedelta(seconds=settings.EVENTS_FLUSH_INTERVAL)
+    },
+    'cleanup_events': {
+        'task': 'redash.tasks.cleanup_events',
+        'schedule': timedelta(hours=1)
+    },
+    'refresh_status': {
+        'task': 'redash.tasks.refresh_status',
+        'schedule': timedelta(seconds=settings.STATUS_REFRESH_INTERVAL)
     }
 }
 
+# Identifies this beat when competing for the scheduler lease (see redash.tasks.queries.acquire_scheduler_lease).
+scheduler_node_id = "{}:{}".format(socket.gethostname(), os.getpid())
+
+for shard in range(settings.SCHEDULER_SHARDS):
+    celery_schedule['refresh_queries_{}'.format(shard)] = {
+        'task': 'redash.tasks.refresh_queries',
+        'schedule': timedelta(seconds=30),
+        'args': (shard, scheduler_node_id)
+    }
+
 if settings.VERSION_CHECK:
     celery_schedule['version_check'] = {
         'task': 'redash.tasks.version_check',
@@ -37,8 +37,10 @@ class BaseTestCase(TestCase):
         redash.models.db.close_db(None)
         redash.models.create_db(False, True)
         redis_connection.flushdb()
+        redash.models.data_source_groups_cache.clear()
+        redash.models.organizations_cache.clear()
 
-    def make_request(self, method, path, org=None, user=None, data=None, is_json=True):
+    def make_request(self, method, path, org=None, user=None, data=None, is_json=True, headers=None):
         if user is None:
             user = self.factory.user
 
@@ -48,7 +50,7 @@ class BaseTestCase(TestCase):
         if org is not False:
             path = "/{}{}".format(org.slug, path)
 
-        return make_request(method, path, user, data, is_json)
+        return make_request(method, path, user, data, is_json, headers)
 
     def assertResponseEqual(self, expected, actual):
         for k, v in expected.iteritems():
@@ -37,13 +37,13 @@ def json_request(method, path, data=None):
     return response
 
 
-def make_request(method, path, user, data=None, is_json=True):
+def make_request(method, path, user, data=None, is_json=True, headers=None):
     with app.test_client() as c:
         if user:
             authenticate_request(c, user)
 
         method_fn = getattr(c, method.lower())
-        headers = {}
+        headers = headers or {}
 
         if data and is_json:
             data = json_dumps(data)
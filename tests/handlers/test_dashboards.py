@@ -1,6 +1,10 @@
 import json
+import zlib
+
+from mock import patch
+
 from tests import BaseTestCase
-from redash.models import ApiKey, Dashboard, AccessPermission
+from redash.models import ApiKey, Dashboard, AccessPermission, Widget
 from redash.permissions import ACCESS_TYPE_MODIFY
 
 
@@ -46,6 +50,17 @@ class TestDashboardResourceGet(BaseTestCase):
         rv = self.make_request('get', '/api/dashboards/not_existing')
         self.assertEquals(rv.status_code, 404)
 
+    def test_compresses_dashboard(self):
+        d1 = self.factory.create_dashboard()
+
+        with patch('redash.settings.COMPRESS_MIN_SIZE', 0):
+            rv = self.make_request('get', '/api/dashboards/{0}'.format(d1.slug), is_json=False,
+                                   headers={'Accept-Encoding': 'gzip'})
+
+        self.assertEqual('gzip', rv.headers['Content-Encoding'])
+        actual = json.loads(zlib.decompress(rv.data, 16 + zlib.MAX_WBITS))
+        self.assertResponseEqual(d1.to_dict(with_widgets=True), actual)
+
 
 class TestDashboardResourcePost(BaseTestCase):
     def test_update_dashboard(self):
@@ -156,3 +171,56 @@ class TestDashboardShareResourceDelete(BaseTestCase):
 
         res = self.make_request('delete', '/api/dashboards/{}/share'.format(dashboard.id), user=user)
         self.assertEqual(res.status_code, 200)
+
+
+class TestPublicDashboardResourceGet(BaseTestCase):
+    def create_public_dashboard(self):
+        dashboard = self.factory.create_dashboard()
+        widgets = []
+        for data in ('{"rows": [{"a": 1}], "columns": []}', '{"rows": [{"b": 2}], "columns": []}'):
+            query_result = self.factory.create_query_result(data=data)
+            query = self.factory.create_query(latest_query_data=query_result)
+            visualization = self.factory.create_visualization(query=query)
+            widgets.append(self.factory.create_widget(dashboard=dashboard, visualization=visualization))
+        widgets.append(self.factory.create_widget(dashboard=dashboard, visualization=None, text='text'))
+        dashboard.layout = json.dumps([[w.id for w in widgets]])
+        dashboard.save()
+
+        api_key = self.factory.create_api_key(object=dashboard)
+        return dashboard, api_key
+
+    def test_embeds_query_results(self):
+        dashboard, api_key = self.create_public_dashboard()
+
+        rv = self.make_request('get', '/api/dashboards/public/{}'.format(api_key.api_key))
+        self.assertEqual(rv.status_code, 200)
+
+        widgets = rv.json['widgets'][0]
+        self.assertEqual([{'a': 1}], widgets[0]['visualization']['query']['latest_query_data']['data']['rows'])
+        self.assertEqual([{'b': 2}], widgets[1]['visualization']['query']['latest_query_data']['data']['rows'])
+        self.assertEqual('text', widgets[2]['text'])
+
+    def test_loads_results_with_one_query(self):
+        dashboard, api_key = self.create_public_dashboard()
+
+        with patch('redash.models.QueryResult.get_by_id') as get_by_id:
+            rv = self.make_request('get', '/api/dashboards/public/{}'.format(api_key.api_key))
+            self.assertEqual(rv.status_code, 200)
+            self.assertFalse(get_by_id.called)
+
+    def test_serves_cached_payload_until_results_change(self):
+        dashboard, api_key = self.create_public_dashboard()
+        path = '/api/dashboards/public/{}'.format(api_key.api_key)
+        self.make_request('get', path)
+
+        with patch('redash.models.QueryResult.select') as select:
+            rv = self.make_request('get', path)
+            self.assertEqual(rv.status_code, 200)
+            self.assertFalse(select.called)
+
+        query = Widget.get_by_id(rv.json['widgets'][0][0]['id']).visualization.query
+        query.latest_query_data = self.factory.create_query_result(data='{"rows": [{"a": 3}], "columns": []}')
+        query.save()
+
+        rv = self.make_request('get', path)
+        self.assertEqual([{'a': 3}], rv.json['widgets'][0][0]['visualization']['query']['latest_query_data']['data']['rows'])
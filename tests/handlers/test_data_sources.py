@@ -1,6 +1,7 @@
 import json
 
 from funcy import pairwise
+from mock import patch, PropertyMock
 
 from tests import BaseTestCase
 from redash.models import DataSource
@@ -17,6 +18,61 @@ class TestDataSourceGetSchema(BaseTestCase):
         self.assertEqual(response.status_code, 404)
 
 
+class TestDataSourceSchemaSearch(BaseTestCase):
+    def setUp(self):
+        super(TestDataSourceSchemaSearch, self).setUp()
+        patcher = patch('redash.models.DataSource.query_runner', new_callable=PropertyMock)
+        self.query_runner = patcher.start().return_value
+        self.addCleanup(patcher.stop)
+
+        self.query_runner.get_table_versions.return_value = None
+        self.query_runner.get_schema.return_value = [{'name': 'public.users', 'columns': ['id', 'email']},
+                                                {'name': 'events', 'columns': ['id', 'user_id']},
+                                                {'name': 'queries', 'columns': ['id', 'query']}]
+        self.path = "/api/data_sources/{}/schema".format(self.factory.data_source.id)
+
+    def test_returns_full_schema_without_arguments(self):
+        response = self.make_request("get", self.path)
+        self.assertEqual(['events', 'public.users', 'queries'], [t['name'] for t in response.json])
+
+    def test_paginates_tables_without_columns(self):
+        response = self.make_request("get", self.path + "?page=2&page_size=2")
+        self.assertEqual(3, response.json['count'])
+        self.assertEqual([{'name': 'queries'}], response.json['results'])
+
+    def test_searches_table_and_column_names(self):
+        response = self.make_request("get", self.path + "?q=US&columns=true")
+        self.assertEqual([{'name': 'events', 'columns': ['id', 'user_id']},
+                          {'name': 'public.users', 'columns': ['id', 'email']}], response.json['results'])
+
+    def test_returns_single_table(self):
+        response = self.make_request("get", self.path + "/public.users")
+        self.assertEqual({'name': 'public.users', 'columns': ['id', 'email']}, response.json)
+
+        response = self.make_request("get", self.path + "/missing")
+        self.assertEqual(404, response.status_code)
+
+    def test_returns_not_modified_for_current_etag(self):
+        response = self.make_request("get", self.path)
+        etag = response.headers['ETag']
+
+        response = self.make_request("get", self.path + "?page=1", headers={'If-None-Match': etag})
+        self.assertEqual(304, response.status_code)
+
+        self.factory.data_source.refresh_schema()
+        response = self.make_request("get", self.path, headers={'If-None-Match': etag})
+        self.assertEqual(304, response.status_code)
+
+    def test_returns_schema_when_etag_is_stale(self):
+        response = self.make_request("get", self.path)
+        etag = response.headers['ETag']
+
+        self.query_runner.get_schema.return_value = [{'name': 'events', 'columns': ['id']}]
+        response = self.make_request("get", self.path + "?refresh", headers={'If-None-Match': etag})
+        self.assertEqual(200, response.status_code)
+        self.assertEqual([{'name': 'events', 'columns': ['id']}], response.json)
+
+
 class TestDataSourceListGet(BaseTestCase):
     def test_returns_each_data_source_once(self):
         group = self.factory.create_group()
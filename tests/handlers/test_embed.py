@@ -1,4 +1,8 @@
-from redash import settings
+from mock import MagicMock, patch
+
+from redash import models, settings
+from redash.tasks import QueryTask, execute_query
+from redash.utils import gen_query_hash
 from tests import BaseTestCase
 
 
@@ -11,34 +15,121 @@ class TestEmbedVisualization(BaseTestCase):
         res = self.make_request("get", "/embed/query/{}/visualization/{}".format(vis.query.id, vis.id), is_json=False)
         self.assertEqual(res.status_code, 200)
 
-    # TODO: bring back?
-    # def test_parameters_on_embeds(self):
-    #     previous = settings.ALLOW_PARAMETERS_IN_EMBEDS
-    #     # set configuration
-    #     settings.ALLOW_PARAMETERS_IN_EMBEDS = True
-    #
-    #     try:
-    #         vis = self.factory.create_visualization_with_params()
-    #         param1_name = "param1"
-    #         param1_value = "12345"
-    #
-    #         res = self.make_request("get", "/embed/query/{}/visualization/{}?p_{}={}".format(vis.query.id, vis.id, param1_name, param1_value), is_json=False)
-    #
-    #         # Currently we are expecting a 503 error which indicates that
-    #         # the database is unavailable. This ensures that the code in embed.py
-    #         # reaches the point where a DB query is made, where we then fail
-    #         # intentionally (because DB connection is not available in the tests).
-    #         self.assertEqual(res.status_code, 503)
-    #
-    #         # run embed query with maxAge to test caching
-    #         res = self.make_request("get", "/embed/query/{}/visualization/{}?p_{}={}&maxAge=60".format(vis.query.id, vis.id, param1_name, param1_value), is_json=False)
-    #         # If the 'maxAge' parameter is set and the query fails (because DB connection
-    #         # is not available in the tests), we're expecting a 404 error here.
-    #         self.assertEqual(res.status_code, 404)
-    #
-    #     finally:
-    #         # reset configuration
-    #         settings.ALLOW_PARAMETERS_IN_EMBEDS = previous
+
+class TestEmbedQueryParameters(BaseTestCase):
+    def setUp(self):
+        super(TestEmbedQueryParameters, self).setUp()
+        self.query = self.factory.create_query_with_params()
+        self.path = '/api/queries/{}/results.json?p_param1=12345'.format(self.query.id)
+        self.patcher = patch.object(settings, 'ALLOW_PARAMETERS_IN_EMBEDS', True)
+        self.patcher.start()
+
+    def tearDown(self):
+        self.patcher.stop()
+        super(TestEmbedQueryParameters, self).tearDown()
+
+    def job(self, ready, status=1, query_result_id=None):
+        job = MagicMock()
+        job.wait.return_value = ready
+        job.to_dict.return_value = {'id': 'job-id', 'status': status, 'error': '', 'query_result_id': query_result_id}
+        return job
+
+    def test_serves_cached_result(self):
+        query_result = self.factory.create_query_result(query='SELECT 12345', query_hash=gen_query_hash('SELECT 12345'))
+        self.query.cache_parameterized_result(models.Query.parameters_hash(self.query.data_source.id, self.query.query,
+                                                                           {'param1': '12345'}),
+                                              query_result)
+
+        rv = self.make_request('get', self.path + '&max_age=-1')
+        self.assertEqual(200, rv.status_code)
+        self.assertEqual(query_result.id, rv.json['query_result']['id'])
+
+    def test_waits_for_the_job(self):
+        query_result = self.factory.create_query_result(query='SELECT 12345')
+        job = self.job(True, status=3, query_result_id=query_result.id)
+        with patch('redash.handlers.query_results.enqueue_query', return_value=job) as enqueue_query:
+            rv = self.make_request('get', self.path)
+
+        self.assertEqual(200, rv.status_code)
+        self.assertEqual(query_result.id, rv.json['query_result']['id'])
+        self.assertEqual('SELECT 12345', enqueue_query.call_args[0][0])
+        job.wait.assert_called_with(settings.EMBED_QUERY_WAIT_TIMEOUT)
+
+    def test_runs_for_api_key(self):
+        self.query.api_key = 'query-api-key'
+        self.query.save()
+
+        with patch('redash.handlers.query_results.enqueue_query', return_value=self.job(False)) as enqueue_query:
+            rv = self.make_request('get', self.path + '&api_key=query-api-key', user=False)
+
+        self.assertEqual(202, rv.status_code)
+        self.assertIsNone(enqueue_query.call_args[0][2])
+
+    def test_requires_the_query_api_key(self):
+        dashboard_api_key = self.factory.create_api_key(object=self.factory.create_dashboard())
+
+        with patch('redash.handlers.query_results.enqueue_query') as enqueue_query:
+            rv = self.make_request('get', self.path + '&api_key=' + dashboard_api_key.api_key, user=False)
+
+        self.assertEqual(403, rv.status_code)
+        self.assertEqual(0, enqueue_query.call_count)
+
+    def test_requires_permission_to_run_queries(self):
+        view_only_group = self.factory.create_group()
+        self.query.data_source.add_group(view_only_group, view_only=True)
+        view_only_user = self.factory.create_user(groups=[view_only_group.id])
+        viewer_group = self.factory.create_group(permissions=['view_query'])
+        self.query.data_source.add_group(viewer_group)
+        viewer = self.factory.create_user(groups=[viewer_group.id])
+
+        with patch('redash.handlers.query_results.enqueue_query') as enqueue_query:
+            self.assertEqual(403, self.make_request('get', self.path, user=view_only_user).status_code)
+            self.assertEqual(403, self.make_request('get', self.path, user=viewer).status_code)
+
+        self.assertEqual(0, enqueue_query.call_count)
+
+    def test_rejects_invalid_max_age(self):
+        with patch('redash.handlers.query_results.enqueue_query', return_value=self.job(False)) as enqueue_query:
+            rv = self.make_request('get', self.path + '&max_age=abc')
+
+        self.assertEqual(202, rv.status_code)
+        self.assertEqual(1, enqueue_query.call_count)
+
+    def test_returns_job_when_not_finished_in_time(self):
+        with patch('redash.handlers.query_results.enqueue_query', return_value=self.job(False)):
+            rv = self.make_request('get', self.path)
+
+        self.assertEqual(202, rv.status_code)
+        self.assertEqual('job-id', rv.json['job']['id'])
+
+    def test_returns_failed_job(self):
+        with patch('redash.handlers.query_results.enqueue_query', return_value=self.job(True, status=4)):
+            rv = self.make_request('get', self.path)
+
+        self.assertEqual(400, rv.status_code)
+
+    def test_viewers_share_the_job(self):
+        async_result = MagicMock(id='job-id', status='PENDING', result=None)
+        with patch.object(execute_query, 'apply_async', return_value=async_result) as apply_async, \
+                patch.object(QueryTask, 'wait', return_value=False):
+            first = self.make_request('get', self.path)
+            second = self.make_request('get', self.path, user=self.factory.create_user())
+
+        self.assertEqual(1, apply_async.call_count)
+        self.assertEqual('job-id', first.json['job']['id'])
+        self.assertEqual('job-id', second.json['job']['id'])
+
+    def test_ignores_parameters_when_not_allowed(self):
+        self.query.latest_query_data = self.factory.create_query_result()
+        self.query.save()
+
+        with patch.object(settings, 'ALLOW_PARAMETERS_IN_EMBEDS', False), \
+                patch('redash.handlers.query_results.enqueue_query') as enqueue_query:
+            rv = self.make_request('get', self.path)
+
+        self.assertEqual(200, rv.status_code)
+        self.assertEqual(self.query.latest_query_data.id, rv.json['query_result']['id'])
+        self.assertEqual(0, enqueue_query.call_count)
 
 
 # TODO: this should be applied to the new API endpoint
@@ -1,8 +1,12 @@
+from datetime import timedelta
+
 from werkzeug.exceptions import BadRequest
 
 from redash.handlers.base import paginate
+from redash.utils import utcnow
 from unittest import TestCase
 from mock import MagicMock
+from tests import BaseTestCase
 
 dummy_results = [i for i in range(25)]
 
@@ -28,3 +32,68 @@ class TestPaginate(TestCase):
         self.assertRaises(BadRequest, lambda: paginate(self.query_set, 1, 251, lambda x: x))
         self.assertRaises(BadRequest, lambda: paginate(self.query_set, 1, -1, lambda x: x))
 
+
+
+class TestKeysetPaginate(BaseTestCase):
+    def setUp(self):
+        super(TestKeysetPaginate, self).setUp()
+        now = utcnow()
+        # Two queries share a created_at, to check ties are broken by id.
+        self.queries = [self.factory.create_query(is_draft=False, created_at=now - timedelta(minutes=i // 2))
+                        for i in range(5)]
+
+    def get_pages(self, path):
+        ids, cursor, pages = [], '', 0
+        while cursor is not None:
+            rv = self.make_request('get', path + '&cursor=' + cursor)
+            self.assertEqual(rv.status_code, 200)
+            ids.extend(q['id'] for q in rv.json['results'])
+            cursor = rv.json['next_cursor']
+            pages += 1
+
+        return ids, pages
+
+    def test_walks_all_results_newest_first(self):
+        ids, pages = self.get_pages('/api/queries?page_size=2')
+
+        expected = [q.id for q in sorted(self.queries, key=lambda q: (q.created_at, q.id), reverse=True)]
+        self.assertEqual(expected, ids)
+        self.assertEqual(3, pages)
+
+    def test_last_full_page_has_no_next_cursor(self):
+        rv = self.make_request('get', '/api/queries?page_size=5&cursor=')
+        self.assertEqual(5, len(rv.json['results']))
+        self.assertIsNone(rv.json['next_cursor'])
+
+    def test_count_is_optional(self):
+        rv = self.make_request('get', '/api/queries?page_size=2&cursor=')
+        self.assertNotIn('count', rv.json)
+
+        rv = self.make_request('get', '/api/queries?page_size=2&cursor=&count=exact')
+        self.assertEqual(5, rv.json['count'])
+
+        rv = self.make_request('get', '/api/queries?page_size=2&cursor=&count=estimate')
+        self.assertIsInstance(rv.json['count'], int)
+
+    def test_rejects_invalid_cursor(self):
+        rv = self.make_request('get', '/api/queries?cursor=nonsense')
+        self.assertEqual(rv.status_code, 400)
+
+    def test_keeps_page_based_pagination(self):
+        rv = self.make_request('get', '/api/queries?page=2&page_size=2')
+        self.assertEqual(5, rv.json['count'])
+        self.assertEqual(2, rv.json['page'])
+        self.assertEqual(2, len(rv.json['results']))
+
+    def test_paginates_dashboards_and_users(self):
+        for i in range(2):
+            self.factory.create_dashboard()
+            self.factory.create_user()
+
+        rv = self.make_request('get', '/api/dashboards?page_size=1&cursor=')
+        self.assertEqual(1, len(rv.json['results']))
+        self.assertIsNotNone(rv.json['next_cursor'])
+
+        rv = self.make_request('get', '/api/users?page_size=2&cursor=&count=exact')
+        self.assertEqual(3, rv.json['count'])
+        self.assertEqual(2, len(rv.json['results']))
@@ -1,5 +1,12 @@
+import gzip
 import json
+from cStringIO import StringIO
+
+from mock import patch
+
 from tests import BaseTestCase
+from redash import models
+from redash.utils import gen_query_hash, utcnow
 
 
 class TestQueryResultsCacheHeaders(BaseTestCase):
@@ -80,6 +87,51 @@ class TestQueryResultListAPI(BaseTestCase):
         self.assertEquals(rv.status_code, 200)
         self.assertIn('job', rv.json)
 
+    def test_serves_parameterized_result_from_cache(self):
+        query = self.factory.create_query_with_params()
+        query_result = self.factory.create_query_result()
+        query.cache_parameterized_result(models.Query.parameters_hash(query.data_source.id, query.query, {'param1': '1'}),
+                                         query_result)
+
+        rv = self.make_request('post', '/api/query_results?p_param1=1',
+                               data={'data_source_id': self.factory.data_source.id, 'query': query.query,
+                                     'query_id': query.id, 'max_age': -1})
+
+        self.assertEquals(rv.status_code, 200)
+        self.assertEqual(query_result.id, rv.json['query_result']['id'])
+
+    def test_caches_parameterized_result_of_saved_query(self):
+        query = self.factory.create_query_with_params()
+
+        with patch('redash.handlers.query_results.enqueue_query') as enqueue_query:
+            enqueue_query.return_value.to_dict.return_value = {}
+            self.make_request('post', '/api/query_results?p_param1=1',
+                              data={'data_source_id': self.factory.data_source.id, 'query': query.query,
+                                    'query_id': query.id, 'max_age': -1})
+            self.make_request('post', '/api/query_results?p_param1=1',
+                              data={'data_source_id': self.factory.data_source.id, 'query': query.query,
+                                    'max_age': -1})
+
+        self.assertEqual(models.Query.parameters_hash(query.data_source.id, query.query, {'param1': '1'}),
+                         enqueue_query.call_args_list[0][1]['metadata']['Parameters Hash'])
+        self.assertNotIn('Parameters Hash', enqueue_query.call_args_list[1][1]['metadata'])
+
+    def test_parameterized_results_cache_is_kept_per_data_source(self):
+        query = self.factory.create_query_with_params()
+        query.cache_parameterized_result(models.Query.parameters_hash(query.data_source.id, query.query, {'param1': '1'}),
+                                         self.factory.create_query_result())
+        data_source = self.factory.create_data_source(group=self.factory.org.default_group)
+
+        with patch('redash.handlers.query_results.enqueue_query') as enqueue_query:
+            enqueue_query.return_value.to_dict.return_value = {}
+            rv = self.make_request('post', '/api/query_results?p_param1=1',
+                                   data={'data_source_id': data_source.id, 'query': query.query,
+                                         'query_id': query.id, 'max_age': -1})
+
+        self.assertEquals(rv.status_code, 200)
+        self.assertIn('job', rv.json)
+        self.assertNotIn('Parameters Hash', enqueue_query.call_args[1]['metadata'])
+
     def test_execute_on_paused_data_source(self):
         self.factory.data_source.pause()
 
@@ -131,3 +183,64 @@ class TestQueryResultExcelResponse(BaseTestCase):
         rv = self.make_request('get', '/api/queries/{}/results/{}.xlsx'.format(query.id, query_result.id), is_json=False)
         self.assertEquals(rv.status_code, 200)
 
+
+
+def gunzip(data):
+    return gzip.GzipFile(fileobj=StringIO(data)).read()
+
+
+class TestQueryResultCompression(BaseTestCase):
+    def setUp(self):
+        super(TestQueryResultCompression, self).setUp()
+        self.data = json.dumps({'columns': [{'name': 'n'}], 'rows': [{'n': i} for i in range(1000)]})
+        self.query_result, _ = models.QueryResult.store_result(self.factory.org.id, self.factory.data_source.id,
+                                                               gen_query_hash('SELECT 1'), 'SELECT 1', self.data, 1,
+                                                               utcnow())
+
+    def get(self, path, **headers):
+        return self.make_request('get', path, is_json=False, headers=headers)
+
+    def test_serves_the_stored_gzipped_response(self):
+        with patch.object(models.QueryResult, 'to_json') as to_json:
+            rv = self.get('/api/query_results/{}'.format(self.query_result.id), **{'Accept-Encoding': 'gzip'})
+            self.assertEqual(0, to_json.call_count)
+
+        self.assertEqual('gzip', rv.headers['Content-Encoding'])
+        self.assertIn('Accept-Encoding', rv.headers['Vary'])
+        result = json.loads(gunzip(rv.data))['query_result']
+        self.assertEqual(json.loads(self.data), result['data'])
+        self.assertEqual(self.query_result.id, result['id'])
+
+    def test_compresses_results_stored_before_precompression(self):
+        models.CompressedQueryResult.delete().execute()
+
+        rv = self.get('/api/query_results/{}'.format(self.query_result.id), **{'Accept-Encoding': 'gzip, deflate'})
+
+        self.assertEqual('gzip', rv.headers['Content-Encoding'])
+        self.assertEqual(json.loads(self.data), json.loads(gunzip(rv.data))['query_result']['data'])
+
+    def test_uncompressed_without_accept_encoding(self):
+        rv = self.get('/api/query_results/{}'.format(self.query_result.id))
+
+        self.assertNotIn('Content-Encoding', rv.headers)
+        self.assertEqual(json.loads(self.data), json.loads(rv.data)['query_result']['data'])
+
+    def test_compresses_csv_but_not_excel(self):
+        query = self.factory.create_query()
+
+        rv = self.get('/api/queries/{}/results/{}.csv'.format(query.id, self.query_result.id),
+                      **{'Accept-Encoding': 'gzip'})
+        self.assertEqual('gzip', rv.headers['Content-Encoding'])
+        self.assertTrue(gunzip(rv.data).startswith('n\r\n0\r\n'))
+
+        rv = self.get('/api/queries/{}/results/{}.xlsx'.format(query.id, self.query_result.id),
+                      **{'Accept-Encoding': 'gzip'})
+        self.assertNotIn('Content-Encoding', rv.headers)
+
+    def test_leaves_small_responses_uncompressed(self):
+        query_result = self.factory.create_query_result()
+
+        rv = self.get('/api/query_results/{}'.format(query_result.id), **{'Accept-Encoding': 'gzip'})
+
+        self.assertNotIn('Content-Encoding', rv.headers)
+        self.assertEqual(200, rv.status_code)
@@ -1,5 +1,6 @@
+from mock import patch, PropertyMock
 from tests import BaseTestCase
-from redash.models import DataSource
+from redash.models import DataSource, DataSourceGroup
 from redash.utils.configuration import ConfigurationContainer
 
 
@@ -33,3 +34,162 @@ class TestDataSourceIsPaused(BaseTestCase):
 
     def test_reason_is_none_by_default(self):
         self.assertEqual(self.factory.data_source.pause_reason, None)
+
+
+class TestDataSourceGroups(BaseTestCase):
+    def test_caches_groups(self):
+        data_source = self.factory.create_data_source()
+        groups = data_source.groups
+
+        DataSourceGroup.update(view_only=True).where(DataSourceGroup.data_source == data_source).execute()
+        self.assertEqual(groups, data_source.groups)
+
+    def test_add_group_invalidates_cache(self):
+        data_source = self.factory.create_data_source()
+        group = self.factory.create_group()
+        data_source.groups
+
+        data_source.add_group(group, view_only=True)
+        self.assertEqual(True, data_source.groups[group.id])
+
+    def test_update_group_permission_invalidates_cache(self):
+        data_source = self.factory.create_data_source()
+        group = self.factory.create_group()
+        data_source.add_group(group)
+        data_source.groups
+
+        data_source.update_group_permission(group, True)
+        self.assertEqual(True, data_source.groups[group.id])
+
+    def test_remove_group_invalidates_cache(self):
+        data_source = self.factory.create_data_source()
+        group = self.factory.create_group()
+        data_source.add_group(group)
+        data_source.groups
+
+        data_source.remove_group(group)
+        self.assertNotIn(group.id, data_source.groups)
+
+    def test_group_delete_invalidates_cache(self):
+        data_source = self.factory.create_data_source()
+        group = self.factory.create_group()
+        data_source.add_group(group)
+        data_source.groups
+
+        group.delete_instance(recursive=True)
+        self.assertNotIn(group.id, data_source.groups)
+
+
+class TestDataSourcePauseReasons(BaseTestCase):
+    def test_returns_only_paused_data_sources(self):
+        data_source = self.factory.create_data_source()
+        self.factory.data_source.pause("Reason")
+
+        reasons = DataSource.pause_reasons([self.factory.data_source.id, data_source.id])
+        self.assertEqual({self.factory.data_source.id: "Reason"}, reasons)
+
+    def test_returns_empty_dict_for_no_data_sources(self):
+        self.assertEqual({}, DataSource.pause_reasons([]))
+
+
+class TestDataSourceRefreshSchema(BaseTestCase):
+    def setUp(self):
+        super(TestDataSourceRefreshSchema, self).setUp()
+        patcher = patch('redash.models.DataSource.query_runner', new_callable=PropertyMock)
+        self.query_runner = patcher.start().return_value
+        self.addCleanup(patcher.stop)
+
+        self.data_source = self.factory.create_data_source()
+
+    def test_fetches_only_changed_tables(self):
+        self.query_runner.get_table_versions.return_value = {'a': 1, 'b': 1}
+        self.query_runner.get_tables_schema.return_value = [{'name': 'a', 'columns': ['x']},
+                                                            {'name': 'b', 'columns': ['y']}]
+        self.data_source.refresh_schema()
+
+        self.query_runner.get_table_versions.return_value = {'a': 1, 'b': 2, 'c': 1}
+        self.query_runner.get_tables_schema.return_value = [{'name': 'b', 'columns': ['y', 'z']},
+                                                            {'name': 'c', 'columns': []}]
+        self.assertEqual(2, self.data_source.refresh_schema())
+
+        self.assertItemsEqual(['b', 'c'], self.query_runner.get_tables_schema.call_args[0][0])
+        self.assertEqual([{'name': 'a', 'columns': ['x']},
+                          {'name': 'b', 'columns': ['y', 'z']},
+                          {'name': 'c', 'columns': []}], self.data_source.get_schema())
+
+    def test_removes_dropped_tables(self):
+        self.query_runner.get_table_versions.return_value = {'a': 1, 'b': 1}
+        self.query_runner.get_tables_schema.return_value = [{'name': 'a', 'columns': []}, {'name': 'b', 'columns': []}]
+        self.data_source.refresh_schema()
+
+        self.query_runner.get_table_versions.return_value = {'a': 1}
+        self.assertEqual(1, self.data_source.refresh_schema())
+        self.assertEqual([{'name': 'a', 'columns': []}], self.data_source.get_schema())
+
+    def test_unchanged_schema_skips_fetching_tables(self):
+        self.query_runner.get_table_versions.return_value = {'a': 1}
+        self.query_runner.get_tables_schema.return_value = [{'name': 'a', 'columns': []}]
+        self.data_source.refresh_schema()
+        self.query_runner.get_tables_schema.reset_mock()
+
+        self.assertEqual(0, self.data_source.refresh_schema())
+        self.assertFalse(self.query_runner.get_tables_schema.called)
+
+    @patch('redash.settings.SCHEMA_RUN_TABLE_SIZE_CALCULATIONS', True)
+    def test_refreshes_sizes_of_unchanged_tables(self):
+        self.query_runner.get_table_versions.return_value = {'a': 1, 'b': 1}
+        self.query_runner.get_tables_schema.return_value = [{'name': 'a', 'columns': [], 'size': 1},
+                                                            {'name': 'b', 'columns': [], 'size': 1}]
+        self.data_source.refresh_schema(get_stats=True)
+        self.query_runner.get_tables_schema.reset_mock()
+
+        self.query_runner.get_table_sizes.return_value = {'a': 1, 'b': 5}
+        self.assertEqual(1, self.data_source.refresh_schema(get_stats=True))
+
+        self.assertFalse(self.query_runner.get_tables_schema.called)
+        self.assertItemsEqual(['a', 'b'], self.query_runner.get_table_sizes.call_args[0][0])
+        self.assertEqual([{'name': 'a', 'columns': [], 'size': 1},
+                          {'name': 'b', 'columns': [], 'size': 5}], self.data_source.get_schema())
+
+        revision = self.data_source.schema_revision
+        self.assertEqual(0, self.data_source.refresh_schema(get_stats=True))
+        self.assertEqual(revision, self.data_source.schema_revision)
+
+    def test_diffs_full_schema_when_runner_has_no_versions(self):
+        self.query_runner.get_table_versions.return_value = None
+        self.query_runner.get_schema.return_value = [{'name': 'a', 'columns': []}, {'name': 'b', 'columns': []}]
+        self.assertEqual(2, self.data_source.refresh_schema())
+
+        self.query_runner.get_schema.return_value = [{'name': 'a', 'columns': ['x']}, {'name': 'b', 'columns': []}]
+        self.assertEqual(1, self.data_source.refresh_schema())
+        self.assertEqual([{'name': 'a', 'columns': ['x']}, {'name': 'b', 'columns': []}], self.data_source.get_schema())
+
+    def test_caches_empty_schema(self):
+        self.query_runner.get_table_versions.return_value = {}
+        self.assertEqual([], self.data_source.get_schema())
+        self.assertEqual([], self.data_source.get_schema())
+        self.assertEqual(1, self.query_runner.get_table_versions.call_count)
+
+    def test_search_matches_name_parts_and_columns(self):
+        self.query_runner.get_table_versions.return_value = {'public.users': 1, 'events': 1}
+        self.query_runner.get_tables_schema.return_value = [{'name': 'public.users', 'columns': ['email']},
+                                                            {'name': 'events', 'columns': ['user_id']}]
+        self.data_source.refresh_schema()
+
+        self.assertEqual(['events', 'public.users'], self.data_source.search_schema('User'))
+        self.assertEqual(['public.users'], self.data_source.search_schema('pub'))
+        self.assertEqual([], self.data_source.search_schema('mail'))
+
+    def test_search_index_follows_changes(self):
+        self.query_runner.get_table_versions.return_value = {'users': 1, 'events': 1}
+        self.query_runner.get_tables_schema.return_value = [{'name': 'users', 'columns': ['email']},
+                                                            {'name': 'events', 'columns': []}]
+        self.data_source.refresh_schema()
+
+        self.query_runner.get_table_versions.return_value = {'users': 2}
+        self.query_runner.get_tables_schema.return_value = [{'name': 'users', 'columns': ['phone']}]
+        self.data_source.refresh_schema()
+
+        self.assertEqual([], self.data_source.search_schema('email'))
+        self.assertEqual([], self.data_source.search_schema('events'))
+        self.assertEqual(['users'], self.data_source.search_schema('phone'))
@@ -0,0 +1,38 @@
+from unittest import TestCase
+
+from mock import patch
+
+from redash.query_runner import BaseSQLQueryRunner
+
+
+class CountingQueryRunner(BaseSQLQueryRunner):
+    def _get_tables(self, schema):
+        for name in ('a', 'b', 'c'):
+            schema[name] = {'name': name, 'columns': []}
+
+    def _run_query_internal(self, query):
+        return [{'cnt': len(query)}]
+
+
+class CatalogQueryRunner(CountingQueryRunner):
+    def get_table_stats(self, table_names):
+        return {name: 10 for name in table_names if name != 'c'}
+
+    def _run_query_internal(self, query):
+        raise AssertionError("Tables shouldn't be counted.")
+
+
+@patch('redash.settings.SCHEMA_RUN_TABLE_SIZE_CALCULATIONS', True)
+class TestGetTablesStats(TestCase):
+    def test_uses_catalog_stats(self):
+        schema = sorted(CatalogQueryRunner({}).get_schema(get_stats=True), key=lambda t: t['name'])
+        self.assertEqual([10, 10, None], [t.get('size') for t in schema])
+
+    def test_counts_tables_without_catalog(self):
+        schema = CountingQueryRunner({}).get_schema(get_stats=True)
+        for table in schema:
+            self.assertEqual(len('select count(*) as cnt from %s' % table['name']), table['size'])
+
+    def test_skips_stats_when_not_requested(self):
+        schema = CatalogQueryRunner({}).get_schema()
+        self.assertTrue(all('size' not in t for t in schema))
@@ -0,0 +1,21 @@
+import json
+from unittest import TestCase
+
+from mock import patch
+
+from redash.query_runner.mysql import Mysql
+
+
+class TestGetTableStats(TestCase):
+    def test_counts_views(self):
+        rows = [{'table_schema': 'db', 'table_name': 'users', 'table_type': 'BASE TABLE', 'table_rows': 10},
+                {'table_schema': 'db', 'table_name': 'active_users', 'table_type': 'VIEW', 'table_rows': None},
+                {'table_schema': 'other', 'table_name': 'events', 'table_type': 'BASE TABLE', 'table_rows': 5}]
+        runner = Mysql({'db': 'db'})
+
+        with patch.object(Mysql, 'run_query', return_value=(json.dumps({'rows': rows}), None)), \
+                patch.object(Mysql, '_run_query_internal', return_value=[{'cnt': 3}]) as run_query_internal:
+            stats = runner.get_table_stats(['users', 'active_users'])
+
+        self.assertEqual({'users': 10, 'active_users': 3}, stats)
+        run_query_internal.assert_called_once_with('select count(*) as cnt from active_users')
@@ -0,0 +1,198 @@
+import datetime
+import json
+import time
+
+from mock import patch
+
+from tests import BaseTestCase
+from redash import models, redis_connection
+from redash.tasks import cleanup_events, flush_events, record_event, record_events
+from redash.tasks.general import EVENTS_BUFFER_KEY, EVENTS_DEAD_LETTER_KEY, EVENTS_FLUSH_LOCK_KEY
+
+
+class TestFlushEvents(BaseTestCase):
+    def event(self, **kwargs):
+        event = {'org_id': self.factory.org.id, 'user_id': self.factory.user.id, 'action': 'view',
+                 'object_type': 'dashboard', 'object_id': '1', 'timestamp': int(time.time())}
+        event.update(kwargs)
+        return event
+
+    def test_record_event_buffers_events(self):
+        record_event(self.event())
+        record_events([self.event(), self.event()])
+
+        self.assertEqual(3, redis_connection.llen(EVENTS_BUFFER_KEY))
+        self.assertEqual(0, models.Event.select().count())
+
+    def test_writes_buffered_events_in_batches(self):
+        record_events([self.event(object_id=str(i)) for i in range(5)])
+
+        with patch('redash.settings.EVENTS_FLUSH_BATCH_SIZE', 2), \
+                patch.object(models.Event, 'insert_many', wraps=models.Event.insert_many) as insert_many:
+            self.assertEqual(5, flush_events())
+            self.assertEqual(3, insert_many.call_count)
+
+        self.assertEqual(['0', '1', '2', '3', '4'],
+                         sorted(e.object_id for e in models.Event.select()))
+        self.assertEqual(0, redis_connection.llen(EVENTS_BUFFER_KEY))
+
+    def test_counts_recent_activity(self):
+        record_events([self.event(object_id='7'), self.event(object_id='7'), self.event(object_id='8')])
+        flush_events()
+
+        self.assertEqual([7, 8], models.Event.recent_object_ids(self.factory.org.id, 'dashboard'))
+
+    def test_drops_invalid_events(self):
+        record_events([self.event(), self.event(action=None), self.event(timestamp='now'), 'event'])
+        self.assertEqual(1, redis_connection.llen(EVENTS_BUFFER_KEY))
+
+    def test_drops_events_outside_of_the_accepted_time_range(self):
+        with patch('redash.settings.EVENTS_RETENTION_DAYS', 30):
+            record_events([self.event(), self.event(timestamp=time.time() + 3 * 24 * 3600),
+                           self.event(timestamp=time.time() - 60 * 24 * 3600)])
+        self.assertEqual(1, redis_connection.llen(EVENTS_BUFFER_KEY))
+
+    def test_moves_events_that_cant_be_written_to_dead_letter(self):
+        record_events([self.event(object_id='1'), self.event(object_id='2')])
+        # Buffered before events were validated.
+        redis_connection.rpush(EVENTS_BUFFER_KEY, json.dumps({'org_id': self.factory.org.id, 'action': 'view'}))
+        record_events([self.event(object_id='3')])
+
+        self.assertEqual(3, flush_events())
+
+        self.assertEqual(['1', '2', '3'], sorted(e.object_id for e in models.Event.select()))
+        self.assertEqual(0, redis_connection.llen(EVENTS_BUFFER_KEY))
+        self.assertEqual(1, redis_connection.llen(EVENTS_DEAD_LETTER_KEY))
+        self.assertIsNone(redis_connection.get(EVENTS_FLUSH_LOCK_KEY))
+
+    def test_keeps_lock_taken_over_by_another_flush(self):
+        record_event(self.event())
+
+        def take_over(batch):
+            redis_connection.set(EVENTS_FLUSH_LOCK_KEY, 'other')
+            return []
+
+        with patch('redash.tasks.general.write_events', side_effect=take_over):
+            flush_events()
+
+        self.assertEqual('other', redis_connection.get(EVENTS_FLUSH_LOCK_KEY))
+
+    def test_stops_when_the_lock_is_lost(self):
+        record_events([self.event(object_id=str(i)) for i in range(3)])
+
+        def take_over(batch):
+            redis_connection.set(EVENTS_FLUSH_LOCK_KEY, 'other')
+            return []
+
+        with patch('redash.settings.EVENTS_FLUSH_BATCH_SIZE', 1), \
+                patch('redash.tasks.general.write_events', side_effect=take_over) as write_events:
+            flush_events()
+
+        self.assertEqual(1, write_events.call_count)
+        self.assertEqual(2, redis_connection.llen(EVENTS_BUFFER_KEY))
+
+    def test_skips_when_another_flush_is_running(self):
+        record_event(self.event())
+        redis_connection.set(EVENTS_FLUSH_LOCK_KEY, 1)
+
+        self.assertEqual(0, flush_events())
+        self.assertEqual(1, redis_connection.llen(EVENTS_BUFFER_KEY))
+
+    def test_reports_events_to_webhooks(self):
+        events = [self.event(object_id='1'), self.event(object_id='2')]
+        record_events(events)
+
+        with patch('redash.settings.EVENT_REPORTING_WEBHOOKS', ['http://example.com/hook']), \
+                patch('redash.tasks.general.webhooks_session') as session:
+            session.post.return_value.status_code = 200
+            flush_events()
+
+        self.assertEqual(2, session.post.call_count)
+        session.post.assert_any_call('http://example.com/hook', timeout=10, data=events[0])
+
+    def test_reports_batches_to_webhooks(self):
+        events = [self.event(object_id='1'), self.event(object_id='2')]
+        record_events(events)
+
+        with patch('redash.settings.EVENT_REPORTING_WEBHOOKS', ['http://example.com/hook']), \
+                patch('redash.settings.EVENT_REPORTING_WEBHOOKS_BATCH', True), \
+                patch('redash.tasks.general.webhooks_session') as session:
+            session.post.return_value.status_code = 200
+            flush_events()
+
+        self.assertEqual(1, session.post.call_count)
+        self.assertEqual(events, json.loads(session.post.call_args[1]['data']))
+
+
+class TestEventResource(BaseTestCase):
+    def test_buffers_all_events_at_once(self):
+        events = [{'action': 'view', 'object_type': 'dashboard', 'object_id': i} for i in range(3)]
+
+        with patch('redash.handlers.base.buffer_events') as buffer_events:
+            rv = self.make_request('post', '/api/events', data=events)
+
+        self.assertEqual(200, rv.status_code)
+        self.assertEqual(1, buffer_events.call_count)
+        buffered = buffer_events.call_args[0][0]
+        self.assertEqual(3, len(buffered))
+        self.assertTrue(all(e['org_id'] == self.factory.org.id for e in buffered))
+
+    def test_rejects_invalid_payload(self):
+        with patch('redash.handlers.base.buffer_events') as buffer_events:
+            rv = self.make_request('post', '/api/events', data={'action': 'view'})
+
+        self.assertEqual(400, rv.status_code)
+        self.assertEqual(0, buffer_events.call_count)
+
+
+class TestCleanupEvents(BaseTestCase):
+    def test_applies_retention(self):
+        models.Event.create(org=self.factory.org, user=self.factory.user, action='view', object_type='dashboard',
+                            created_at=datetime.datetime.now() - datetime.timedelta(days=40))
+        recent = models.Event.create(org=self.factory.org, user=self.factory.user, action='view',
+                                     object_type='dashboard')
+
+        with patch('redash.settings.EVENTS_RETENTION_DAYS', 30):
+            cleanup_events()
+
+        self.assertEqual([recent.id], [e.id for e in models.Event.select()])
+
+    def test_keeps_events_without_retention(self):
+        models.Event.create(org=self.factory.org, user=self.factory.user, action='view', object_type='dashboard',
+                            created_at=datetime.datetime.now() - datetime.timedelta(days=4000))
+
+        cleanup_events()
+
+        self.assertEqual(1, models.Event.select().count())
+
+    def test_restores_recent_activity(self):
+        models.Event.create(org=self.factory.org, user=self.factory.user, action='view', object_type='dashboard',
+                            object_id='3')
+        redis_connection.flushdb()
+
+        cleanup_events()
+
+        self.assertEqual([3], models.Event.recent_object_ids(self.factory.org.id, 'dashboard'))
+
+
+class TestEventCountsResource(BaseTestCase):
+    def test_returns_counts(self):
+        models.Event.create(org=self.factory.org, user=self.factory.user, action='view', object_type='dashboard')
+        admin = self.factory.create_user(groups=[self.factory.create_group(permissions=['super_admin']).id])
+
+        rv = self.make_request('get', '/api/admin/events/counts?group_by=action', user=admin)
+
+        self.assertEqual(200, rv.status_code)
+        self.assertEqual([{'action': 'view', 'count': 1}], rv.json['counts'])
+
+    def test_validates_group_by(self):
+        admin = self.factory.create_user(groups=[self.factory.create_group(permissions=['super_admin']).id])
+
+        rv = self.make_request('get', '/api/admin/events/counts?group_by=additional_properties', user=admin,
+                               is_json=False)
+
+        self.assertEqual(400, rv.status_code)
+
+    def test_requires_super_admin(self):
+        rv = self.make_request('get', '/api/admin/events/counts', is_json=False)
+        self.assertEqual(403, rv.status_code)
@@ -1,8 +1,9 @@
 from tests import BaseTestCase
-from redash import redis_connection
-from redash.tasks.queries import QueryTaskTracker, enqueue_query, execute_query
+from redash import models, redis_connection
+from redash.metrics import tracing
+from redash.tasks.queries import QueryExecutor, QueryTaskTracker, enqueue_query, enqueue_queries, execute_query
 from unittest import TestCase
-from mock import MagicMock
+from mock import MagicMock, patch
 from collections import namedtuple
 import uuid
 
@@ -68,3 +69,68 @@ class TestEnqueueTask(BaseTestCase):
         self.assertEqual(3, redis_connection.zcard(QueryTaskTracker.WAITING_LIST))
         self.assertEqual(0, redis_connection.zcard(QueryTaskTracker.IN_PROGRESS_LIST))
         self.assertEqual(0, redis_connection.zcard(QueryTaskTracker.DONE_LIST))
+
+
+class TestEnqueueQueries(BaseTestCase):
+    def test_enqueues_each_query_once(self):
+        query = self.factory.create_query()
+        execute_query.apply_async = MagicMock(side_effect=gen_hash)
+
+        batch = [(query.query, query.data_source, None, {'Query ID': query.id}),
+                 (query.query + '2', query.data_source, None, {'Query ID': query.id}),
+                 (query.query, query.data_source, None, {'Query ID': query.id})]
+        jobs, round_trips = enqueue_queries(batch, scheduled=True)
+
+        self.assertEqual(2, execute_query.apply_async.call_count)
+        self.assertEqual(jobs[0].id, jobs[2].id)
+        self.assertNotEqual(jobs[0].id, jobs[1].id)
+        self.assertEqual(2, redis_connection.zcard(QueryTaskTracker.WAITING_LIST))
+        self.assertEqual(5, round_trips)
+
+    def test_reuses_existing_job(self):
+        query = self.factory.create_query()
+        execute_query.apply_async = MagicMock(side_effect=gen_hash)
+
+        job = enqueue_query(query.query, query.data_source, None, metadata={'Query ID': query.id})
+        jobs, _ = enqueue_queries([(query.query, query.data_source, None, {'Query ID': query.id})])
+
+        self.assertEqual(1, execute_query.apply_async.call_count)
+        self.assertEqual(job.id, jobs[0].id)
+
+
+class TestQueryExecutorTracing(BaseTestCase):
+    def test_continues_the_enqueuing_trace(self):
+        data_source = self.factory.create_data_source()
+        task = MagicMock()
+        task.request.id = uuid.uuid4().hex
+        task.request.delivery_info = {'routing_key': 'queries'}
+        context = {'Trace ID': 'a' * 32, 'Span ID': 'b' * 16}
+        spans = []
+
+        with patch('redash.settings.TRACING_EXPORT', 'spans.json'), \
+                patch.object(tracing.exporter, 'export', side_effect=spans.append), \
+                patch('redash.query_runner.pg.PostgreSQL.run_query', return_value=('{"columns": [], "rows": []}', None)):
+            trace = tracing.start_trace('execute_query', 'redash-worker', context)
+            QueryExecutor(task, 'SELECT 1', data_source.id, None, dict(context)).run()
+            tracing.finish_trace(trace)
+
+        self.assertEqual(['queue_wait', 'load_data_source', 'run_query', 'store_result', 'execute_query'],
+                         [span.name for span in spans])
+        self.assertEqual(set(['a' * 32]), set(span.trace_id for span in spans))
+        self.assertEqual('b' * 16, trace.parent_id)
+        self.assertEqual(set([trace.span_id]), set(span.parent_id for span in spans[:-1]))
+
+
+class TestQueryExecutorParameterizedResults(BaseTestCase):
+    def test_caches_result(self):
+        query = self.factory.create_query_with_params()
+        parameters_hash = models.Query.parameters_hash(query.data_source.id, query.query, {'param1': 1})
+        task = MagicMock()
+        task.request.id = uuid.uuid4().hex
+        task.request.delivery_info = {'routing_key': 'queries'}
+
+        with patch('redash.query_runner.pg.PostgreSQL.run_query', return_value=('{"columns": [], "rows": []}', None)):
+            query_result_id = QueryExecutor(task, 'SELECT 1', query.data_source.id, None,
+                                            {'Query ID': query.id, 'Parameters Hash': parameters_hash}).run()
+
+        self.assertEqual(query_result_id, query.get_parameterized_result(parameters_hash).id)
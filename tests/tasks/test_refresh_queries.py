@@ -1,14 +1,28 @@
 import datetime
-from mock import patch, call, ANY
+from mock import patch
 from tests import BaseTestCase
 from redash.utils import utcnow
 from redash.tasks import refresh_queries
+from redash.tasks.queries import acquire_scheduler_lease
+
+
+def enqueued_queries(enqueue_queries_mock):
+    enqueued = []
+    for args, kwargs in enqueue_queries_mock.call_args_list:
+        enqueued.extend(args[0])
+    return enqueued
 
 
 # TODO: this test should be split into two:
 # 1. tests for Query.outdated_queries method
 # 2. test for the refresh_query task
 class TestRefreshQueries(BaseTestCase):
+    def assertEnqueued(self, enqueue_queries_mock, queries):
+        expected = [(q.query, q.data_source, q.user_id, {'Query ID': q.id, 'Username': 'Scheduled'}) for q in queries]
+        self.assertItemsEqual(expected, enqueued_queries(enqueue_queries_mock))
+        for args, kwargs in enqueue_queries_mock.call_args_list:
+            self.assertEqual({'scheduled': True}, kwargs)
+
     def test_enqueues_outdated_queries(self):
         query = self.factory.create_query(schedule="60")
         retrieved_at = utcnow() - datetime.timedelta(minutes=10)
@@ -17,9 +31,9 @@ class TestRefreshQueries(BaseTestCase):
         query.latest_query_data = query_result
         query.save()
 
-        with patch('redash.tasks.queries.enqueue_query') as add_job_mock:
+        with patch('redash.tasks.queries.enqueue_queries', return_value=([], 0)) as add_job_mock:
             refresh_queries()
-            add_job_mock.assert_called_with(query.query, query.data_source, query.user_id, scheduled=True, metadata=ANY)
+            self.assertEnqueued(add_job_mock, [query])
 
     def test_doesnt_enqueue_outdated_queries_for_paused_data_source(self):
         query = self.factory.create_query(schedule="60")
@@ -31,15 +45,15 @@ class TestRefreshQueries(BaseTestCase):
 
         query.data_source.pause()
 
-        with patch('redash.tasks.queries.enqueue_query') as add_job_mock:
+        with patch('redash.tasks.queries.enqueue_queries', return_value=([], 0)) as add_job_mock:
             refresh_queries()
             add_job_mock.assert_not_called()
 
         query.data_source.resume()
 
-        with patch('redash.tasks.queries.enqueue_query') as add_job_mock:
+        with patch('redash.tasks.queries.enqueue_queries', return_value=([], 0)) as add_job_mock:
             refresh_queries()
-            add_job_mock.assert_called_with(query.query, query.data_source, query.user_id, scheduled=True, metadata=ANY)
+            self.assertEnqueued(add_job_mock, [query])
 
     def test_skips_fresh_queries(self):
         query = self.factory.create_query(schedule="1200")
@@ -47,7 +61,7 @@ class TestRefreshQueries(BaseTestCase):
         query_result = self.factory.create_query_result(retrieved_at=retrieved_at, query=query.query,
                                                    query_hash=query.query_hash)
 
-        with patch('redash.tasks.queries.enqueue_query') as add_job_mock:
+        with patch('redash.tasks.queries.enqueue_queries', return_value=([], 0)) as add_job_mock:
             refresh_queries()
             self.assertFalse(add_job_mock.called)
 
@@ -57,7 +71,7 @@ class TestRefreshQueries(BaseTestCase):
         query_result = self.factory.create_query_result(retrieved_at=retrieved_at, query=query.query,
                                                    query_hash=query.query_hash)
 
-        with patch('redash.tasks.queries.enqueue_query') as add_job_mock:
+        with patch('redash.tasks.queries.enqueue_queries', return_value=([], 0)) as add_job_mock:
             refresh_queries()
             self.assertFalse(add_job_mock.called)
 
@@ -72,9 +86,9 @@ class TestRefreshQueries(BaseTestCase):
         query.save()
         query2.save()
 
-        with patch('redash.tasks.queries.enqueue_query') as add_job_mock:
+        with patch('redash.tasks.queries.enqueue_queries', return_value=([], 0)) as add_job_mock:
             refresh_queries()
-            add_job_mock.assert_called_once_with(query.query, query.data_source, query.user_id, scheduled=True, metadata=ANY)#{'Query ID': query.id, 'Username': 'Scheduled'})
+            self.assertEnqueued(add_job_mock, [query])
 
     def test_enqueues_query_with_correct_data_source(self):
         query = self.factory.create_query(schedule="60", data_source=self.factory.create_data_source())
@@ -87,12 +101,9 @@ class TestRefreshQueries(BaseTestCase):
         query.save()
         query2.save()
 
-        with patch('redash.tasks.queries.enqueue_query') as add_job_mock:
+        with patch('redash.tasks.queries.enqueue_queries', return_value=([], 0)) as add_job_mock:
             refresh_queries()
-            add_job_mock.assert_has_calls([call(query2.query, query2.data_source, query2.user_id, scheduled=True, metadata=ANY),
-                                           call(query.query, query.data_source, query.user_id, scheduled=True, metadata=ANY)],
-                                          any_order=True)
-            self.assertEquals(2, add_job_mock.call_count)
+            self.assertEnqueued(add_job_mock, [query, query2])
 
     def test_enqueues_only_for_relevant_data_source(self):
         query = self.factory.create_query(schedule="60")
@@ -106,6 +117,53 @@ class TestRefreshQueries(BaseTestCase):
         query.save()
         query2.save()
 
-        with patch('redash.tasks.queries.enqueue_query') as add_job_mock:
+        with patch('redash.tasks.queries.enqueue_queries', return_value=([], 0)) as add_job_mock:
             refresh_queries()
-            add_job_mock.assert_called_once_with(query.query, query.data_source, query.user_id, scheduled=True, metadata=ANY)
+            self.assertEnqueued(add_job_mock, [query])
+
+    def test_enqueues_only_queries_of_the_given_shard(self):
+        queries = []
+        for i in range(4):
+            query = self.factory.create_query(schedule="60", query="SELECT {}".format(i))
+            retrieved_at = utcnow() - datetime.timedelta(minutes=10)
+            query_result = self.factory.create_query_result(retrieved_at=retrieved_at, query=query.query,
+                                                            query_hash=query.query_hash)
+            query.latest_query_data = query_result
+            query.save()
+            queries.append(query)
+
+        with patch('redash.tasks.queries.enqueue_queries', return_value=([], 0)) as add_job_mock, \
+                patch('redash.settings.SCHEDULER_SHARDS', 2):
+            refresh_queries(shard=1)
+            self.assertEnqueued(add_job_mock, [q for q in queries if q.id % 2 == 1])
+
+
+class TestSchedulerLease(BaseTestCase):
+    def test_acquires_free_lease(self):
+        self.assertTrue(acquire_scheduler_lease(0, 'node-1'))
+
+    def test_renews_own_lease(self):
+        acquire_scheduler_lease(0, 'node-1')
+        self.assertTrue(acquire_scheduler_lease(0, 'node-1'))
+
+    def test_doesnt_acquire_lease_held_by_another_node(self):
+        acquire_scheduler_lease(0, 'node-1')
+        self.assertFalse(acquire_scheduler_lease(0, 'node-2'))
+        self.assertTrue(acquire_scheduler_lease(1, 'node-2'))
+
+    def test_skips_refresh_when_lease_is_held_by_another_node(self):
+        query = self.factory.create_query(schedule="60")
+        retrieved_at = utcnow() - datetime.timedelta(minutes=10)
+        query_result = self.factory.create_query_result(retrieved_at=retrieved_at, query=query.query,
+                                                        query_hash=query.query_hash)
+        query.latest_query_data = query_result
+        query.save()
+
+        acquire_scheduler_lease(0, 'node-1')
+
+        with patch('redash.tasks.queries.enqueue_queries', return_value=([], 0)) as add_job_mock:
+            refresh_queries(0, 'node-2')
+            add_job_mock.assert_not_called()
+
+            refresh_queries(0, 'node-1')
+            self.assertEqual(1, len(enqueued_queries(add_job_mock)))
@@ -1,25 +1,64 @@
-import datetime
 from mock import patch, call, ANY
 from tests import BaseTestCase
-from redash.tasks import refresh_schemas
+from redash import redis_connection
+from redash.tasks import refresh_schemas, refresh_schema
 
 
 class TestRefreshSchemas(BaseTestCase):
-    def test_calls_refresh_of_all_data_sources(self):
-        self.factory.data_source # trigger creation
-        with patch('redash.models.DataSource.get_schema') as get_schema:
+    def test_dispatches_refresh_of_all_data_sources(self):
+        self.factory.data_source  # trigger creation
+        data_source = self.factory.create_data_source()
+        with patch('redash.tasks.queries.refresh_schema.apply_async') as apply_async:
             refresh_schemas()
-            get_schema.assert_called_with(refresh=True)
+            apply_async.assert_has_calls([call(args=(self.factory.data_source.id,), soft_time_limit=ANY, time_limit=ANY),
+                                          call(args=(data_source.id,), soft_time_limit=ANY, time_limit=ANY)],
+                                         any_order=True)
 
     def test_skips_paused_data_sources(self):
         self.factory.data_source.pause()
 
-        with patch('redash.models.DataSource.get_schema') as get_schema:
+        with patch('redash.tasks.queries.refresh_schema.apply_async') as apply_async:
             refresh_schemas()
-            get_schema.assert_not_called()
+            apply_async.assert_not_called()
 
         self.factory.data_source.resume()
 
-        with patch('redash.models.DataSource.get_schema') as get_schema:
+        with patch('redash.tasks.queries.refresh_schema.apply_async') as apply_async:
             refresh_schemas()
+            apply_async.assert_called_with(args=(self.factory.data_source.id,), soft_time_limit=ANY, time_limit=ANY)
+
+    def test_skips_data_sources_backing_off(self):
+        with patch('redash.models.DataSource.get_schema', side_effect=Exception("failed")):
+            refresh_schema(self.factory.data_source.id)
+
+        with patch('redash.tasks.queries.refresh_schema.apply_async') as apply_async:
+            refresh_schemas()
+            apply_async.assert_not_called()
+
+
+class TestRefreshSchema(BaseTestCase):
+    def test_calls_refresh_of_data_source(self):
+        with patch('redash.models.DataSource.get_schema') as get_schema:
+            refresh_schema(self.factory.data_source.id)
             get_schema.assert_called_with(refresh=True)
+
+    def test_backoff_grows_with_consecutive_failures(self):
+        ds_id = self.factory.data_source.id
+        with patch('redash.models.DataSource.get_schema', side_effect=Exception("failed")):
+            refresh_schema(ds_id)
+            first_backoff = redis_connection.ttl('data_source:schema:backoff:{}'.format(ds_id))
+            refresh_schema(ds_id)
+            second_backoff = redis_connection.ttl('data_source:schema:backoff:{}'.format(ds_id))
+
+        self.assertGreater(second_backoff, first_backoff)
+
+    def test_success_clears_backoff(self):
+        ds_id = self.factory.data_source.id
+        with patch('redash.models.DataSource.get_schema', side_effect=Exception("failed")):
+            refresh_schema(ds_id)
+
+        with patch('redash.models.DataSource.get_schema'):
+            refresh_schema(ds_id)
+
+        self.assertFalse(redis_connection.exists('data_source:schema:backoff:{}'.format(ds_id)))
+        self.assertFalse(redis_connection.exists('data_source:schema:failures:{}'.format(ds_id)))
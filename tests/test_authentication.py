@@ -1,12 +1,13 @@
+import json
 import time
 
 from flask import request
 from mock import patch
 
 from tests import BaseTestCase
-from redash import models
+from redash import models, redis_connection
 from redash.authentication.google_oauth import create_and_login_user, verify_profile
-from redash.authentication import api_key_load_user_from_request, hmac_load_user_from_request, sign
+from redash.authentication import api_key_load_user_from_request, hmac_load_user_from_request, sign, load_user
 from redash.wsgi import app
 
 
@@ -65,6 +66,96 @@ class TestApiKeyAuthentication(BaseTestCase):
             self.assertEqual(404, rv.status_code)
 
 
+class TestApiKeyAuthenticationCache(BaseTestCase):
+    def test_remembers_user_api_key(self):
+        user = self.factory.create_user(api_key="user_key")
+        queries_url = '/{}/api/queries'.format(self.factory.org.slug)
+
+        with app.test_client() as c:
+            c.get(queries_url, query_string={'api_key': user.api_key})
+            api_key_load_user_from_request(request)
+
+            with patch.object(models.User, 'get_by_api_key_and_org') as get_by_api_key:
+                self.assertEqual(user.id, api_key_load_user_from_request(request).id)
+                self.assertFalse(get_by_api_key.called)
+
+    def test_rejects_replaced_user_api_key(self):
+        user = self.factory.create_user(api_key="user_key")
+        queries_url = '/{}/api/queries'.format(self.factory.org.slug)
+
+        with app.test_client() as c:
+            c.get(queries_url, query_string={'api_key': 'user_key'})
+            api_key_load_user_from_request(request)
+
+            user.api_key = 'new_key'
+            user.save()
+            self.assertIsNone(api_key_load_user_from_request(request))
+
+    def test_remembers_query_api_key(self):
+        query = self.factory.create_query(api_key='query_key')
+        query_url = '/{}/api/queries/{}'.format(self.factory.org.slug, query.id)
+
+        with app.test_client() as c:
+            c.get(query_url, query_string={'api_key': query.api_key})
+            api_key_load_user_from_request(request)
+
+            with patch.object(models.User, 'get_by_api_key_and_org') as get_by_api_key:
+                self.assertIsNotNone(api_key_load_user_from_request(request))
+                self.assertFalse(get_by_api_key.called)
+
+
+class TestLoadUserCache(BaseTestCase):
+    def load_user(self, user_id):
+        with app.test_request_context('/{}/'.format(self.factory.org.slug)):
+            app.preprocess_request()
+            return load_user(user_id)
+
+    def test_serves_cached_user(self):
+        user = self.factory.user
+        self.load_user(user.id)
+        models.User.update(name='Renamed').where(models.User.id == user.id).execute()
+
+        cached = self.load_user(user.id)
+        self.assertEqual(user.name, cached.name)
+        self.assertEqual(user.permissions, cached.permissions)
+
+    def test_leaves_password_hash_out_of_the_cache(self):
+        user = self.factory.user
+        user.hash_password('password')
+        user.save()
+        self.load_user(user.id)
+
+        self.assertNotIn('password_hash', json.loads(redis_connection.get('user:{}:auth'.format(user.id))))
+        cached = self.load_user(user.id)
+        self.assertEqual(user.api_key, cached.api_key)
+
+        # Saving the cached user keeps the password.
+        cached.save()
+        self.assertTrue(models.User.get_by_id(user.id).verify_password('password'))
+
+    def test_user_save_invalidates_cache(self):
+        user = self.factory.user
+        self.load_user(user.id)
+
+        user.name = 'Renamed'
+        user.save()
+        self.assertEqual('Renamed', self.load_user(user.id).name)
+
+    def test_group_change_invalidates_cache(self):
+        user = self.factory.user
+        self.load_user(user.id)
+
+        group = self.factory.org.default_group
+        group.permissions = ['view_query']
+        group.save()
+        self.assertEqual(['view_query'], self.load_user(user.id).permissions)
+
+    def test_rejects_user_from_other_org(self):
+        other_user = self.factory.create_user(org=self.factory.create_org())
+        models.User.get_by_id_and_org_cached(other_user.id, other_user.org.id)
+        self.assertIsNone(self.load_user(other_user.id))
+
+
 class TestHMACAuthentication(BaseTestCase):
     #
     # This is a bad way to write these tests, but the way Flask works doesn't make it easy to write them properly...
@@ -0,0 +1,312 @@
+import collections
+import json
+import os
+import threading
+import time
+import uuid
+
+from mock import MagicMock, patch
+
+from tests import BaseTestCase
+from redash import models, redis_connection, statsd_client
+from redash.metrics import profiler, tracing
+from redash.metrics.registry import MetricsRegistry, PrometheusBackend, StatsdBackend
+from redash.wsgi import app
+
+
+class TestRequestLocalMetrics(BaseTestCase):
+    def test_other_threads_do_not_change_metrics(self):
+        models.db.database.reset_metrics()
+        models.Query.select().count()
+
+        def run_queries():
+            models.db.database.reset_metrics()
+            models.Query.select().count()
+            models.Query.select().count()
+
+        thread = threading.Thread(target=run_queries)
+        thread.start()
+        thread.join()
+
+        self.assertEqual(1, models.db.database.query_count)
+
+    def test_records_statements_when_asked(self):
+        models.db.database.reset_metrics()
+        models.Query.select().count()
+        self.assertIsNone(models.db.database.statements)
+
+        models.db.database.reset_metrics(record_statements=True)
+        models.Query.select().count()
+
+        self.assertEqual(1, len(models.db.database.statements))
+        self.assertIn('FROM "queries"', models.db.database.statements[0][0])
+
+
+class TestRequestProfiler(BaseTestCase):
+    def setUp(self):
+        super(TestRequestProfiler, self).setUp()
+        self.admin = self.factory.create_user(groups=[self.factory.create_group(permissions=['super_admin']).id])
+
+    def test_saves_slow_requests(self):
+        with patch('redash.settings.REQUEST_PROFILER_ENABLED', True), \
+                patch('redash.settings.REQUEST_PROFILER_THRESHOLD', 0):
+            self.make_request('get', '/api/queries')
+
+        profiles = profiler.recent_profiles()
+        self.assertEqual(1, len(profiles))
+        self.assertEqual('/default/api/queries', profiles[0]['path'])
+        self.assertEqual(200, profiles[0]['status'])
+        self.assertEqual(profiles[0]['query_count'], len(profiles[0]['statements']))
+
+    def test_skips_fast_requests(self):
+        with patch('redash.settings.REQUEST_PROFILER_ENABLED', True), \
+                patch('redash.settings.REQUEST_PROFILER_THRESHOLD', 60 * 1000):
+            self.make_request('get', '/api/queries')
+
+        self.assertEqual([], profiler.recent_profiles())
+
+    def test_stops_sampling_when_after_request_fails(self):
+        with patch('redash.settings.REQUEST_PROFILER_ENABLED', True), \
+                patch('redash.settings.REQUEST_PROFILER_THRESHOLD', 0), \
+                patch('redash.metrics.request.metrics_logger.info', side_effect=ValueError), \
+                patch.dict(app.config, {'PRESERVE_CONTEXT_ON_EXCEPTION': False}):
+            self.assertRaises(ValueError, self.make_request, 'get', '/api/queries')
+
+        self.assertEqual([200], [p['status'] for p in profiler.recent_profiles()])
+        self.assertNotIn(threading.current_thread().ident, profiler.sampler._samples)
+
+    def test_disabled_by_default(self):
+        self.make_request('get', '/api/queries')
+        self.assertEqual(0, redis_connection.llen(profiler.PROFILES_KEY))
+
+    def test_admin_endpoints(self):
+        profile = profiler.save_profile({'path': '/api/slow'}, [('SELECT 1', 1.5)],
+                                       collections.Counter({'a:b:1': 2}))
+
+        rv = self.make_request('get', '/api/admin/profiler/requests', org=False, user=self.admin)
+        self.assertEqual(200, rv.status_code)
+        self.assertEqual([profile['id']], [p['id'] for p in rv.json['requests']])
+        self.assertNotIn('statements', rv.json['requests'][0])
+
+        rv = self.make_request('get', '/api/admin/profiler/requests/{}'.format(profile['id']), org=False,
+                               user=self.admin)
+        self.assertEqual(200, rv.status_code)
+        self.assertEqual([{'sql': 'SELECT 1', 'duration': 1.5}], rv.json['statements'])
+
+        rv = self.make_request('get', '/api/admin/profiler/requests/{}'.format(profile['id']), org=False,
+                               is_json=False)
+        self.assertEqual(403, rv.status_code)
+
+
+class TestStackSampler(BaseTestCase):
+    def test_samples_current_thread(self):
+        sampler = profiler.StackSampler(0.001)
+        sampler.start()
+
+        deadline = time.time() + 5
+        while not sampler._samples[threading.current_thread().ident] and time.time() < deadline:
+            sum(range(1000))
+
+        samples = sampler.stop()
+        self.assertTrue(samples)
+        self.assertTrue(any('test_samples_current_thread' in stack for stack in samples))
+
+
+class RecordingBackend(object):
+    def __init__(self):
+        self.flushes = []
+
+    def flush(self, counters, gauges, timings):
+        self.flushes.append((counters, gauges, timings))
+
+
+class TestMetricsRegistry(BaseTestCase):
+    def setUp(self):
+        super(TestMetricsRegistry, self).setUp()
+        self.backend = RecordingBackend()
+        self.registry = MetricsRegistry([self.backend], flush_interval=0, max_samples=2)
+
+    def test_aggregates_until_flushed(self):
+        self.registry.incr('celery.task.count', tags={'name': 'a'})
+        self.registry.incr('celery.task.count', 2, tags={'name': 'a'})
+        for value in (1, 20, 20000):
+            self.registry.timing('requests.{endpoint}', value, tags={'endpoint': 'queries'})
+        self.assertEqual([], self.backend.flushes)
+
+        self.registry.flush()
+
+        counters, gauges, timings = self.backend.flushes[0]
+        self.assertEqual({('celery.task.count', (('name', 'a'),)): 3}, counters)
+        timing = timings[('requests.{endpoint}', (('endpoint', 'queries'),))]
+        self.assertEqual(3, timing.count)
+        self.assertEqual(20021, timing.sum)
+        self.assertEqual(2, len(timing.samples))
+        self.assertEqual(3, sum(timing.buckets))
+
+    def test_flush_starts_over(self):
+        self.registry.incr('a')
+        self.registry.flush()
+        self.registry.flush()
+
+        self.assertEqual(1, len(self.backend.flushes))
+
+
+class TestStatsdBackend(BaseTestCase):
+    def test_sends_aggregates_in_one_pipeline(self):
+        registry = MetricsRegistry([StatsdBackend(statsd_client)], flush_interval=0, max_samples=1)
+        registry.incr('celery.task.count', tags={'name': 'a'})
+        registry.incr('celery.task.count', tags={'name': 'a'})
+        registry.timing('requests.{endpoint}.{method}', 10, tags={'endpoint': 'queries', 'method': 'get'})
+        registry.timing('requests.{endpoint}.{method}', 10, tags={'endpoint': 'queries', 'method': 'get'})
+
+        with patch.object(statsd_client, '_send') as send:
+            registry.flush()
+
+        self.assertEqual(1, send.call_count)
+        self.assertEqual(set(['redash.celery.task.count:2|c', 'redash.requests.queries.get:10|ms|@0.5']),
+                         set(send.call_args[0][0].split('\n')))
+
+    def test_adds_unused_tags_when_supported(self):
+        backend = StatsdBackend(statsd_client)
+
+        self.assertEqual('db.Query.select', backend.stat_name('db.{model}.{action}',
+                                                              {'model': 'Query', 'action': 'select'}))
+        with patch('redash.settings.STATSD_USE_TAGS', True):
+            self.assertEqual('celery.task.runtime,name=a,state=success',
+                             backend.stat_name('celery.task.runtime', {'state': 'success', 'name': 'a'}))
+
+
+class TestPrometheusBackend(BaseTestCase):
+    def test_renders_aggregates_from_all_flushes(self):
+        backend = PrometheusBackend(redis_connection)
+        for _ in range(2):
+            registry = MetricsRegistry([backend], flush_interval=0, max_samples=10)
+            registry.incr('celery.task.count', tags={'name': 'a'})
+            registry.timing('requests.{endpoint}', 30, tags={'endpoint': 'queries'})
+            registry.flush()
+
+        lines = backend.render().splitlines()
+
+        self.assertIn('# TYPE redash_celery_task_count_total counter', lines)
+        self.assertIn('redash_celery_task_count_total{name="a"} 2', lines)
+        self.assertIn('# TYPE redash_requests_seconds histogram', lines)
+        self.assertIn('redash_requests_seconds_bucket{endpoint="queries",le="0.025"} 0', lines)
+        self.assertIn('redash_requests_seconds_bucket{endpoint="queries",le="0.05"} 2', lines)
+        self.assertIn('redash_requests_seconds_bucket{endpoint="queries",le="+Inf"} 2', lines)
+        self.assertIn('redash_requests_seconds_count{endpoint="queries"} 2', lines)
+        self.assertIn('redash_requests_seconds_sum{endpoint="queries"} 0.06', lines)
+
+
+class TestMetricsEndpoint(BaseTestCase):
+    def test_disabled_without_prometheus_backend(self):
+        rv = self.make_request('get', '/metrics', org=False, user=False, is_json=False)
+        self.assertEqual(404, rv.status_code)
+
+    def test_renders_metrics(self):
+        registry = MetricsRegistry([PrometheusBackend(redis_connection)], flush_interval=0, max_samples=10)
+        registry.incr('celery.task.count')
+        registry.flush()
+
+        admin = self.factory.create_user(groups=[self.factory.create_group(permissions=['super_admin']).id])
+        with patch('redash.settings.METRICS_BACKENDS', ['prometheus']):
+            rv = self.make_request('get', '/metrics', org=False, user=admin, is_json=False)
+
+        self.assertEqual(200, rv.status_code)
+        self.assertIn('redash_celery_task_count_total 1', rv.data)
+
+    def test_requires_super_admin_without_token(self):
+        with patch('redash.settings.METRICS_BACKENDS', ['prometheus']):
+            rv = self.make_request('get', '/metrics', org=False, user=False, is_json=False)
+            self.assertEqual(302, rv.status_code)
+
+            rv = self.make_request('get', '/metrics', org=False, is_json=False)
+            self.assertEqual(403, rv.status_code)
+
+    def test_requires_token_when_set(self):
+        with patch('redash.settings.METRICS_BACKENDS', ['prometheus']), \
+                patch('redash.settings.METRICS_SCRAPE_TOKEN', 'secret'):
+            rv = self.make_request('get', '/metrics', org=False, user=False, is_json=False)
+            self.assertEqual(403, rv.status_code)
+
+            rv = self.make_request('get', '/metrics', org=False, user=False, is_json=False,
+                                   headers={'Authorization': 'Bearer secret'})
+            self.assertEqual(200, rv.status_code)
+
+
+class TestTracing(BaseTestCase):
+    def setUp(self):
+        super(TestTracing, self).setUp()
+        self.spans = []
+        patches = [patch('redash.settings.TRACING_EXPORT', 'spans.json'),
+                   patch.object(tracing.exporter, 'export', side_effect=self.spans.append)]
+        for p in patches:
+            p.start()
+            self.addCleanup(p.stop)
+
+    def test_nests_spans(self):
+        trace = tracing.start_trace('root', 'redash-web')
+        with tracing.span('child'):
+            with tracing.span('grandchild'):
+                context = tracing.trace_context()
+        tracing.finish_trace(trace)
+
+        grandchild, child, root = self.spans
+        self.assertEqual(root.span_id, child.parent_id)
+        self.assertEqual(child.span_id, grandchild.parent_id)
+        self.assertEqual({'Trace ID': root.trace_id, 'Span ID': grandchild.span_id}, context)
+        self.assertIsNone(tracing.current_span())
+
+    def test_does_nothing_when_disabled(self):
+        with patch('redash.settings.TRACING_EXPORT', ''):
+            self.assertIsNone(tracing.start_trace('root', 'redash-web'))
+            with tracing.span('child') as span:
+                self.assertIsNone(span)
+
+        self.assertEqual({}, tracing.trace_context())
+        self.assertEqual([], self.spans)
+
+    def test_parses_traceparent(self):
+        self.assertEqual({'Trace ID': '0af7651916cd43dd8448eb211c80319c', 'Span ID': 'b7ad6b7169203331'},
+                         tracing.parse_traceparent('00-0af7651916cd43dd8448eb211c80319c-b7ad6b7169203331-01'))
+        self.assertIsNone(tracing.parse_traceparent('nonsense'))
+        self.assertIsNone(tracing.parse_traceparent(None))
+
+    def test_traces_requests_and_propagates_to_tasks(self):
+        with patch('redash.tasks.queries.execute_query.apply_async',
+                   return_value=MagicMock(id='task-id', status='PENDING', result=None)) as apply_async:
+            rv = self.make_request('post', '/api/query_results',
+                                   data={'query': 'SELECT 1', 'data_source_id': self.factory.data_source.id,
+                                         'max_age': 0},
+                                   headers={'traceparent': '00-0af7651916cd43dd8448eb211c80319c-b7ad6b7169203331-01'})
+
+        self.assertEqual('0af7651916cd43dd8448eb211c80319c', rv.headers['X-Trace-ID'])
+        enqueue, request = self.spans
+        self.assertEqual('enqueue_query', enqueue.name)
+        self.assertEqual('b7ad6b7169203331', request.parent_id)
+
+        metadata = apply_async.call_args[1]['args'][2]
+        self.assertEqual('0af7651916cd43dd8448eb211c80319c', metadata['Trace ID'])
+        self.assertEqual(enqueue.span_id, metadata['Span ID'])
+
+    def test_finishes_traces_of_failed_requests(self):
+        with patch('redash.handlers.queries.QueryListResource.get', side_effect=ValueError), \
+                patch.dict(app.config, {'PRESERVE_CONTEXT_ON_EXCEPTION': False}):
+            self.assertRaises(ValueError, self.make_request, 'get', '/api/queries')
+
+        request, = self.spans
+        self.assertEqual(500, request.tags['status'])
+        self.assertIsNone(tracing.current_span())
+
+    def test_writes_spans_to_file(self):
+        path = '/tmp/redash-test-spans-{}.json'.format(uuid.uuid4().hex)
+        self.addCleanup(lambda: os.path.exists(path) and os.remove(path))
+        span = tracing.Span('root', 'redash-web', 'a' * 32)
+        span.end = span.start + 0.5
+
+        with patch('redash.settings.TRACING_EXPORT', 'file://' + path):
+            tracing.exporter.write([span.to_dict()])
+
+        with open(path) as f:
+            written = json.loads(f.read())
+        self.assertEqual(500000, written['duration'])
+        self.assertEqual({'serviceName': 'redash-web'}, written['localEndpoint'])
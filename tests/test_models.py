@@ -1,12 +1,15 @@
 #encoding: utf8
 import datetime
 import json
+import time
+import zlib
 from unittest import TestCase
 import mock
+import redis
 from dateutil.parser import parse as date_parse
 from tests import BaseTestCase
-from redash import models
-from redash.utils import gen_query_hash, utcnow
+from redash import models, redis_connection
+from redash.utils import gen_query_hash, json_dumps, utcnow
 
 
 class DashboardTest(BaseTestCase):
@@ -22,6 +25,134 @@ class DashboardTest(BaseTestCase):
         self.assertNotEquals(d2.slug, d3.slug)
 
 
+class DashboardToDictTest(BaseTestCase):
+    def create_dashboard_with_widgets(self, count):
+        dashboard = self.factory.create_dashboard()
+        data_sources = [self.factory.data_source, self.factory.create_data_source()]
+        widgets = []
+        for i in range(count):
+            query = self.factory.create_query(data_source=data_sources[i % 2], user=self.factory.create_user(),
+                                              last_modified_by=self.factory.create_user())
+            visualization = self.factory.create_visualization(query=query)
+            widgets.append(self.factory.create_widget(dashboard=dashboard, visualization=visualization))
+        widgets.append(self.factory.create_widget(dashboard=dashboard, visualization=None, text='text'))
+
+        dashboard.layout = json.dumps([[w.id] for w in widgets])
+        dashboard.save()
+        return dashboard
+
+    def count_queries(self, dashboard):
+        user = models.User.get_by_id(self.factory.user.id)
+        models.data_source_groups_cache.clear()
+        models.db.database.reset_metrics()
+        result = dashboard.to_dict(with_widgets=True, user=user)
+        return models.db.database.query_count, result
+
+    def test_query_count_does_not_depend_on_widget_count(self):
+        small_count, _ = self.count_queries(self.create_dashboard_with_widgets(2))
+        large_count, result = self.count_queries(self.create_dashboard_with_widgets(20))
+
+        self.assertEqual(small_count, large_count)
+        # Widgets (with visualizations and queries), query users, data source groups and the user's permissions.
+        self.assertEqual(4, large_count)
+        self.assertEqual(21, len(result['widgets']))
+
+    def test_serializes_query_users(self):
+        dashboard = self.create_dashboard_with_widgets(1)
+        widget = dashboard.to_dict(with_widgets=True, user=self.factory.user)['widgets'][0][0]
+        query = models.Widget.get_by_id(widget['id']).visualization.query
+
+        self.assertEqual(query.user.to_dict(), widget['visualization']['query']['user'])
+        self.assertEqual(query.last_modified_by.to_dict(), widget['visualization']['query']['last_modified_by'])
+
+    def test_restricts_widgets_of_inaccessible_data_sources(self):
+        dashboard = self.factory.create_dashboard()
+        data_source = self.factory.create_data_source(group=self.factory.create_group())
+        visualization = self.factory.create_visualization(query=self.factory.create_query(data_source=data_source))
+        widget = self.factory.create_widget(dashboard=dashboard, visualization=visualization)
+        dashboard.layout = json.dumps([[widget.id]])
+        dashboard.save()
+
+        serialized = dashboard.to_dict(with_widgets=True, user=self.factory.user)['widgets'][0][0]
+        self.assertTrue(serialized['restricted'])
+        self.assertNotIn('visualization', serialized)
+
+
+class DashboardToDictCachedTest(BaseTestCase):
+    def setUp(self):
+        super(DashboardToDictCachedTest, self).setUp()
+        self.dashboard = self.factory.create_dashboard()
+        self.query = self.factory.create_query()
+        self.visualization = self.factory.create_visualization(query=self.query)
+        self.widget = self.factory.create_widget(dashboard=self.dashboard, visualization=self.visualization)
+        self.dashboard.layout = json.dumps([[self.widget.id]])
+        self.dashboard.save()
+
+    def to_dict_cached(self, user=None):
+        user = models.User.get_by_id((user or self.factory.user).id)
+        dashboard = models.Dashboard.get_by_id(self.dashboard.id)
+        models.db.database.reset_metrics()
+        result = dashboard.to_dict_cached(user)
+        return models.db.database.query_count, result
+
+    def test_serves_cached_dashboard(self):
+        _, result = self.to_dict_cached()
+
+        with mock.patch('redash.models.statsd_client') as statsd_client:
+            query_count, cached = self.to_dict_cached()
+            statsd_client.incr.assert_called_once_with('dashboards.cache.hit')
+
+        # Only the user's permissions, for the fingerprint.
+        self.assertEqual(1, query_count)
+        self.assertEqual(json.loads(json_dumps(result)), cached)
+
+    def test_invalidated_when_widget_changes(self):
+        self.to_dict_cached()
+        self.widget.options = '{"foo": "bar"}'
+        self.widget.save()
+
+        _, result = self.to_dict_cached()
+        self.assertEqual({'foo': 'bar'}, result['widgets'][0][0]['options'])
+
+    def test_invalidated_when_visualization_changes(self):
+        self.to_dict_cached()
+        self.visualization.name = 'Renamed'
+        self.visualization.save()
+
+        _, result = self.to_dict_cached()
+        self.assertEqual('Renamed', result['widgets'][0][0]['visualization']['name'])
+
+    def test_invalidated_when_query_changes(self):
+        self.to_dict_cached()
+        self.query.name = 'Renamed'
+        self.query.save()
+
+        _, result = self.to_dict_cached()
+        self.assertEqual('Renamed', result['widgets'][0][0]['visualization']['query']['name'])
+
+    def test_invalidated_when_query_gets_new_result(self):
+        self.to_dict_cached()
+        query_result, _ = models.QueryResult.store_result(self.query.org_id, self.query.data_source_id,
+                                                          self.query.query_hash, self.query.query, '{}', 1, utcnow())
+
+        _, result = self.to_dict_cached()
+        self.assertEqual(query_result.id, result['widgets'][0][0]['visualization']['query']['latest_query_data_id'])
+
+    def test_invalidated_when_data_source_groups_change(self):
+        self.to_dict_cached()
+        self.factory.data_source.remove_group(self.factory.default_group)
+
+        _, result = self.to_dict_cached()
+        self.assertTrue(result['widgets'][0][0]['restricted'])
+
+    def test_cached_per_groups(self):
+        self.to_dict_cached()
+        user = self.factory.create_user(groups=[self.factory.create_group().id])
+
+        _, result = self.to_dict_cached(user)
+        self.assertTrue(result['widgets'][0][0]['restricted'])
+
+
 class QueryTest(BaseTestCase):
     def test_changing_query_text_changes_hash(self):
         q = self.factory.create_query()
@@ -90,6 +221,50 @@ class QueryTest(BaseTestCase):
         self.assertNotIn(q2, queries)
         self.assertNotIn(q3, queries)
 
+    def test_search_ranks_name_matches_first(self):
+        q1 = self.factory.create_query(name="Other", description="Daily revenue")
+        q2 = self.factory.create_query(name="Daily revenue")
+
+        queries = list(models.Query.search("revenue", [self.factory.default_group]))
+
+        self.assertEqual([q2, q1], queries)
+
+    def test_search_matches_all_words_in_any_order(self):
+        q1 = self.factory.create_query(name="Revenue per day", description="By country")
+        q2 = self.factory.create_query(name="Revenue per month")
+
+        queries = list(models.Query.search("country rev", [self.factory.default_group]))
+
+        self.assertEqual([q1], queries)
+        self.assertNotIn(q2, queries)
+
+    def test_search_sees_updated_names(self):
+        q1 = self.factory.create_query(name="Old name")
+        q1.name = "New name"
+        q1.save()
+
+        self.assertEqual([q1], list(models.Query.search("new", [self.factory.default_group])))
+        self.assertEqual([], list(models.Query.search("old", [self.factory.default_group])))
+
+    def test_search_matches_query_text_only_when_enabled(self):
+        q1 = self.factory.create_query(name="Other", query="SELECT revenue FROM events")
+
+        self.assertNotIn(q1, models.Query.search("revenue", [self.factory.default_group]))
+
+        with mock.patch('redash.settings.QUERY_SEARCH_INCLUDE_QUERY_TEXT', True):
+            self.assertIn(q1, models.Query.search("revenue", [self.factory.default_group]))
+
+    def test_search_limits_results(self):
+        for i in range(3):
+            self.factory.create_query(name="Testing")
+
+        self.assertEqual(2, len(list(models.Query.search("Testing", [self.factory.default_group], limit=2))))
+
+    def test_search_skips_archived_queries(self):
+        q1 = self.factory.create_query(name="Testing", is_archived=True)
+
+        self.assertNotIn(q1, models.Query.search("Testing", [self.factory.default_group]))
+
     def test_returns_each_query_only_once(self):
         other_group = self.factory.create_group()
         second_group = self.factory.create_group()
@@ -124,7 +299,7 @@ class QueryRecentTest(BaseTestCase):
         models.Event.create(org=self.factory.org, user=self.factory.user, action="edit",
                             object_type="query", object_id=q1.id)
 
-        recent = models.Query.recent([self.factory.default_group])
+        recent = models.Query.recent(self.factory.org, [self.factory.default_group])
 
         self.assertIn(q1, recent)
         self.assertNotIn(q2, recent)
@@ -140,7 +315,7 @@ class QueryRecentTest(BaseTestCase):
                             action="edit", object_type="query",
                             object_id=q2.id)
 
-        recent = models.Query.recent([self.factory.default_group])
+        recent = models.Query.recent(self.factory.org, [self.factory.default_group])
 
         self.assertIn(q1, recent)
         self.assertNotIn(q2, recent)
@@ -152,12 +327,12 @@ class QueryRecentTest(BaseTestCase):
         models.Event.create(org=self.factory.org, user=self.factory.user, action="edit",
                             object_type="query", object_id=q1.id)
 
-        recent = models.Query.recent([self.factory.default_group], user_id=self.factory.user.id)
+        recent = models.Query.recent(self.factory.org, [self.factory.default_group], user_id=self.factory.user.id)
 
         self.assertIn(q1, recent)
         self.assertNotIn(q2, recent)
 
-        recent = models.Query.recent([self.factory.default_group], user_id=self.factory.user.id + 1)
+        recent = models.Query.recent(self.factory.org, [self.factory.default_group], user_id=self.factory.user.id + 1)
         self.assertNotIn(q1, recent)
         self.assertNotIn(q2, recent)
 
@@ -171,11 +346,72 @@ class QueryRecentTest(BaseTestCase):
         models.Event.create(org=self.factory.org, user=self.factory.user, action="edit",
                             object_type="query", object_id=q2.id)
 
-        recent = models.Query.recent([self.factory.default_group])
+        recent = models.Query.recent(self.factory.org, [self.factory.default_group])
 
         self.assertIn(q1, recent)
         self.assertNotIn(q2, recent)
 
+    def test_orders_by_activity(self):
+        q1 = self.factory.create_query()
+        q2 = self.factory.create_query()
+
+        models.Event.create(org=self.factory.org, user=self.factory.user, action="edit",
+                            object_type="query", object_id=q1.id)
+        for i in range(2):
+            models.Event.create(org=self.factory.org, user=self.factory.user, action="execute",
+                                object_type="query", object_id=q2.id)
+
+        self.assertEqual([q2, q1], models.Query.recent(self.factory.org, [self.factory.default_group]))
+
+    def test_ignores_old_and_unrelated_events(self):
+        q1 = self.factory.create_query()
+        q2 = self.factory.create_query()
+
+        models.Event.create(org=self.factory.org, user=self.factory.user, action="edit", object_type="query",
+                            object_id=q1.id, created_at=datetime.datetime.now() - datetime.timedelta(days=10))
+        models.Event.create(org=self.factory.org, user=self.factory.user, action="fork",
+                            object_type="query", object_id=q2.id)
+
+        self.assertEqual([], models.Query.recent(self.factory.org, [self.factory.default_group]))
+
+    def test_fills_limit_when_candidates_are_filtered_out(self):
+        ds = self.factory.create_data_source(group=self.factory.create_group())
+        q1 = self.factory.create_query()
+        models.Event.create(org=self.factory.org, user=self.factory.user, action="edit",
+                            object_type="query", object_id=q1.id)
+        for i in range(6):
+            q = self.factory.create_query(data_source=ds)
+            for j in range(2):
+                models.Event.create(org=self.factory.org, user=self.factory.user, action="edit",
+                                    object_type="query", object_id=q.id)
+
+        self.assertEqual([q1], models.Query.recent(self.factory.org, [self.factory.default_group], limit=1))
+
+
+class EventRecentActivityTest(BaseTestCase):
+    def test_recent_object_ids_per_org_and_user(self):
+        other_org = self.factory.create_org()
+        other_user = self.factory.create_user()
+
+        models.Event.create(org=self.factory.org, user=self.factory.user, action="view",
+                            object_type="dashboard", object_id=1)
+        models.Event.create(org=self.factory.org, user=other_user, action="view",
+                            object_type="dashboard", object_id=2)
+        models.Event.create(org=self.factory.org, user=other_user, action="view",
+                            object_type="dashboard", object_id=2)
+        models.Event.create(org=other_org, user=None, action="view", object_type="dashboard", object_id=3)
+
+        self.assertEqual([2, 1], models.Event.recent_object_ids(self.factory.org.id, 'dashboard'))
+        self.assertEqual([1], models.Event.recent_object_ids(self.factory.org.id, 'dashboard', self.factory.user.id))
+        self.assertEqual([3], models.Event.recent_object_ids(other_org.id, 'dashboard'))
+        self.assertEqual([], models.Event.recent_object_ids(self.factory.org.id, 'query'))
+
+    def test_record_counts_activity(self):
+        models.Event.record({'org_id': self.factory.org.id, 'user_id': self.factory.user.id, 'action': 'view',
+                             'object_type': 'dashboard', 'object_id': '5', 'timestamp': int(time.time())})
+
+        self.assertEqual([5], models.Event.recent_object_ids(self.factory.org.id, 'dashboard'))
+
 
 class ShouldScheduleNextTest(TestCase):
     def test_interval_schedule_that_needs_reschedule(self):
@@ -303,6 +539,13 @@ class QueryArchiveTest(BaseTestCase):
 
 
 class DataSourceTest(BaseTestCase):
+    def setUp(self):
+        super(DataSourceTest, self).setUp()
+        # Load the full schema rather than querying the (nonexistent) database for table versions.
+        patcher = mock.patch('redash.query_runner.pg.PostgreSQL.get_table_versions', return_value=None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
     def test_get_schema(self):
         return_value = [{'name': 'table', 'columns': []}]
 
@@ -420,6 +663,143 @@ class TestUnusedQueryResults(BaseTestCase):
         self.assertNotIn(new_unused_qr, models.QueryResult.unused())
 
 
+
+class TestParameterizedResultsCache(BaseTestCase):
+    def setUp(self):
+        super(TestParameterizedResultsCache, self).setUp()
+        self.query = self.factory.create_query_with_params()
+
+    def cache(self, values, **kwargs):
+        parameters_hash = models.Query.parameters_hash(self.query.data_source.id, self.query.query, {'param1': values})
+        query_result = self.factory.create_query_result(**kwargs)
+        self.query.cache_parameterized_result(parameters_hash, query_result)
+        return parameters_hash, query_result
+
+    def test_parameters_hash_ignores_order_types_and_unused_parameters(self):
+        text = 'SELECT {{a}}, {{b}}'
+        self.assertEqual(models.Query.parameters_hash(1, text, {'a': 1, 'b': 'x'}),
+                         models.Query.parameters_hash(1, text, {'b': 'x', 'a': '1', 'c': 'unused'}))
+        self.assertNotEqual(models.Query.parameters_hash(1, text, {'a': 1, 'b': 'x'}),
+                            models.Query.parameters_hash(1, text, {'a': 2, 'b': 'x'}))
+        self.assertNotEqual(models.Query.parameters_hash(1, text, {'a': 1, 'b': 'x'}),
+                            models.Query.parameters_hash(1, 'SELECT {{b}}, {{a}}', {'a': 1, 'b': 'x'}))
+        self.assertNotEqual(models.Query.parameters_hash(1, text, {'a': 1, 'b': 'x'}),
+                            models.Query.parameters_hash(2, text, {'a': 1, 'b': 'x'}))
+
+    def test_returns_cached_result(self):
+        parameters_hash, query_result = self.cache(1)
+
+        self.assertEqual(query_result, self.query.get_parameterized_result(parameters_hash))
+        self.assertIsNone(self.query.get_parameterized_result(models.Query.parameters_hash(self.query.data_source.id,
+                                                                                           self.query.query,
+                                                                                           {'param1': 2})))
+
+    def test_ignores_results_of_other_data_sources(self):
+        data_source = self.factory.create_data_source()
+        parameters_hash, query_result = self.cache(1, data_source=data_source)
+
+        self.assertIsNone(self.query.get_parameterized_result(parameters_hash))
+        self.assertIsNone(redis_connection.hget('query:{}:parameterized_results'.format(self.query.id), parameters_hash))
+
+        parameters_hash, query_result = self.cache(1)
+        models.QueryResult.update(data_source=data_source).where(models.QueryResult.id == query_result.id).execute()
+        self.assertIsNone(self.query.get_parameterized_result(parameters_hash))
+
+    def test_expires_results_after_the_query_schedule(self):
+        self.query.schedule = '60'
+        parameters_hash, query_result = self.cache(1)
+        self.assertEqual(query_result, self.query.get_parameterized_result(parameters_hash))
+
+        entries_key = 'query:{}:parameterized_results'.format(self.query.id)
+        entry = json.loads(redis_connection.hget(entries_key, parameters_hash))
+        entry['retrieved_at'] -= 120
+        redis_connection.hset(entries_key, parameters_hash, json.dumps(entry))
+
+        self.assertIsNone(self.query.get_parameterized_result(parameters_hash))
+        self.query.schedule = None
+        self.assertEqual(query_result, self.query.get_parameterized_result(parameters_hash))
+        self.assertIsNone(self.query.get_parameterized_result(parameters_hash, max_age=60))
+
+    def test_evicts_least_recently_used_results(self):
+        with mock.patch('redash.settings.PARAMETERIZED_RESULTS_CACHE_SIZE', 2):
+            first_hash, first = self.cache(1)
+            second_hash, second = self.cache(2)
+            self.query.get_parameterized_result(first_hash)
+            third_hash, third = self.cache(3)
+
+        self.assertEqual(first, self.query.get_parameterized_result(first_hash))
+        self.assertIsNone(self.query.get_parameterized_result(second_hash))
+        self.assertEqual(third, self.query.get_parameterized_result(third_hash))
+        # Deleted a little later, as clients might still be loading it.
+        self.assertIsNotNone(models.QueryResult.select().where(models.QueryResult.id == second.id).first())
+
+    def test_evicts_results_over_budget(self):
+        first_hash, first = self.cache(1)
+        with mock.patch('redash.settings.PARAMETERIZED_RESULTS_CACHE_BUDGET', 0):
+            second_hash, second = self.cache(2)
+
+        self.assertIsNone(self.query.get_parameterized_result(first_hash))
+        self.assertEqual(second, self.query.get_parameterized_result(second_hash))
+
+    def test_replaces_result(self):
+        parameters_hash, first = self.cache(1)
+        parameters_hash, second = self.cache(1)
+
+        self.assertEqual(second, self.query.get_parameterized_result(parameters_hash))
+        self.assertIsNotNone(models.QueryResult.select().where(models.QueryResult.id == first.id).first())
+
+    def test_redoes_eviction_after_concurrent_changes(self):
+        zrange = redis.client.StrictPipeline.zrange
+        concurrent = []
+
+        def zrange_with_concurrent_cache(pipe, *args, **kwargs):
+            if not concurrent:
+                concurrent.append(None)
+                concurrent[0] = self.cache(2)
+            return zrange(pipe, *args, **kwargs)
+
+        with mock.patch('redash.settings.PARAMETERIZED_RESULTS_CACHE_SIZE', 1):
+            first_hash, first = self.cache(1)
+            with mock.patch.object(redis.client.StrictPipeline, 'zrange', zrange_with_concurrent_cache):
+                third_hash, third = self.cache(3)
+
+        second_hash, second = concurrent[0]
+        self.assertIsNone(self.query.get_parameterized_result(first_hash))
+        self.assertIsNone(self.query.get_parameterized_result(second_hash))
+        self.assertEqual(third, self.query.get_parameterized_result(third_hash))
+
+    def test_deletes_released_results_after_delay(self):
+        with mock.patch('redash.settings.PARAMETERIZED_RESULTS_CACHE_SIZE', 1):
+            first_hash, first = self.cache(1)
+            second_hash, second = self.cache(2)
+            third_hash, third = self.cache(3)
+        self.factory.create_query(latest_query_data=second)
+
+        self.assertEqual(0, models.QueryResult.delete_released_parameterized(100))
+
+        with mock.patch('redash.settings.PARAMETERIZED_RESULTS_CLEANUP_DELAY', -1):
+            self.assertEqual(1, models.QueryResult.delete_released_parameterized(100))
+
+        remaining = [r.id for r in models.QueryResult.select().where(models.QueryResult.id << [first.id, second.id,
+                                                                                                third.id])]
+        self.assertItemsEqual([second.id, third.id], remaining)
+        self.assertEqual(third, self.query.get_parameterized_result(third_hash))
+
+    def test_deletes_expired_results(self):
+        with mock.patch('redash.settings.PARAMETERIZED_RESULTS_CACHE_TTL', 0):
+            parameters_hash, query_result = self.cache(1)
+
+        with mock.patch('redash.settings.PARAMETERIZED_RESULTS_CLEANUP_DELAY', -1):
+            self.assertEqual(1, models.QueryResult.delete_released_parameterized(100))
+
+    def test_results_are_kept_per_query(self):
+        other_query = self.factory.create_query_with_params()
+        with mock.patch('redash.settings.PARAMETERIZED_RESULTS_CACHE_SIZE', 1):
+            parameters_hash, query_result = self.cache(1)
+            other_query.cache_parameterized_result(parameters_hash, self.factory.create_query_result())
+
+        self.assertEqual(query_result, self.query.get_parameterized_result(parameters_hash))
+
 class TestQueryAll(BaseTestCase):
     def test_returns_only_queries_in_given_groups(self):
         ds1 = self.factory.create_data_source()
@@ -455,6 +835,43 @@ class TestUser(BaseTestCase):
         self.assertItemsEqual([user.org.default_group.id, new_group.id], user.groups)
 
 
+class TestOrganizationGetBySlugCached(BaseTestCase):
+    def test_serves_cached_organization(self):
+        org = self.factory.org
+        # Entries are dropped once the cache subscribes to invalidations.
+        models.organizations_cache.get(org.slug)
+        self.assertTrue(models.organizations_cache._subscribed.wait(5))
+        models.Organization.get_by_slug_cached(org.slug)
+        models.Organization.update(name='Renamed').where(models.Organization.id == org.id).execute()
+
+        cached = models.Organization.get_by_slug_cached(org.slug)
+        self.assertEqual(org.id, cached.id)
+        self.assertEqual(org.name, cached.name)
+        self.assertEqual([], cached.dirty_fields)
+
+    def test_save_clears_cache(self):
+        org = self.factory.org
+        models.Organization.get_by_slug_cached(org.slug)
+
+        org.name = 'Renamed'
+        org.save()
+        self.assertEqual('Renamed', models.Organization.get_by_slug_cached(org.slug).name)
+
+    def test_save_publishes_invalidation(self):
+        org = self.factory.org
+        with mock.patch.object(models.organizations_cache, 'redis_connection') as redis:
+            org.save()
+
+        redis.publish.assert_called_once_with('organizations:invalidate', json.dumps({'all': True}))
+
+    def test_cache_expires(self):
+        org = self.factory.org
+        with mock.patch.object(models.organizations_cache, 'ttl', -1):
+            models.Organization.get_by_slug_cached(org.slug)
+            models.Organization.update(name='Renamed').where(models.Organization.id == org.id).execute()
+            self.assertEqual('Renamed', models.Organization.get_by_slug_cached(org.slug).name)
+
+
 class TestGroup(BaseTestCase):
     def test_returns_groups_with_specified_names(self):
         org1 = self.factory.create_org()
@@ -498,6 +915,15 @@ class TestQueryResultStoreResult(BaseTestCase):
         self.assertEqual(query_result.query_hash, self.query_hash)
         self.assertEqual(query_result.data_source, self.data_source)
 
+    def test_stores_the_compressed_response(self):
+        query_result, _ = models.QueryResult.store_result(self.data_source.org_id, self.data_source.id, self.query_hash,
+                                                          self.query, '{"rows": [], "columns": []}', self.runtime,
+                                                          self.utcnow)
+
+        body = zlib.decompress(models.CompressedQueryResult.get_body(query_result.id), 16 + zlib.MAX_WBITS)
+        stored = models.QueryResult.get_by_id(query_result.id)
+        self.assertEqual(json.loads(json_dumps({'query_result': stored.to_dict()})), json.loads(body))
+
     def test_updates_existing_queries(self):
         query1 = self.factory.create_query(query=self.query)
         query2 = self.factory.create_query(query=self.query)
@@ -573,6 +999,107 @@ class TestEvents(BaseTestCase):
         self.assertDictEqual(json.loads(event.additional_properties), additional_properties)
 
 
+class TestEventsRetentionAndRollups(BaseTestCase):
+    def create_event(self, days_ago=0, **kwargs):
+        args = dict(org=self.factory.org, user=self.factory.user, action='view', object_type='dashboard',
+                    object_id='1', created_at=datetime.datetime.now() - datetime.timedelta(days=days_ago))
+        args.update(kwargs)
+        return models.Event.create(**args)
+
+    def test_events_table_is_partitioned_by_month(self):
+        self.assertTrue(models.Event.is_partitioned())
+
+        today = datetime.date.today()
+        months = sorted(models.Event.partitions().values())
+        self.assertEqual(today.replace(day=1), months[0])
+        self.assertEqual(2, len(months))
+
+    def test_create_partitions_since(self):
+        models.Event.create_partitions(since=datetime.date.today() - datetime.timedelta(days=70))
+        self.assertEqual(4, len(models.Event.partitions()))
+
+        # Existing partitions are kept as they are.
+        models.Event.create_partitions(since=datetime.date.today() - datetime.timedelta(days=70))
+        self.assertEqual(4, len(models.Event.partitions()))
+
+    def test_create_partitions_moves_events_out_of_the_default_partition(self):
+        future = datetime.datetime.now() + datetime.timedelta(days=75)
+        event = self.create_event(created_at=future)
+        in_default = 'SELECT count(*) FROM events_default'
+        self.assertEqual(1, models.db.database.execute_sql(in_default).fetchone()[0])
+
+        with mock.patch('datetime.date', wraps=datetime.date) as date:
+            date.today.return_value = future.date()
+            models.Event.create_partitions(since=datetime.date.today())
+
+        self.assertEqual(0, models.db.database.execute_sql(in_default).fetchone()[0])
+        self.assertIn(future.date().replace(day=1), models.Event.partitions().values())
+        self.assertEqual([event.id], [e.id for e in models.Event.select()])
+        self.create_event(created_at=future)
+
+    def test_delete_older_than_drops_partitions_and_deletes_events(self):
+        models.Event.create_partitions(since=datetime.date.today() - datetime.timedelta(days=100))
+        old = [self.create_event(days_ago=days) for days in (95, 1000)]
+        recent = self.create_event(days_ago=1)
+
+        deleted = models.Event.delete_older_than(datetime.date.today() - datetime.timedelta(days=30))
+
+        self.assertEqual(2, deleted)
+        self.assertEqual([recent.id], [e.id for e in models.Event.select()])
+        self.assertNotIn(old[0].created_at.date().replace(day=1), models.Event.partitions().values())
+
+    def test_counts_events_per_day(self):
+        self.create_event()
+        self.create_event()
+        self.create_event(days_ago=1)
+        self.create_event(user=None, action='edit')
+        models.Event.record_many([{'org_id': self.factory.org.id, 'user_id': self.factory.user.id, 'action': 'view',
+                                   'object_type': 'dashboard', 'object_id': '1', 'timestamp': time.time()}])
+
+        counts = {(c.day, c.user_id, c.action): c.count for c in models.EventDailyCount.select()}
+
+        today = datetime.date.today()
+        self.assertEqual({(today, self.factory.user.id, 'view'): 3,
+                          (today - datetime.timedelta(days=1), self.factory.user.id, 'view'): 1,
+                          (today, 0, 'edit'): 1}, counts)
+
+    def test_counts_events_without_upsert(self):
+        with mock.patch.object(models.EventDailyCount, 'UPSERT_MIN_SERVER_VERSION', 10 ** 9):
+            self.create_event()
+            self.create_event()
+            self.create_event(action='edit')
+
+        counts = {c.action: c.count for c in models.EventDailyCount.select()}
+        self.assertEqual({'view': 2, 'edit': 1}, counts)
+
+    def test_totals(self):
+        self.create_event()
+        self.create_event(object_id='2')
+        self.create_event(action='edit')
+        self.create_event(days_ago=10)
+
+        since = datetime.date.today() - datetime.timedelta(days=7)
+        totals = list(models.EventDailyCount.totals(self.factory.org, since))
+        self.assertEqual([{'object_type': 'dashboard', 'action': 'view', 'count': 2},
+                          {'object_type': 'dashboard', 'action': 'edit', 'count': 1}], totals)
+
+        totals = list(models.EventDailyCount.totals(self.factory.org, since, ['object_id'], action='view'))
+        self.assertItemsEqual([{'object_id': '1', 'count': 1}, {'object_id': '2', 'count': 1}], totals)
+
+    def test_rebuild_activity(self):
+        self.create_event(object_id='1')
+        self.create_event(object_id='2')
+        self.create_event(object_id='2', days_ago=2)
+        redis_connection.flushdb()
+
+        models.Event.rebuild_activity()
+        models.Event.rebuild_activity()
+
+        self.assertEqual([2, 1], models.Event.recent_object_ids(self.factory.org.id, 'dashboard'))
+        self.assertEqual([2, 1], models.Event.recent_object_ids(self.factory.org.id, 'dashboard',
+                                                                 self.factory.user.id))
+
+
 class TestWidgetDeleteInstance(BaseTestCase):
     def test_delete_removes_from_layout(self):
         widget = self.factory.create_widget()
@@ -0,0 +1,75 @@
+import json
+import time
+
+from redash import monitor, redis_connection
+from tests import BaseTestCase
+
+
+class TestStatus(BaseTestCase):
+    def test_serves_snapshot(self):
+        self.factory.create_query()
+        monitor.refresh_status_snapshot()
+        self.factory.create_query()
+
+        status = monitor.get_status()
+        self.assertEqual(1, status['queries_count'])
+        self.assertIn('updated_at', status)
+
+        monitor.refresh_status_snapshot()
+        self.assertEqual(2, monitor.get_status()['queries_count'])
+
+    def test_refreshes_missing_snapshot(self):
+        self.factory.create_query()
+
+        status = monitor.get_status()
+        self.assertEqual(1, status['queries_count'])
+        self.assertIsNotNone(redis_connection.get(monitor.STATUS_SNAPSHOT_KEY))
+
+    def test_reports_queue_sizes(self):
+        data_source = self.factory.create_data_source(queue_name='test_queries')
+        redis_connection.rpush('test_queries', 'task', 'task')
+
+        monitor.refresh_status_snapshot()
+        queues = monitor.get_status()['manager']['queues']
+        self.assertEqual({'data_sources': data_source.name, 'size': 2}, queues['test_queries'])
+
+    def test_reports_outdated_queries_count_of_refresh_queries(self):
+        redis_connection.hmset('redash:status', {'outdated_queries_count': 3, 'last_refresh_at': time.time()})
+
+        self.assertEqual(3, monitor.get_status()['manager']['outdated_queries_count'])
+
+
+class TestWorkersStatus(BaseTestCase):
+    def test_reports_heartbeats(self):
+        monitor.record_worker_heartbeat({'hostname': 'worker1', 'pid': 1})
+
+        workers = monitor.get_status()['workers']
+        self.assertEqual(1, len(workers))
+        self.assertEqual('worker1', workers[0]['hostname'])
+        self.assertTrue(workers[0]['alive'])
+
+    def test_marks_workers_missing_heartbeats(self):
+        redis_connection.hset(monitor.WORKERS_KEY, 'worker1',
+                              json.dumps({'hostname': 'worker1', 'heartbeat_at': time.time() - 3600}))
+
+        workers = monitor.get_workers_status()
+        self.assertFalse(workers[0]['alive'])
+
+    def test_forgets_expired_workers(self):
+        redis_connection.hset(monitor.WORKERS_KEY, 'worker1',
+                              json.dumps({'hostname': 'worker1', 'heartbeat_at': time.time() - monitor.WORKER_EXPIRY - 1}))
+
+        self.assertEqual([], monitor.get_workers_status())
+        monitor.refresh_status_snapshot()
+        self.assertFalse(redis_connection.hexists(monitor.WORKERS_KEY, 'worker1'))
+
+    def test_heartbeat_thread(self):
+        heartbeat = monitor.WorkerHeartbeat()
+        heartbeat.start({'hostname': 'worker1', 'pid': 1})
+        deadline = time.time() + 5
+        while not redis_connection.hexists(monitor.WORKERS_KEY, 'worker1') and time.time() < deadline:
+            time.sleep(0.01)
+
+        self.assertTrue(redis_connection.hexists(monitor.WORKERS_KEY, 'worker1'))
+        heartbeat.stop()
+        self.assertFalse(redis_connection.hexists(monitor.WORKERS_KEY, 'worker1'))
@@ -1,5 +1,14 @@
-from redash.utils import build_url, collect_query_parameters, collect_parameters_from_request
+import datetime
+import decimal
+import json
+import time
+
+from redash import redis_connection
+from redash.utils import build_url, collect_query_parameters, collect_parameters_from_request, JSONEncoder
+from redash.utils.cache import InvalidatedCache
+from redash.utils.serialization import convert_rows, encoders, encoders_without_default, serialize_query_result
 from collections import namedtuple
+from mock import patch
 from unittest import TestCase
 
 DummyRequest = namedtuple('DummyRequest', ['host', 'scheme'])
@@ -49,3 +58,129 @@ class TestCollectParametersFromRequest(TestCase):
 
     def test_takes_prefixed_values(self):
         self.assertDictEqual({'test': 1, 'something_else': 'test'}, collect_parameters_from_request({'p_test': 1, 'p_something_else': 'test'}))
+
+
+class TestInvalidatedCache(TestCase):
+    def listening_cache(self, channel):
+        cache = InvalidatedCache(redis_connection, channel, ttl=60)
+        cache.get(0)
+        self.assertTrue(cache._subscribed.wait(5))
+        return cache
+
+    def test_expires_entries(self):
+        cache = InvalidatedCache(redis_connection, 'test_cache:expires', ttl=-1)
+        cache.set(1, 'value')
+        self.assertIsNone(cache.get(1))
+
+    def test_invalidates_other_instances(self):
+        cache = self.listening_cache('test_cache:invalidate')
+        other_process_cache = InvalidatedCache(redis_connection, 'test_cache:invalidate', ttl=60)
+        cache.set(1, 'value')
+        cache.set(2, 'other value')
+
+        deadline = time.time() + 5
+        other_process_cache.invalidate(1)
+
+        while cache.get(1) is not None and time.time() < deadline:
+            time.sleep(0.01)
+
+        self.assertIsNone(cache.get(1))
+        self.assertEqual('other value', cache.get(2))
+
+    def test_invalidates_all_entries_of_other_instances(self):
+        cache = self.listening_cache('test_cache:invalidate_all')
+        other_process_cache = InvalidatedCache(redis_connection, 'test_cache:invalidate_all', ttl=60)
+        cache.set(1, 'value')
+        cache.set(2, 'other value')
+
+        deadline = time.time() + 5
+        other_process_cache.invalidate_all()
+
+        while cache.get(1) is not None and time.time() < deadline:
+            time.sleep(0.01)
+
+        self.assertIsNone(cache.get(1))
+        self.assertIsNone(cache.get(2))
+
+    def test_clears_entries_once_subscribed(self):
+        cache = InvalidatedCache(redis_connection, 'test_cache:subscribe', ttl=60)
+        with patch.object(cache, '_subscribed') as subscribed:
+            subscribed.set.side_effect = lambda: cache.set(2, 'loaded after subscribing')
+            cache.set(1, 'loaded before subscribing')
+            deadline = time.time() + 5
+            while not subscribed.set.called and time.time() < deadline:
+                time.sleep(0.01)
+
+        self.assertIsNone(cache.get(1))
+        self.assertEqual('loaded after subscribing', cache.get(2))
+
+    def test_skips_values_loaded_before_invalidation(self):
+        cache = self.listening_cache('test_cache:generation')
+        generation = cache.generation(1)
+        other_generation = cache.generation(2)
+        cache.invalidate(1)
+
+        cache.set(1, 'stale value', generation)
+        cache.set(2, 'value', other_generation)
+        self.assertIsNone(cache.get(1))
+        self.assertEqual('value', cache.get(2))
+
+        cache.set(1, 'value', cache.generation(1))
+        self.assertEqual('value', cache.get(1))
+
+    def test_skips_values_loaded_before_clear(self):
+        cache = self.listening_cache('test_cache:generation')
+        generation = cache.generation(1)
+        cache.clear()
+
+        cache.set(1, 'stale value', generation)
+        self.assertIsNone(cache.get(1))
+
+
+class TestSerializeQueryResult(TestCase):
+    def result(self):
+        rows = [
+            {'id': 1, 'amount': decimal.Decimal('1.5'), 'created_at': datetime.datetime(2016, 1, 2, 3, 4, 5),
+             'day': datetime.date(2016, 1, 2), 'mixed': None},
+            {'id': 2, 'amount': None, 'created_at': datetime.datetime(2016, 1, 3),
+             'day': datetime.date(2016, 1, 3), 'mixed': decimal.Decimal(2)},
+            {'id': 3, 'amount': decimal.Decimal(3), 'created_at': None, 'mixed': datetime.date(2016, 1, 4)},
+        ]
+        return {'columns': [{'name': name} for name in ('id', 'amount', 'created_at', 'day', 'mixed')], 'rows': rows}
+
+    def test_converts_columns(self):
+        data = self.result()
+        convert_rows(data['columns'], data['rows'])
+
+        self.assertEqual([1.5, None, 3.0], [row['amount'] for row in data['rows']])
+        self.assertEqual(['2016-01-02T03:04:05', '2016-01-03T00:00:00', None],
+                         [row['created_at'] for row in data['rows']])
+        self.assertNotIn('day', data['rows'][2])
+
+    def test_leaves_other_types_to_the_encoder(self):
+        data = self.result()
+        convert_rows(data['columns'], data['rows'])
+
+        self.assertEqual(2.0, data['rows'][1]['mixed'])
+        self.assertEqual(datetime.date(2016, 1, 4), data['rows'][2]['mixed'])
+
+    def test_matches_json_encoder(self):
+        expected = json.loads(json.dumps(self.result(), cls=JSONEncoder))
+        self.assertEqual(expected, json.loads(serialize_query_result(self.result())))
+
+    def test_falls_back_to_json_for_unavailable_encoder(self):
+        expected = json.loads(json.dumps(self.result(), cls=JSONEncoder))
+        self.assertEqual(expected, json.loads(serialize_query_result(self.result(), 'unavailable')))
+
+    def test_converts_every_value_for_encoders_without_default(self):
+        expected = json.loads(json.dumps(self.result(), cls=JSONEncoder))
+        with patch.dict(encoders, {'nodefault': json.dumps}), \
+                patch('redash.utils.serialization.encoders_without_default', encoders_without_default | {'nodefault'}):
+            self.assertEqual(expected, json.loads(serialize_query_result(self.result(), 'nodefault')))
+
+            data = {'columns': [{'name': 'value'}], 'rows': [{'value': object()}]}
+            self.assertRaises(TypeError, serialize_query_result, data, 'nodefault')
+
+    def test_raises_for_unknown_types(self):
+        data = {'columns': [{'name': 'value'}], 'rows': [{'value': object()}]}
+        self.assertRaises(TypeError, serialize_query_result, data)